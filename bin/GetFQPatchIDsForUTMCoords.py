@@ -50,9 +50,10 @@ import errno
 from osgeo import osr
 
 import rhessystypes
-from grassdatalookup import getSpatialReferenceForGRASSDataset
-from grassdatalookup import getFQPatchIDForCoordinates
+from grassdatalookup import GrassDataLookup
 from grassdatalookup import GRASSConfig
+from coordtransform import getCoordinateTransformation
+from coordtransform import transformPoints
 
 SEP = ','
 
@@ -107,29 +108,32 @@ if not os.access(args.grassdbase, os.R_OK):
 grassdbase = os.path.abspath(args.grassdbase)
 
 grassConfig = GRASSConfig(gisbase=gisbase, dbase=grassdbase, location=args.location, mapset=args.mapset)
+grassdatalookup = GrassDataLookup(grass_config=grassConfig)
 
-t_srs = getSpatialReferenceForGRASSDataset(grassConfig)
-s_srs = osr.SpatialReference()
-s_srs.ImportFromEPSG(4326)
-crx = osr.CoordinateTransformation(s_srs, t_srs)
+t_srs = grassdatalookup.getSpatialReferenceForGRASSDataset().ExportToProj4()
+crx = getCoordinateTransformation(4326, t_srs)
 
-sys.stdout.write("lat%slon%seasting%snorthing%spatchID%szoneID%shillID\n" % (SEP, SEP, SEP, SEP, SEP, SEP) )
 f = open(args.coordinates, 'r')
 f.next() # skip first line
+latlons = []
 for line in f:
     line = line.strip()
     values = line.split(',')
-    lat = float(values[0])
-    lon = float(values[1])
-    # Transform coordinates from WGS84 to the coordinate system of the
-    # GRASS mapset
-    (x, y, z) = crx.TransformPoint( lon, lat )
-
-    # Lookup patchID for transformed coordinates
-    coord = rhessystypes.getCoordinatePair(x, y)
-    id = getFQPatchIDForCoordinates(coord, grassConfig,
-                                    args.patchmap, args.zonemap, args.hillmap)
-    
-    sys.stdout.write("%f%s%f%s%f%s%f%s%d%s%d%s%d\n" % (lat, SEP, lon, SEP, coord.easting, SEP, coord.northing, SEP, id.patchID, SEP, id.zoneID, SEP, id.hillID) )
+    latlons.append( (float(values[0]), float(values[1])) )
+f.close()
 
+# Transform coordinates from WGS84 to the coordinate system of the
+# GRASS mapset, all in one call
+points = transformPoints(crx, [ (lon, lat) for (lat, lon) in latlons ])
 
+sys.stdout.write("lat%slon%seasting%snorthing%spatchID%szoneID%shillID\n" % (SEP, SEP, SEP, SEP, SEP, SEP) )
+# Lookup patchIDs for all transformed coordinates, reading each raster row once
+coords = [ rhessystypes.getCoordinatePair(x, y) for (x, y) in points ]
+ids = grassdatalookup.getFQPatchIDsForCoordinates(coords,
+                                    args.patchmap, args.zonemap, args.hillmap)
+for ((lat, lon), coord, id) in zip(latlons, coords, ids):
+    # Coordinates outside the region, or on null cells, have no patch
+    if id is None:
+        sys.stdout.write("%f%s%f%s%f%s%f%s%s%s%s\n" % (lat, SEP, lon, SEP, coord.easting, SEP, coord.northing, SEP, SEP, SEP) )
+        continue
+    sys.stdout.write("%f%s%f%s%f%s%f%s%d%s%d%s%d\n" % (lat, SEP, lon, SEP, coord.easting, SEP, coord.northing, SEP, id.patchID, SEP, id.zoneID, SEP, id.hillID) )
@@ -0,0 +1,135 @@
+"""@package coordtransform
+
+@brief Cached spatial references and coordinate transformations, with batch
+        transformation of coordinate lists in a single OGR call.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import threading
+from collections import OrderedDict
+
+from osgeo import osr
+
+import rhessystypes
+import metrics
+
+## Constants
+MAX_SPATIAL_REFERENCES = 32
+MAX_TRANSFORMATIONS = 64
+
+# OGR spatial reference and transformation objects are not safe to share
+# between threads, so each thread keeps its own caches.  SRS identifiers come
+# from requests, so the caches are bounded, least recently used first out.
+_local = threading.local()
+
+def _getCache(name):
+    try:
+        return getattr(_local, name)
+    except AttributeError:
+        cache = OrderedDict()
+        setattr(_local, name, cache)
+        return cache
+
+def _cacheGet(cache, key):
+    value = cache.pop(key)
+    cache[key] = value
+    return value
+
+def _cachePut(cache, key, value, maxEntries):
+    cache[key] = value
+    while len(cache) > maxEntries:
+        cache.popitem(last=False)
+
+def getSpatialReference(srs):
+    """ @brief Get a (cached) spatial reference for an SRS identifier
+
+        @param srs Integer EPSG code, a string of the form 'EPSG:<code>', or a
+        Proj4 string
+
+        @return osgeo.osr.SpatialReference; callers must not modify it
+    """
+    cache = _getCache('srs')
+    try:
+        return _cacheGet(cache, srs)
+    except KeyError:
+        pass
+
+    r_srs = osr.SpatialReference()
+    if isinstance(srs, basestring):
+        if srs.lower().startswith('epsg'):
+            r_srs.ImportFromEPSG(int(srs[5:]))
+        else:
+            r_srs.ImportFromProj4(srs)
+    else:
+        r_srs.ImportFromEPSG(srs)
+
+    _cachePut(cache, srs, r_srs, MAX_SPATIAL_REFERENCES)
+    return r_srs
+
+def getCoordinateTransformation(s_srs, t_srs):
+    """ @brief Get a (cached) coordinate transformation between two spatial references
+
+        @param s_srs SRS identifier (see getSpatialReference) to transform from
+        @param t_srs SRS identifier to transform to
+
+        @return osgeo.osr.CoordinateTransformation
+    """
+    cache = _getCache('transformations')
+    key = (s_srs, t_srs)
+    try:
+        return _cacheGet(cache, key)
+    except KeyError:
+        crx = osr.CoordinateTransformation(getSpatialReference(s_srs), getSpatialReference(t_srs))
+        _cachePut(cache, key, crx, MAX_TRANSFORMATIONS)
+        return crx
+
+def transformPoints(crx, points):
+    """ @brief Transform a list of points in one call
+
+        @param crx osgeo.osr.CoordinateTransformation
+        @param points Sequence of (x, y) pairs
+
+        @return List of (x, y) tuples
+    """
+    if not len(points):
+        return []
+    metrics.increment('coordinate_transform_points', len(points))
+    with metrics.timer('coordinate_transform'):
+        return [ p[0:2] for p in crx.TransformPoints([ (float(x), float(y)) for (x, y) in points ]) ]
+
+def transformCoordinatePairs(crx, coords):
+    """ @brief Transform a list of rhessystypes.CoordinatePair in one call
+
+        @param crx osgeo.osr.CoordinateTransformation
+        @param coords List of rhessystypes.CoordinatePair
+
+        @return List of rhessystypes.CoordinatePair
+    """
+    return [ rhessystypes.getCoordinatePair(x, y) for (x, y) in \
+             transformPoints(crx, [ (c.easting, c.northing) for c in coords ]) ]
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from mezzanine.pages.models import Page
+from ga_resources.models import DataResource
+
+from RHESSysWeb.models import GrassEnvironment
+from RHESSysWeb import flowtablestore
+from RHESSysWeb.profiling import getProfiler, DEFAULT_MAX_CALLS, DEFAULT_INTERVAL
+
+DEFAULT_SIZE = 16
+PROFILED_METHODS = ('get_data_for_point', 'ready_data_resource', 'get_fqpatch', 'get_fqpatches')
+
+VERSION_KEY = 'rhessysweb.drivercache.version'
+
+_local = threading.local()
+
+def _max_size():
+    return getattr(settings, 'RHESSYSWEB_DRIVER_CACHE_SIZE', DEFAULT_SIZE)
+
+def _version():
+    return flowtablestore.getConnection().get(VERSION_KEY) or '0'
+
+def get_driver(slug, profile=False):
+    """Driver instance for the data resource page with this slug.  Instances are
+    kept per thread, as drivers (and the OGR/OSR objects they hold) are not
+    thread-safe, and per resource, so their GRASS setup, projection, region and
+    label maps survive between requests; the least recently used are dropped
+    beyond settings.RHESSYSWEB_DRIVER_CACHE_SIZE per thread.  Cached instances
+    are used until a resource or environment is saved or deleted in any process
+    (see invalidate), and have GRASS set up for their mapset again on every
+    call.  With profile, or settings.RHESSYSWEB_PROFILE, the driver's
+    PROFILED_METHODS are profiled (see ProfiledDriver)."""
+    driver = _get_driver(slug)
+    if getattr(settings, 'RHESSYSWEB_PROFILE_DIR', None) and (profile or getattr(settings, 'RHESSYSWEB_PROFILE', False)):
+        return ProfiledDriver(driver)
+    return driver
+
+def _get_driver(slug):
+    drivers = getattr(_local, 'drivers', None)
+    if drivers is None:
+        drivers = _local.drivers = OrderedDict()
+    version = _version()
+    entry = drivers.pop(slug, None)
+    if entry is not None and entry[0] == version:
+        drivers[slug] = entry
+        # GRASS is set up for one mapset per process at a time; another
+        # resource's driver may have switched it since this one was cached
+        entry[1].ensure_grass()
+        return entry[1]
+
+    driver = Page.objects.get(slug=slug).dataresource.driver_instance
+    drivers[slug] = (version, driver)
+    while len(drivers) > _max_size():
+        drivers.popitem(last=False)
+    return driver
+
+class ProfiledDriver(object):
+    """Proxy for a driver running its PROFILED_METHODS under cProfile.  Profiles
+    are written to settings.RHESSYSWEB_PROFILE_DIR with the resource and GRASS
+    environment, at most RHESSYSWEB_PROFILE_MAX_CALLS per
+    RHESSYSWEB_PROFILE_INTERVAL seconds per process; calls over the limit run
+    unprofiled."""
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name):
+        value = getattr(self._driver, name)
+        if name not in PROFILED_METHODS:
+            return value
+
+        profiler = getProfiler(settings.RHESSYSWEB_PROFILE_DIR,
+            getattr(settings, 'RHESSYSWEB_PROFILE_MAX_CALLS', DEFAULT_MAX_CALLS),
+            getattr(settings, 'RHESSYSWEB_PROFILE_INTERVAL', DEFAULT_INTERVAL))
+        env = self._driver.env
+        metadata = dict(
+            resource=self._driver.resource.slug,
+            driver=type(self._driver).__name__,
+            database=env.database, location=env.location, mapset=env.map_set,
+        )
+        def profiled(*args, **kwargs):
+            return profiler.call('{0}.{1}'.format(self._driver.resource.slug, name), metadata, value, *args, **kwargs)
+        return profiled
+
+def invalidate():
+    """Drop the cached drivers of every thread of every process.  The version
+    checked by get_driver is kept in the flow table store's Redis, so one
+    counter reaches all processes without a database query per request."""
+    flowtablestore.getConnection().incr(VERSION_KEY)
+
+def _resource_changed(sender, instance, **kwargs):
+    invalidate()
+
+def _environment_changed(sender, instance, **kwargs):
+    # Drivers read their maps, mapset and flow table from the environment of
+    # their parent page; any resource may be affected
+    invalidate()
+
+post_save.connect(_resource_changed, sender=DataResource, dispatch_uid='rhessysweb_drivercache_resource_save')
+post_delete.connect(_resource_changed, sender=DataResource, dispatch_uid='rhessysweb_drivercache_resource_delete')
+post_save.connect(_environment_changed, sender=GrassEnvironment, dispatch_uid='rhessysweb_drivercache_environment_save')
+post_delete.connect(_environment_changed, sender=GrassEnvironment, dispatch_uid='rhessysweb_drivercache_environment_delete')
@@ -5,65 +5,68 @@ from django.contrib.gis.geos import Polygon
 import importlib
 import os
 import sh
-import redis
-import cPickle
 
 import tempfile
+from collections import OrderedDict
 from RHESSysWeb.grassdatalookup import GrassDataLookup
+from RHESSysWeb.rasterbackend import GrassRasterBackend
+from RHESSysWeb.rasterbackend import getGrassRasterStamp, getGrassRegionStamp, getCachedArrayBackend
+from RHESSysWeb.grassenv import init_grass, use_grass_pool
+from RHESSysWeb.grasspool import getPool, GrassScriptProxy, PooledRasterBackend
 from RHESSysWeb import flowtableio
-from RHESSysWeb.rhessystypes import FQPatchID
+from RHESSysWeb import flowtablestore
+from RHESSysWeb.rhessystypes import FQPatchID, getCoordinatePair
 from RHESSysWeb.flowtableio import FlowTableEntryReceiver
+from RHESSysWeb.coordtransform import getSpatialReference, getCoordinateTransformation, transformPoints
+from RHESSysWeb.rasterexport import exportCachedRaster
+from RHESSysWeb.patchgeometry import GEOMETRY_CELLS, GEOMETRY_MODES, GEOMETRY_POLYGON
+from RHESSysWeb.patchgeometry import getCoordinatePrecision, getPatchMultiPoint, getPatchPolygon
+from RHESSysWeb.rastercache import getRasterCache, DEFAULT_MAX_BYTES
+from RHESSysWeb.grasscatalog import getRasterCatalog
+from RHESSysWeb.pointcache import getPointCache, getCellForCoordinates, DEFAULT_MAX_ENTRIES
 
-flowtable = redis.Redis(db=15)
 
 class FlowtableDriver(drivers.Driver):
     def __init__(self, resource):
         super(FlowtableDriver, self).__init__(data_resource=resource)
         self.env = self.resource.parent.grassenvironment
         self.ensure_grass()
-        self._grassdatalookup = GrassDataLookup(self.g, self.grass_lowlevel)
+        self._grassdatalookup = GrassDataLookup(self.g, self.grass_lowlevel, backend=self.raster_backend())
 
     def ensure_grass(self):
-        if 'GISRC' not in os.environ:
-            os.environ['LD_LIBRARY_PATH'] = ':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"])
-            os.putenv("LD_LIBRARY_PATH",':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"]))
-            os.environ['DYLD_LIBRARY_PATH'] = os.path.join(settings.GISBASE, 'lib')
-            os.putenv("DYLD_LIBRARY_PATH", os.path.join(settings.GISBASE, "lib"))
-            os.environ['GIS_LOCK'] = str(os.getpid())
-            os.putenv('GIS_LOCK',str(os.getpid()))
-            os.environ['GISRC'] = self._initializeGrassrc()
-            os.putenv('GISRC', os.environ['GISRC'])
-
-        if 'LOCATION_NAME' not in os.environ:
-            os.environ['LOCATION_NAME'] = self.env.location
-            os.putenv('LOCATION_NAME', self.env.location)
-
-        if not hasattr(self, '_gsetup'):
-            self._gsetup = importlib.import_module('grass.script.setup')
-            self.g = importlib.import_module("grass.script")
-            self.grass_lowlevel = importlib.import_module('grass.lib.gis')
-
-        self.grass_lowlevel.G_gisinit('')
-        self._gsetup.init(settings.GISBASE, self.env.database, self.env.location, self.env.map_set)
-
-    def _initializeGrassrc(self):
-        grassRcFile = tempfile.NamedTemporaryFile(prefix='grassrc-', delete=False)
-        grassRcContent = "GISDBASE: %s\nLOCATION_NAME: %s\nMAPSET: %s\n" % \
-            (self.env.database, self.env.location, self.env.map_set)
-        grassRcFile.write(grassRcContent)
-        return grassRcFile.name
+        if use_grass_pool():
+            if not hasattr(self, '_worker'):
+                self._worker = getPool().getMapsetWorker(self.env.database, self.env.location, self.env.map_set)
+                self.g = GrassScriptProxy(self._worker)
+                self.grass_lowlevel = None
+        else:
+            self.g, self.grass_lowlevel = init_grass(self.env.database, self.env.location, self.env.map_set)
+
+    def raster_backend(self):
+        if use_grass_pool():
+            return PooledRasterBackend(self._worker)
+        else:
+            return GrassRasterBackend(self.grass_lowlevel)
+
+    @property
+    def catalog(self):
+        return getRasterCatalog(self.env.database, self.env.location, self.env.map_set)
 
     def get_data_fields(self, **kwargs):
-        return self.g.raster.list_pairs('rast')
+        return self.catalog.pairs()
 
     @property
-    def proj(self):
+    def proj4(self):
+        """Proj4 string of the location, the key of its cached spatial reference
+        and transformations (see coordtransform)."""
+        if not hasattr(self, '_proj4'):
+            self._proj4 = self.g.raster.read_command('g.proj', flags='j').strip()
 
-        if not hasattr(self, '_proj'):
-            self._proj = osr.SpatialReference()
-            self._proj.ImportFromProj4( self.g.raster.read_command('g.proj', flags='j') )
+        return self._proj4
 
-        return self._proj
+    @property
+    def proj(self):
+        return getSpatialReference(self.proj4)
 
     @property
     def region(self):
@@ -73,109 +76,148 @@ class FlowtableDriver(drivers.Driver):
 
         return self._region
 
-    def get_real_srs(self, srs):
-        r_srs = osr.SpatialReference()
-
-        if isinstance(srs, basestring):
-            if srs.lower().startswith('epsg'):
-                srs = int(srs[5:])
-                r_srs.ImportFromEPSG(srs)
-            else:
-                r_srs.ImportFromProj4(srs)
-        else:
-            r_srs.ImportFromEPSG(srs)
+    @property
+    def labels(self):
+        """GrassDataLookup over memory-mapped copies of the patch, zone and hillslope
+        maps, exported once per change to the maps or the region and shared by
+        every process using this cache path."""
+        backend = getCachedArrayBackend(lambda: self._grassdatalookup.backend, self.label_maps,
+            os.path.join(self.cache_path, 'labels'), self.labels_version())
+        return GrassDataLookup(backend=backend)
 
-        return r_srs
+    @property
+    def label_maps(self):
+        return list(OrderedDict.fromkeys([self.env.patch_map, self.env.zone_map, self.env.hillslope_map]))
+
+    def labels_version(self):
+        """Modification stamp of the patch, zone and hillslope maps and the region."""
+        stamp = max(
+            [getGrassRasterStamp(self.env.database, self.env.location, self.env.map_set, m) for m in self.label_maps] +
+            [getGrassRegionStamp(self.env.database, self.env.location, self.env.map_set)]
+        )
+        return '%.6f' % stamp
 
+    def ensure_flowtable(self):
+        flowtablestore.loadFlowtable(self.env.flow_table.name,
+            os.path.join(settings.MEDIA_ROOT, self.env.flow_table.name))
 
-    def get_fqpatch(self, srs, wherex, wherey):
-        r_srs = self.get_real_srs(srs)
+    def flowtable_version(self):
+        """Version of the flow table in the store (the file's modification stamp)."""
+        self.ensure_flowtable()
+        return flowtablestore.getFlowtableVersion(self.env.flow_table.name)
 
-        crx = osr.CoordinateTransformation(r_srs, self.proj)
+    @property
+    def point_cache(self):
+        return getPointCache(getattr(settings, 'RHESSYSWEB_POINT_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
 
-        easting, northing, _ = crx.TransformPoint(wherex, wherey)
+    def get_real_srs(self, srs):
+        return getSpatialReference(srs)
 
-        print crx
-        print easting, northing, srs
 
-        ### everything below here is specific to rhessys and the hackathon ###
+    def get_fqpatch(self, srs, wherex, wherey):
+        crx = getCoordinateTransformation(srs, self.proj4)
 
-        _, _, _, patch = self.g.read_command("r.what", **{
-            "input" : 'patch_5m',
-            "null" : "None", "east_north" :
-            "{easting},{northing}".format(easting=easting, northing=northing)
-        }).strip().split('|')
+        easting, northing, _ = crx.TransformPoint(wherex, wherey)
 
-        _, _, _, hillslope = self.g.read_command("r.what", **{
-            "input" : 'hillslope',
-            "null" : "None", "east_north" :
-            "{easting},{northing}".format(easting=easting, northing=northing)
-        }).strip().split('|')
+        fqpatch_id = self.labels.getFQPatchIDForCoordinates(
+            getCoordinatePair(easting, northing),
+            self.env.patch_map, self.env.zone_map, self.env.hillslope_map)
 
-        _, _, _, zone = self.g.read_command("r.what", **{
-            "input" : 'hillslope',
-            "null" : "None", "east_north" :
-            "{easting},{northing}".format(easting=easting, northing=northing)
-        }).strip().split('|')
+        if fqpatch_id is None:
+            return None, None, None
+        return fqpatch_id.patchID, fqpatch_id.hillID, fqpatch_id.zoneID
 
-        patch = int(patch)
-        hillslope = int(hillslope)
-        zone = int(zone)
+    def get_fqpatches(self, srs, points):
+        """Look up the patches at many (x, y) points in srs with one coordinate
+        transformation and one pass over the label maps.  Returns a list of
+        (patch, hillslope, zone) tuples, None for points outside the region."""
+        crx = getCoordinateTransformation(srs, self.proj4)
+        fqpatch_ids = self.labels.getFQPatchIDsForCoordinates(
+            [getCoordinatePair(easting, northing) for easting, northing in transformPoints(crx, points)],
+            self.env.patch_map, self.env.zone_map, self.env.hillslope_map)
 
-        return patch, hillslope, zone
+        return [(f.patchID, f.hillID, f.zoneID) if f else None for f in fqpatch_ids]
 
     def get_data_for_point(self, wherex, wherey, srs, fuzziness=0, **kwargs):
-        patch, hillslope, zone = self.get_fqpatch(srs, wherex, wherey)
-        fqpatch_id = FQPatchID(patchID=patch, hillID=hillslope, zoneID=zone)
+        """Results are cached per patch cell, flow table and label map version, and
+        output SRS.  Editing a patch drops its results in this process (see
+        views.cache_patches_in_session); other processes stop using them once
+        the flow table version in the key changes."""
+        crx = getCoordinateTransformation(srs, self.proj4)
+        easting, northing, _ = crx.TransformPoint(wherex, wherey)
+
+        labels = self.labels
+        key = ('flowtable', self.env.flow_table.name, self.flowtable_version(), self.labels_version(),
+            getCellForCoordinates(labels.backend.getWindow(), easting, northing), srs,
+            kwargs.get('geometry'), kwargs.get('zoom'))
+        data = self.point_cache.get(key)
+        if data is None:
+            fqpatch_id = labels.getFQPatchIDForCoordinates(
+                getCoordinatePair(easting, northing),
+                self.env.patch_map, self.env.zone_map, self.env.hillslope_map)
+            if fqpatch_id is None:
+                # No patch (null cell) at the point
+                return { "type" : "FeatureCollection", "features" : [] }
+            data = self.get_data_for_patch(fqpatch_id, srs, labels=labels, **kwargs)
+            self.point_cache.put(key, data, namespace=self.env.flow_table.name, tags=[fqpatch_id])
+        return data
+
+    def get_data_for_patch(self, fqpatch_id, srs, labels=None, **kwargs):
+        labels = labels or self.labels
         r_srs = self.get_real_srs(srs)
 
-        # setup redis if necessary
-        if not flowtable.llen(self.env.flow_table.name):
-            flow_table = flowtableio.readFlowtable(os.path.join(settings.MEDIA_ROOT, self.env.flow_table.name))
-            for fqpatchid, entry in flow_table.items():
-                key = cPickle.dumps(fqpatchid)
-                value = flowtableio.dumpReceivers(entry)
-                flowtable.rpush(self.env.flow_table.name, key)
-                flowtable.hset(self.env.flow_table.name + ".hash", key, value)
-
-        # total_gamma = flowtableio.getEntryForFlowtableKey(fqpatch_id, self.flow_table).totalGamma
-        hkey = cPickle.dumps(fqpatch_id)
-        flowtable_entry = flowtableio.loadReceivers(flowtable.hget(self.env.flow_table.name + ".hash", hkey))
+        self.ensure_flowtable()
+        flowtable_entry = flowtablestore.getEntry(self.env.flow_table.name, fqpatch_id)
         total_gamma = flowtable_entry[0].totalGamma
 
         receivers = [fqpatch_id] + flowtable_entry[1:]
 
-        coords = self._grassdatalookup.getCoordinatesForFQPatchIDs(
+        coords = labels.getCoordinatesForFQPatchIDs(
             receivers,
-            'patch_5m','hillslope','hillslope')
+            self.env.patch_map, self.env.zone_map, self.env.hillslope_map)
 
-        xrc = osr.CoordinateTransformation(self.proj, r_srs)
+        xrc = getCoordinateTransformation(self.proj4, srs)
         self.ensure_grass()
 
-        rasters = self.g.list_strings('rast')
-        def best_type(k):
-            try:
-                return int(k)
-            except:
-                try:
-                    return float(k)
-                except:
-                    return k
+        def properties(i, fqpatchid):
+            return {
+                "patchId" : fqpatchid.patchID,
+                'zoneId' : fqpatchid.zoneID,
+                "hillId" : fqpatchid.hillID,
+                "gamma" : receivers[i].gamma if hasattr(receivers[i], 'gamma') else None,
+                "total_gamma" : None if hasattr(receivers[i], 'gamma') else total_gamma
+            }
+
+        # geometry=multipoint|polygon returns one feature per patch instead of one
+        # per cell, generalized for zoom if given
+        mode = kwargs.get('geometry', GEOMETRY_CELLS)
+        if mode not in GEOMETRY_MODES:
+            raise ValueError("Unknown geometry mode %s" % (mode,))
+        zoom = int(kwargs['zoom']) if kwargs.get('zoom') not in (None, '') else None
 
         c = []
-        for i, (fqpatchid, pairs) in enumerate(coords.items()):
-            for a in pairs:
+        if mode == GEOMETRY_CELLS:
+            # Transform every cell of every patch in one call
+            points = iter(transformPoints(xrc, [ (a.easting, a.northing) for pairs in coords.values() for a in pairs ]))
+            for i, (fqpatchid, pairs) in enumerate(coords.items()):
+                for a in pairs:
+                    c.append({
+                          "type" : "Feature",
+                          "geometry" : { "type" : "Point", "coordinates" : next(points) },
+                          "properties" : properties(i, fqpatchid)
+                    })
+        else:
+            window = labels.backend.getWindow()
+            precision = getCoordinatePrecision(r_srs, zoom)
+            for i, (fqpatchid, pairs) in enumerate(coords.items()):
+                if mode == GEOMETRY_POLYGON:
+                    geometry = getPatchPolygon(xrc, pairs, window.nsres, window.ewres, zoom, precision)
+                else:
+                    geometry = getPatchMultiPoint(xrc, pairs, min(window.nsres, window.ewres), zoom, precision)
                 c.append({
-                      "type" : "Feature",
-                      "geometry" : { "type" : "Point", "coordinates" : xrc.TransformPoint(a.easting, a.northing)[0:2] },
-                      "properties" : {
-
-                          "patchId" : fqpatchid.patchID,
-                          'zoneId' : fqpatchid.zoneID,
-                          "hillId" : fqpatchid.hillID,
-                          "gamma" : receivers[i].gamma if hasattr(receivers[i], 'gamma') else None,
-                          "total_gamma" : None if hasattr(receivers[i], 'gamma') else total_gamma
-                      }
+                    "type" : "Feature",
+                    "geometry" : geometry,
+                    "properties" : properties(i, fqpatchid)
                 })
 
         return {
@@ -191,9 +233,7 @@ class FlowtableDriver(drivers.Driver):
         r = self.region
         s_srs =  self.proj
 
-        e4326 = osr.SpatialReference()
-        e4326.ImportFromEPSG(4326)
-        crx = osr.CoordinateTransformation(s_srs, e4326)
+        crx = getCoordinateTransformation(self.proj4, 4326)
 
         x0, y0, x1, y1 = r['w'], r['s'], r['e'], r['n']
         self.resource.spatial_metadata.native_srs = s_srs
@@ -205,6 +245,13 @@ class FlowtableDriver(drivers.Driver):
         self.resource.spatial_metadata.three_d = False
         self.resource.spatial_metadata.save()
 
+    @property
+    def raster_cache(self):
+        """Exported rasters are cached under settings.RHESSYSWEB_RASTER_CACHE_DIR if set,
+        otherwise per resource, within RHESSYSWEB_RASTER_CACHE_BYTES of disk."""
+        root = getattr(settings, 'RHESSYSWEB_RASTER_CACHE_DIR', None) or os.path.join(self.cache_path, 'rasters')
+        return getRasterCache(root, getattr(settings, 'RHESSYSWEB_RASTER_CACHE_BYTES', DEFAULT_MAX_BYTES))
+
     def ready_data_resource(self, **kwargs):
         print "ready data resource"
         r = self.region
@@ -212,9 +259,8 @@ class FlowtableDriver(drivers.Driver):
         print s_srs
         print s_srs.ExportToProj4()
 
-        e3857 = osr.SpatialReference()
-        e3857.ImportFromEPSG(3857)
-        crx = osr.CoordinateTransformation(s_srs, e3857)
+        e3857 = getSpatialReference(3857)
+        crx = getCoordinateTransformation(self.proj4, 3857)
 
         x0, y0, x1, y1 = r['w'], r['s'], r['e'], r['n']
         self.resource.spatial_metadata.native_srs = s_srs.ExportToProj4()
@@ -223,39 +269,13 @@ class FlowtableDriver(drivers.Driver):
         xx1, yy1, _ = crx.TransformPoint(x1, y1)
 
         raster = kwargs['RASTER'] if 'RASTER' in kwargs else self.env.default_raster
-        cached_basename = os.path.join(self.cache_path, raster)
-        cached_tiff = cached_basename + '.tif'
-        output = cached_basename + '.native.tif'
-        output_prj = cached_basename+ '.native.prj'
-
+        # TODO: Dynamically set name of mask layer
+        # Mask layer must be 0|1 raster with 0 representing areas to
+        #      exclude
+        mask = 'basin_dr5'
+        cached_tiff = exportCachedRaster(self.raster_cache, self.raster_backend(),
+            self.env.database, self.env.location, self.env.map_set, raster, s_srs, mask=mask, catalog=self.catalog)
         print cached_tiff
-        if not os.path.exists(cached_tiff):
-            print "generating tiff"
-            # Remove GRASS mask if present
-            self.g.run_command('r.mask', flags='r')
-
-            # TODO: Dynamically set name of mask layer
-            # Mask layer must be 0|1 raster with 0 representing areas to
-            #      exclude
-            mask = 'basin_dr5'
-            # TODO: Make export layer contain session ID, etc. to support multi
-            #       user
-            export = 'export'
-            if mask:
-                # Use mask to properly set alpha channel of exported TIFF
-                self.g.write_command('r.mapcalc', stdin="{export}=if({mask},{raster},{mask})".format(export=export, mask=mask, raster=raster) )
-                self.g.run_command('r.out.gdal', flags='f', type='UInt16', input=export, output=output)
-            else:
-                self.g.run_command('r.out.gdal', flags='f', type='UInt16', input=raster, output=output)
-
-            with open(output_prj, 'w') as prj:
-                prj.write(s_srs.ExportToWkt())
-
-            sh.gdalwarp("-s_srs", output_prj, "-t_srs", "EPSG:3857", output, cached_tiff, '-srcnodata', '0', '-dstalpha')
-
-            if export:
-                # Clean up temporary export raster
-                self.g.run_command('g.remove', rast=export)
 
         return self.cache_path, (
             self.resource.slug,
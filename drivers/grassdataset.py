@@ -4,10 +4,34 @@ from osgeo import gdal, ogr, osr
 from django.conf import settings
 from django.contrib.gis.geos import Polygon
 import importlib
+import functools
+import threading
 import os
 import sh
 
 import tempfile
+from RHESSysWeb.coordtransform import getSpatialReference, getCoordinateTransformation
+from RHESSysWeb.rasterbackend import GrassRasterBackend, getGrassMapsetStamp
+from RHESSysWeb.grassenv import init_grass, use_grass_pool
+from RHESSysWeb.grasspool import getPool, GrassScriptProxy, PooledRasterBackend
+from RHESSysWeb.rasterstack import RasterStack
+from RHESSysWeb import metrics
+from RHESSysWeb.rasterexport import exportCachedRaster
+from RHESSysWeb.rastercache import getRasterCache, DEFAULT_MAX_BYTES
+from RHESSysWeb.grasscatalog import getRasterCatalog
+from RHESSysWeb.pointcache import getPointCache, getCellForCoordinates, DEFAULT_MAX_ENTRIES
+
+# Raster stacks are shared by every driver instance in the process, keyed by
+# cache directory.  Enable with settings.RHESSYSWEB_RASTER_STACK = True
+_stacks = {}
+_stacks_lock = threading.Lock()
+
+def _stack_source(database, location, mapset):
+    """Backend the stack exports rasters with, asked for on each export so that
+    the stack holds on to no driver's GRASS worker."""
+    if use_grass_pool():
+        return PooledRasterBackend(getPool().getMapsetWorker(database, location, mapset))
+    return GrassRasterBackend(init_grass(database, location, mapset)[1])
 
 class Grass(drivers.Driver):
     def __init__(self, resource):
@@ -16,46 +40,39 @@ class Grass(drivers.Driver):
         self.ensure_grass()
 
     def ensure_grass(self):
-        if 'GISRC' not in os.environ:
-            os.environ['LD_LIBRARY_PATH'] = ':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"])
-            os.putenv("LD_LIBRARY_PATH",':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"]))
-            os.environ['DYLD_LIBRARY_PATH'] = os.path.join(settings.GISBASE, 'lib')
-            os.putenv("DYLD_LIBRARY_PATH", os.path.join(settings.GISBASE, "lib"))
-            os.environ['GIS_LOCK'] = str(os.getpid())
-            os.putenv('GIS_LOCK',str(os.getpid()))
-            os.environ['GISRC'] = self._initializeGrassrc()
-            os.putenv('GISRC', os.environ['GISRC'])
-
-        if 'LOCATION_NAME' not in os.environ:
-            os.environ['LOCATION_NAME'] = self.env.location
-            os.putenv('LOCATION_NAME', self.env.location)
-
-        if not hasattr(self, '_gsetup'):
-            self._gsetup = importlib.import_module('grass.script.setup')
-            self.g = importlib.import_module("grass.script")
-            self.grass_lowlevel = importlib.import_module('grass.lib.gis')
-
-        self.grass_lowlevel.G_gisinit('')
-        self._gsetup.init(settings.GISBASE, self.env.database, self.env.location, self.env.map_set)
-
-    def _initializeGrassrc(self):
-        grassRcFile = tempfile.NamedTemporaryFile(prefix='grassrc-', delete=False)
-        grassRcContent = "GISDBASE: %s\nLOCATION_NAME: %s\nMAPSET: %s\n" % \
-            (self.env.database, self.env.location, self.env.map_set)
-        grassRcFile.write(grassRcContent)
-        return grassRcFile.name
+        if use_grass_pool():
+            if not hasattr(self, '_worker'):
+                self._worker = getPool().getMapsetWorker(self.env.database, self.env.location, self.env.map_set)
+                self.g = GrassScriptProxy(self._worker)
+                self.grass_lowlevel = None
+        else:
+            self.g, self.grass_lowlevel = init_grass(self.env.database, self.env.location, self.env.map_set)
+
+    def raster_backend(self):
+        if use_grass_pool():
+            return PooledRasterBackend(self._worker)
+        else:
+            return GrassRasterBackend(self.grass_lowlevel)
+
+    @property
+    def catalog(self):
+        return getRasterCatalog(self.env.database, self.env.location, self.env.map_set)
 
     def get_data_fields(self, **kwargs):
-        return self.g.raster.list_pairs('rast')
+        return self.catalog.pairs()
 
     @property
-    def proj(self):
+    def proj4(self):
+        """Proj4 string of the location, the key of its cached spatial reference
+        and transformations (see coordtransform)."""
+        if not hasattr(self, '_proj4'):
+            self._proj4 = self.g.raster.read_command('g.proj', flags='j').strip()
 
-        if not hasattr(self, '_proj'):
-            self._proj = osr.SpatialReference()
-            self._proj.ImportFromProj4( self.g.raster.read_command('g.proj', flags='j') )
+        return self._proj4
 
-        return self._proj
+    @property
+    def proj(self):
+        return getSpatialReference(self.proj4)
 
     @property
     def region(self):
@@ -65,30 +82,49 @@ class Grass(drivers.Driver):
 
         return self._region
 
-    def get_real_srs(self, srs):
-        r_srs = osr.SpatialReference()
-
-        if isinstance(srs, basestring):
-            if srs.lower().startswith('epsg'):
-                srs = int(srs[5:])
-                r_srs.ImportFromEPSG(srs)
-            else:
-                r_srs.ImportFromProj4(srs)
-        else:
-            r_srs.ImportFromEPSG(srs)
+    @property
+    def stack(self):
+        cache_dir = os.path.join(self.cache_path, 'stack')
+        with _stacks_lock:
+            if cache_dir not in _stacks:
+                env = self.env
+                _stacks[cache_dir] = RasterStack(env.database, env.location, env.map_set, cache_dir,
+                    functools.partial(_stack_source, env.database, env.location, env.map_set), catalog=self.catalog)
+            return _stacks[cache_dir]
 
-        return r_srs
+    @property
+    def point_cache(self):
+        return getPointCache(getattr(settings, 'RHESSYSWEB_POINT_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+
+    def get_real_srs(self, srs):
+        return getSpatialReference(srs)
 
 
     def get_data_for_point(self, wherex, wherey, srs, fuzziness=0, **kwargs):
-        r_srs = self.get_real_srs(srs)
-        xrc = osr.CoordinateTransformation(self.proj, r_srs)
-        crx = osr.CoordinateTransformation(r_srs, self.proj)
+        xrc = getCoordinateTransformation(self.proj4, srs)
+        crx = getCoordinateTransformation(srs, self.proj4)
         self.ensure_grass()
 
         easting, northing, _ = crx.TransformPoint(wherex, wherey)
 
-        rasters = self.g.list_strings('rast')
+        # Every click within a cell gets the same values until the mapset changes
+        key = ('grass', self.env.database, self.env.location, self.env.map_set,
+            getGrassMapsetStamp(self.env.database, self.env.location, self.env.map_set),
+            getCellForCoordinates(self.raster_backend().getWindow(), easting, northing), srs)
+        c = self.point_cache.get(key)
+        if c is None:
+            c = self.get_data_for_native_point(easting, northing)
+            self.point_cache.put(key, c)
+        return c
+
+    def get_data_for_native_point(self, easting, northing):
+        if getattr(settings, 'RHESSYSWEB_RASTER_STACK', False):
+            values = self.stack.query(easting, northing)
+            return [dict(
+                (name, '*' if v is None else v) for name, v in values.items()
+            )]
+
+        rasters = self.catalog.qualifiedNames()
         def best_type(k):
             try:
                 return int(k)
@@ -98,9 +134,11 @@ class Grass(drivers.Driver):
                 except:
                     return k
 
+        with metrics.timer('grass_r_what'):
+            values = self.g.read_command('r.what', input=rasters, east_north='{e},{n}'.format(e=easting, n=northing))
         c = []
         c.append(dict(zip(rasters, [
-            best_type(k) for k in self.g.read_command('r.what', input=rasters, east_north='{e},{n}'.format(e=easting, n=northing)).strip().split('|')
+            best_type(k) for k in values.strip().split('|')
         ])))
 
         return c
@@ -113,9 +151,7 @@ class Grass(drivers.Driver):
         r = self.region
         s_srs =  self.proj.ExportToProj4()
 
-        e4326 = osr.SpatialReference()
-        e4326.ImportFromEPSG(4326)
-        crx = osr.CoordinateTransformation(self.proj, e4326)
+        crx = getCoordinateTransformation(self.proj4, 4326)
 
         x0, y0, x1, y1 = r['w'], r['s'], r['e'], r['n']
         self.resource.spatial_metadata.native_srs = s_srs
@@ -127,6 +163,13 @@ class Grass(drivers.Driver):
         self.resource.spatial_metadata.three_d = False
         self.resource.spatial_metadata.save()
 
+    @property
+    def raster_cache(self):
+        """Exported rasters are cached under settings.RHESSYSWEB_RASTER_CACHE_DIR if set,
+        otherwise per resource, within RHESSYSWEB_RASTER_CACHE_BYTES of disk."""
+        root = getattr(settings, 'RHESSYSWEB_RASTER_CACHE_DIR', None) or os.path.join(self.cache_path, 'rasters')
+        return getRasterCache(root, getattr(settings, 'RHESSYSWEB_RASTER_CACHE_BYTES', DEFAULT_MAX_BYTES))
+
     def ready_data_resource(self, **kwargs):
         print "ready data resource"
         r = self.region
@@ -134,9 +177,8 @@ class Grass(drivers.Driver):
         print s_srs
         print s_srs.ExportToProj4()
 
-        e3857 = osr.SpatialReference()
-        e3857.ImportFromEPSG(3857)
-        crx = osr.CoordinateTransformation(s_srs, e3857)
+        e3857 = getSpatialReference(3857)
+        crx = getCoordinateTransformation(self.proj4, 3857)
 
         x0, y0, x1, y1 = r['w'], r['s'], r['e'], r['n']
         self.resource.spatial_metadata.native_srs = s_srs.ExportToProj4()
@@ -145,33 +187,9 @@ class Grass(drivers.Driver):
         xx1, yy1, _ = crx.TransformPoint(x1, y1)
 
         raster = kwargs['RASTER'] if 'RASTER' in kwargs else self.env.default_raster
-        cached_basename = os.path.join(self.cache_path, raster)
-        cached_tiff = cached_basename + '.tif'
-        output = cached_basename + '.native.tif'
-        output_prj = cached_basename+ '.native.prj'
-
-        # TODO change this to make more sense.
-        if not os.path.exists(cached_tiff):
-            # Remove GRASS mask if present
-            self.g.run_command('r.mask', flags='r')
-
-            mask = kwargs.get('mask', None)
-            export = uuid4().hex
-            if mask:
-                # Use mask to properly set alpha channel of exported TIFF
-                self.g.write_command('r.mapcalc', stdin="{export}=if({mask},{raster},{mask})".format(export=export, mask=mask, raster=raster) )
-                self.g.run_command('r.out.gdal', flags='f', type='UInt16', input=export, output=output)
-            else:
-                self.g.run_command('r.out.gdal', flags='f', type='UInt16', input=raster, output=output)
-                
-            with open(output_prj, 'w') as prj:
-                prj.write(s_srs.ExportToWkt())
-
-            sh.gdalwarp("-s_srs", output_prj, "-t_srs", "EPSG:3857", output, cached_tiff, '-srcnodata', '0', '-dstalpha')
-
-            if export:
-                # Clean up temporary export raster
-                self.g.run_command('g.remove', rast=export)
+        cached_tiff = exportCachedRaster(self.raster_cache, self.raster_backend(),
+            self.env.database, self.env.location, self.env.map_set, raster, s_srs, mask=kwargs.get('mask', None),
+            catalog=self.catalog)
 
         return self.cache_path, (
             self.resource.slug,
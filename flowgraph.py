@@ -0,0 +1,134 @@
+import numpy as np
+from django.db import connection, transaction
+
+from RHESSysWeb.models import FlowEntry, FlowEdge, FlowGraph, Patch, Zone, Hillslope
+from RHESSysWeb.flowtableio import iterFlowtable, FlowTableEntryReceiver
+from RHESSysWeb.worldimport import IdAllocator, BulkInserter, DEFAULT_BATCH_SIZE
+from RHESSysWeb.rollups import get_version
+
+def load_flowtable(name, path, world=None, batch_size=DEFAULT_BATCH_SIZE, if_changed=False):
+    """Replace the flow graph of a flow table with the entries and receivers of
+    its file.  The file is streamed and inserted batch_size rows at a time;
+    receivers are then resolved to their entries, and entries to the patches of
+    world if given, by one UPDATE each.  The file's version is recorded in
+    FlowGraph.  Loads of the same table are serialized; with if_changed, a load
+    finding the file's version already loaded does nothing.  Requires
+    PostgreSQL."""
+    entry_table = FlowEntry._meta.db_table
+    edge_table = FlowEdge._meta.db_table
+    version = get_version(path)
+    with transaction.commit_on_success():
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ['flowgraph:' + name])
+        if if_changed and get_loaded_version(name) == version:
+            return
+        cursor.execute('DELETE FROM "{edge}" WHERE source_id IN (SELECT id FROM "{entry}" WHERE flow_table = %s)'.format(
+            edge=edge_table, entry=entry_table), [name])
+        cursor.execute('DELETE FROM "{entry}" WHERE flow_table = %s'.format(entry=entry_table), [name])
+
+        ids = IdAllocator(FlowEntry, batch_size)
+        entries = BulkInserter(FlowEntry, batch_size)
+        edges = BulkInserter(FlowEdge, batch_size)
+        for key, items in iterFlowtable(path):
+            entry = items[0]
+            pk = ids.allocate()
+            entries.add(FlowEntry(id=pk, flow_table=name, rhessys_patch_id=entry.patchID,
+                rhessys_zone_id=entry.zoneID, rhessys_hill_id=entry.hillID, x=entry.x, y=entry.y, z=entry.z,
+                accum_area=entry.accumArea, area=entry.area, land_type=entry.landType,
+                total_gamma=entry.totalGamma, num_adjacent=entry.numAdjacent))
+            for position, item in enumerate(items[1:]):
+                if isinstance(item, FlowTableEntryReceiver):
+                    edges.add(FlowEdge(source_id=pk, position=position, rhessys_patch_id=item.patchID,
+                        rhessys_zone_id=item.zoneID, rhessys_hill_id=item.hillID, gamma=item.gamma))
+                else:
+                    edges.add(FlowEdge(source_id=pk, position=position, rhessys_patch_id=item.streamPatchID,
+                        rhessys_zone_id=item.streamZoneID, rhessys_hill_id=item.streamHillID,
+                        road_width=item.roadWidth))
+        entries.flush()
+        edges.flush()
+
+        cursor.execute('''
+            UPDATE "{edge}" AS e SET target_id = t.id
+            FROM "{entry}" AS s, "{entry}" AS t
+            WHERE e.source_id = s.id AND s.flow_table = %s AND t.flow_table = %s
+              AND t.rhessys_patch_id = e.rhessys_patch_id AND t.rhessys_zone_id = e.rhessys_zone_id
+              AND t.rhessys_hill_id = e.rhessys_hill_id'''.format(edge=edge_table, entry=entry_table), [name, name])
+        if world is not None:
+            cursor.execute('''
+                UPDATE "{entry}" AS f SET patch_id = p.id
+                FROM "{patch}" AS p, "{zone}" AS z, "{hillslope}" AS h
+                WHERE f.flow_table = %s AND p.world_id = %s AND z.id = p.zone_id AND h.id = p.hillslope_id
+                  AND p.rhessys_id = f.rhessys_patch_id AND z.rhessys_id = f.rhessys_zone_id
+                  AND h.rhessys_id = f.rhessys_hill_id'''.format(entry=entry_table, patch=Patch._meta.db_table,
+                zone=Zone._meta.db_table, hillslope=Hillslope._meta.db_table), [name, world.pk])
+
+        FlowGraph.objects.filter(flow_table=name).delete()
+        FlowGraph.objects.create(flow_table=name, version=version, world=world)
+
+    cursor = connection.cursor()
+    for table in (entry_table, edge_table):
+        cursor.execute('ANALYZE "%s"' % (table,))
+
+def get_loaded_version(name):
+    """Version of the file last loaded into a flow table's graph, or None."""
+    versions = FlowGraph.objects.filter(flow_table=name).values_list('version', flat=True)
+    return (list(versions[:1]) or [None])[0]
+
+def ensure_flowtable(name, path):
+    """Reload the flow graph of a flow table if its file changed since it was
+    loaded (see rollups.get_version), linked to the same world as before.
+    Returns the version loaded."""
+    version = get_version(path)
+    graph = list(FlowGraph.objects.filter(flow_table=name).select_related('world')[:1])
+    if not graph or graph[0].version != version:
+        load_flowtable(name, path, graph[0].world if graph else None, if_changed=True)
+    return version
+
+def get_entry_id(name, fqpatch):
+    """Primary key of the FlowEntry of a patch (rhessystypes.FQPatchID)."""
+    return FlowEntry.objects.values_list('id', flat=True).get(flow_table=name,
+        rhessys_patch_id=fqpatch.patchID, rhessys_zone_id=fqpatch.zoneID, rhessys_hill_id=fqpatch.hillID)
+
+def _traverse(entry_ids, downstream, max_depth):
+    (start, end) = ('source_id', 'target_id') if downstream else ('target_id', 'source_id')
+    if max_depth is None:
+        # UNION drops entries already reached, so cycles end the recursion
+        sql = '''
+            WITH RECURSIVE reached(id) AS (
+                SELECT unnest(%s::integer[])
+              UNION
+                SELECT e.{end} FROM reached AS r JOIN "{edge}" AS e ON e.{start} = r.id
+                WHERE e.{end} IS NOT NULL
+            ) SELECT id FROM reached ORDER BY id'''
+        params = [[int(i) for i in entry_ids]]
+    else:
+        sql = '''
+            WITH RECURSIVE reached(id, depth) AS (
+                SELECT unnest(%s::integer[]), 0
+              UNION
+                SELECT e.{end}, r.depth + 1 FROM reached AS r JOIN "{edge}" AS e ON e.{start} = r.id
+                WHERE e.{end} IS NOT NULL AND r.depth < %s
+            ) SELECT DISTINCT id FROM reached ORDER BY id'''
+        params = [[int(i) for i in entry_ids], max_depth]
+    cursor = connection.cursor()
+    cursor.execute(sql.format(start=start, end=end, edge=FlowEdge._meta.db_table), params)
+    return np.fromiter((row[0] for row in cursor.fetchall()), dtype=np.int64)
+
+def downstream(entry_ids, max_depth=None):
+    """Primary keys of the entries receiving flow, directly or not, from any of
+    entry_ids (including them), following receivers and road drains, as a
+    sorted NumPy int64 array.  max_depth limits the number of edges followed."""
+    return _traverse(entry_ids, True, max_depth)
+
+def upstream(entry_ids, max_depth=None):
+    """Primary keys of the entries draining, directly or not, to any of entry_ids
+    (including them); see downstream."""
+    return _traverse(entry_ids, False, max_depth)
+
+def get_patch_ids(entry_ids):
+    """Primary keys of the Patches of entries, for those linked to one, as a
+    sorted NumPy int64 array (e.g. for World.read_state)."""
+    cursor = connection.cursor()
+    cursor.execute('SELECT patch_id FROM "{entry}" WHERE id = ANY(%s::integer[]) AND patch_id IS NOT NULL '
+        'ORDER BY patch_id'.format(entry=FlowEntry._meta.db_table), [[int(i) for i in entry_ids]])
+    return np.fromiter((row[0] for row in cursor.fetchall()), dtype=np.int64)
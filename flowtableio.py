@@ -51,6 +51,8 @@ import rhessystypes
 LAND_TYPE_ROAD = 2
 FLOW_ENTRY_NUM_TOKENS = 11
 FLOW_ENTRY_ITEM_NUM_TOKENS = 4
+FLOW_PATCH_FORMAT = 'rhessys-flowtable-patch'
+FLOW_PATCH_VERSION = 1
 
 ## Type definitions
 FlowTableEntry = namedtuple('FlowTableEntry', ['patchID', 'zoneID', 'hillID', 'x', 'y', 'z', 'accumArea', 'area', 'landType', 'totalGamma', 'numAdjacent'], verbose=False)
@@ -149,6 +151,24 @@ def getFlowTableEntryRoadFromArray(values):
                                roadWidth=float(values[3]) )
 
 ## Function definitions
+def formatFlowtableItem(item):
+    """ @brief Format a flow table entry, receiver or road as written to a flow table
+        file, including its leading newline
+    """
+    if isinstance(item, FlowTableEntryReceiver):
+        return "\n%16d %6d %6d %8.8f  " % \
+               (item.patchID, item.zoneID, item.hillID, item.gamma)
+    elif isinstance(item, FlowTableEntry):
+        return "\n %6d %6d %6d %6.1f %6.1f %6.1f %10f %d %4d %f %4d" % \
+               (item.patchID, item.zoneID, item.hillID, item.x, item.y, \
+                item.z, item.accumArea, item.area, item.landType, \
+                item.totalGamma, item.numAdjacent)
+    elif isinstance(item, FlowTableEntryRoad):
+        return "\n%16d %6d %6d %lf" % \
+               (item.streamPatchID, item.streamZoneID, item.streamHillID, \
+                item.roadWidth)
+    return ''
+
 def writeFlowtable(flowtableDict, flowtableOutfile):
     """ @brief Write a RHESSys flow table from a representation stored in collections.OrderedDict
         returned by readFlowtable.
@@ -166,20 +186,8 @@ def writeFlowtable(flowtableDict, flowtableOutfile):
     
     flowFile.write("%8d" % (numKeys,) )
     for key in keys:
-        items = flowtableDict[key]
-        for item in items:
-            if isinstance(item, FlowTableEntryReceiver):
-                flowFile.write("\n%16d %6d %6d %8.8f  " % \
-                               (item.patchID, item.zoneID, item.hillID, item.gamma) )
-            elif isinstance(item, FlowTableEntry):
-                flowFile.write("\n %6d %6d %6d %6.1f %6.1f %6.1f %10f %d %4d %f %4d" % \
-                               (item.patchID, item.zoneID, item.hillID, item.x, item.y, \
-                                item.z, item.accumArea, item.area, item.landType, \
-                                item.totalGamma, item.numAdjacent) )
-            elif isinstance(item, FlowTableEntryRoad):
-                flowFile.write("\n%16d %6d %6d %lf" % \
-                               (item.streamPatchID, item.streamZoneID, item.streamHillID, \
-                               item.roadWidth) )
+        for item in flowtableDict[key]:
+            flowFile.write(formatFlowtableItem(item))
     
     flowFile.close()
 
@@ -196,6 +204,31 @@ def readFlowtable(flowtable):
     """
     #flowDict = dict()
     flowDict = OrderedDict()
+    for key, items in iterFlowtable(flowtable):
+        flowDict[key] = items
+    return flowDict
+
+def readFlowtableHeader(flowtable):
+    """ @brief Read the number of patches declared at the top of a RHESSys flow table
+
+        @param flowtable String representing the absolute path of the flow table
+
+        @return Integer
+    """
+    with open(flowtable, 'r') as flow:
+        return int(flow.readline().strip())
+
+def iterFlowtable(flowtable):
+    """ @brief Read a RHESSys flow table one patch at a time, without holding the
+        whole table in memory
+
+        @param flowtable String representing the absolute path of the file
+        containing the RHESSys flowtable
+
+        @return Generator yielding (rhessysweb.types.FQPatchID, list) pairs in file
+        order, the list holding the FlowTableEntry of the patch followed by its
+        FlowTableEntryReceiver objects and possibly one FlowTableEntryRoad object
+    """
     flow = open(flowtable, 'r')
 
     numPatches = flow.readline().lstrip()
@@ -206,40 +239,127 @@ def readFlowtable(flowtable):
     numAdj = -1
     numLines = 0
     currEntry = None
+    currItems = None
 
-    for line in flow:
-        numLines += 1
-        line = line.strip()
-        values = line.split()
-        lv = len(values)
-        if lv == FLOW_ENTRY_NUM_TOKENS:
-            # Check for error in flow table structure
-            if readReceivers and numRead < numAdj:
-                raise Exception("Error in flow table at line %d, only %d of %d adjacent recievers read" % (numLines, numRead, numAdj))
-
-            # FlowDict uses a FlowTableKey as reference, adds newEntry and items as entries
-            newEntry = getFlowTableEntryFromArray(values)
-            newKey = rhessystypes.FQPatchID(patchID=newEntry.patchID, zoneID=newEntry.zoneID, hillID=newEntry.hillID)
-            flowDict[newKey] = [newEntry]
-            readReceivers = True
-            numRead = 0
-            numAdj = int(newEntry.numAdjacent)
-            currEntry = newKey
-        elif lv == FLOW_ENTRY_ITEM_NUM_TOKENS and readReceivers:
-            # Check for error in flow table structure
-            if numRead > numAdj:
-                raise Exception("Error in flow table at line %d, already read %d of %d adjacent" % (numLines, numRead, numAdj))
-            # See if we need to read the stream patch to which the road drains
-            if numRead == numAdj:
-                item = getFlowTableEntryRoadFromArray(values)
-            else:
-                item = FlowTableEntryReceiver(values[0], values[1], values[2], values[3])
-                numRead += 1
-            # Write item to flow table entry
-            flowDict[currEntry].append(item)
- 
-    flow.close()   
-    return flowDict
+    try:
+        for line in flow:
+            numLines += 1
+            line = line.strip()
+            values = line.split()
+            lv = len(values)
+            if lv == FLOW_ENTRY_NUM_TOKENS:
+                # Check for error in flow table structure
+                if readReceivers and numRead < numAdj:
+                    raise Exception("Error in flow table at line %d, only %d of %d adjacent recievers read" % (numLines, numRead, numAdj))
+                if currEntry is not None:
+                    yield currEntry, currItems
+
+                newEntry = getFlowTableEntryFromArray(values)
+                newKey = rhessystypes.FQPatchID(patchID=newEntry.patchID, zoneID=newEntry.zoneID, hillID=newEntry.hillID)
+                currItems = [newEntry]
+                readReceivers = True
+                numRead = 0
+                numAdj = int(newEntry.numAdjacent)
+                currEntry = newKey
+            elif lv == FLOW_ENTRY_ITEM_NUM_TOKENS and readReceivers:
+                # Check for error in flow table structure
+                if numRead > numAdj:
+                    raise Exception("Error in flow table at line %d, already read %d of %d adjacent" % (numLines, numRead, numAdj))
+                # See if we need to read the stream patch to which the road drains
+                if numRead == numAdj:
+                    item = getFlowTableEntryRoadFromArray(values)
+                else:
+                    item = FlowTableEntryReceiver(values[0], values[1], values[2], values[3])
+                    numRead += 1
+                # Write item to flow table entry
+                currItems.append(item)
+
+        if currEntry is not None:
+            yield currEntry, currItems
+    finally:
+        flow.close()
+
+def writeFlowtablePatch(changedEntries, patchOutfile, base=None, baseVersion=None):
+    """ @brief Write the changed entries of a flow table as a flow table patch: a
+        header line followed by one line per changed patch, each a JSON document
+        as written by dumpReceivers
+        
+        @param changedEntries Dict mapping rhessysweb.types.FQPatchID to the new list of
+        flow table items of the patch (as in the dict returned by readFlowtable)
+        @param patchOutfile String representing the absolute path of the patch to be written
+        @param base String naming the flow table the patch applies to
+        @param baseVersion String representing the version of the base flow table
+    """
+    patchOutdir = os.path.split(patchOutfile)[0]
+    if not os.access(patchOutdir, os.W_OK):
+        raise IOError("Unable to write to output directory %s\n" % (patchOutdir,) )
+    header = { 'format' : FLOW_PATCH_FORMAT, 'version' : FLOW_PATCH_VERSION, \
+               'base' : base, 'baseVersion' : baseVersion, 'numEntries' : len(changedEntries) }
+    with open(patchOutfile, 'w') as patchFile:
+        patchFile.write(json.dumps(header) + "\n")
+        for key, items in changedEntries.items():
+            patchFile.write(dumpReceivers(items) + "\n")
+
+def readFlowtablePatch(patchFile):
+    """ @brief Read a flow table patch written by writeFlowtablePatch
+    
+        @param patchFile String representing the absolute path of the patch
+        
+        @return Tuple (header, dict) where header is a dict holding 'base',
+        'baseVersion' and 'numEntries', and dict maps rhessysweb.types.FQPatchID
+        to the patch's new list of flow table items
+    """
+    entries = OrderedDict()
+    with open(patchFile, 'r') as patch:
+        header = json.loads(patch.readline())
+        if header.get('format') != FLOW_PATCH_FORMAT or header.get('version') != FLOW_PATCH_VERSION:
+            raise ValueError("%s is not a version %d flow table patch" % (patchFile, FLOW_PATCH_VERSION) )
+        for line in patch:
+            if not line.strip():
+                continue
+            items = loadReceivers(line)
+            entry = items[0]
+            key = rhessystypes.FQPatchID(patchID=entry.patchID, zoneID=entry.zoneID, hillID=entry.hillID)
+            entries[key] = items
+    if len(entries) != header['numEntries']:
+        raise ValueError("Flow table patch %s holds %d of %d entries" % \
+                         (patchFile, len(entries), header['numEntries']) )
+    return header, entries
+
+def applyFlowtablePatch(flowtable, patchFile, flowtableOutfile):
+    """ @brief Write a copy of a RHESSys flow table with a patch applied, streaming
+        the base table so that only the patch is held in memory
+    
+        @param flowtable String representing the absolute path of the base flow table
+        @param patchFile String representing the absolute path of a patch written by 
+        writeFlowtablePatch
+        @param flowtableOutfile String representing the absolute path of the flow table
+        to be written
+        
+        @raise KeyError if the patch changes patches not in the base table; no output
+        is left behind in that case
+    """
+    (header, changes) = readFlowtablePatch(patchFile)
+    flowtableOutdir = os.path.split(flowtableOutfile)[0]
+    if not os.access(flowtableOutdir, os.W_OK):
+        raise IOError("Unable to write to output directory %s\n" % (flowtableOutdir,) )
+    
+    applied = set()
+    try:
+        with open(flowtableOutfile, 'w') as flowFile:
+            flowFile.write("%8d" % (readFlowtableHeader(flowtable),) )
+            for key, items in iterFlowtable(flowtable):
+                if key in changes:
+                    items = changes[key]
+                    applied.add(key)
+                for item in items:
+                    flowFile.write(formatFlowtableItem(item))
+        missing = [ key for key in changes if key not in applied ]
+        if missing:
+            raise KeyError("Flow table %s has no patch %s" % (flowtable, missing[0]) )
+    except:
+        os.unlink(flowtableOutfile)
+        raise
 
 def getEntryForFlowtableKey(key, flowtable):
     """ @brief Get flow table entry for a given flow table key
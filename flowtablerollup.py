@@ -0,0 +1,123 @@
+"""@package flowtablerollup
+
+@brief Aggregates of flow table entries per basin, hillslope and zone: patch
+        count, total area and sums of elevation, from which mean and
+        area-weighted mean elevation follow.  Every aggregate is a sum, so
+        they are computed with one vectorized group-by over the whole table.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from flowtableio import iterFlowtable
+
+## Constants
+ROLLUP_BASIN = 'basin'
+ROLLUP_HILLSLOPE = 'hillslope'
+ROLLUP_ZONE = 'zone'
+ROLLUP_LEVELS = (ROLLUP_BASIN, ROLLUP_HILLSLOPE, ROLLUP_ZONE)
+# Entry fields identifying a group at each level; a flow table holds one basin
+ROLLUP_KEYS = { ROLLUP_BASIN : (), ROLLUP_HILLSLOPE : ('hillID',), ROLLUP_ZONE : ('hillID', 'zoneID') }
+ROLLUP_FIELDS = ('patchCount', 'area', 'zSum', 'zAreaSum')
+ENTRY_FIELDS = ('hillID', 'zoneID', 'area', 'z')
+
+def getEntryArrays(entries):
+    """ @brief Gather the fields of flow table entries needed for rollups
+
+        @param entries Iterable of flowtableio.FlowTableEntry
+
+        @return Dict mapping 'hillID', 'zoneID', 'area' and 'z' to NumPy arrays
+    """
+    columns = dict( (f, []) for f in ENTRY_FIELDS )
+    for entry in entries:
+        columns['hillID'].append(entry.hillID)
+        columns['zoneID'].append(entry.zoneID)
+        columns['area'].append(entry.area)
+        columns['z'].append(entry.z)
+    return dict( hillID=np.array(columns['hillID'], np.int64), zoneID=np.array(columns['zoneID'], np.int64),
+                 area=np.array(columns['area'], np.float64), z=np.array(columns['z'], np.float64) )
+
+def readFlowtableArrays(flowtable):
+    """ @brief Read the fields needed for rollups from every entry of a flow table
+        @param flowtable String representing the absolute path of the flow table
+        @return Dict as returned by getEntryArrays
+    """
+    return getEntryArrays(items[0] for key, items in iterFlowtable(flowtable))
+
+def getRollups(arrays, level):
+    """ @brief Aggregate entries per group of a level
+
+        @param arrays Dict as returned by getEntryArrays
+        @param level One of ROLLUP_LEVELS
+
+        @return Tuple (keys, rollups) where keys is a list of tuples of the key
+        fields of each group (the empty tuple for the basin), sorted, and
+        rollups an OrderedDict mapping each of ROLLUP_FIELDS to a NumPy array
+        aligned with keys
+    """
+    area = arrays['area']
+    z = arrays['z']
+    n = len(area)
+    weights = np.ones(n)
+    keyFields = ROLLUP_KEYS[level]
+
+    if n == 0:
+        return [], OrderedDict( (f, np.zeros(0)) for f in ROLLUP_FIELDS )
+    if not keyFields:
+        keys = [()]
+        groups = np.zeros(n, np.intp)
+    else:
+        columns = [arrays[f] for f in keyFields]
+        # lexsort sorts by its last key first
+        order = np.lexsort(columns[::-1])
+        sortedColumns = [c[order] for c in columns]
+        starts = np.ones(n, bool)
+        starts[1:] = np.any([c[1:] != c[:-1] for c in sortedColumns], axis=0)
+        groups = np.empty(n, np.intp)
+        groups[order] = np.cumsum(starts) - 1
+        keys = zip(*[c[starts].tolist() for c in sortedColumns])
+
+    numGroups = len(keys)
+    rollups = OrderedDict()
+    rollups['patchCount'] = np.bincount(groups, weights=weights, minlength=numGroups)
+    rollups['area'] = np.bincount(groups, weights=weights * area, minlength=numGroups)
+    rollups['zSum'] = np.bincount(groups, weights=weights * z, minlength=numGroups)
+    rollups['zAreaSum'] = np.bincount(groups, weights=weights * z * area, minlength=numGroups)
+    return keys, rollups
+
+def getMeans(rollups):
+    """ @brief Mean and area-weighted mean elevation from rollups
+        @return Tuple of NumPy arrays (zMean, zAreaMean), NaN for empty groups
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zMean = np.where(rollups['patchCount'] > 0, rollups['zSum'] / rollups['patchCount'], np.nan)
+        zAreaMean = np.where(rollups['area'] > 0, rollups['zAreaSum'] / rollups['area'], np.nan)
+    return zMean, zAreaMean
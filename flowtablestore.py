@@ -0,0 +1,131 @@
+"""@package flowtablestore
+
+@brief Redis-backed store of flow tables.  Each table is kept as a list of its
+        pickled fully qualified patch IDs, in file order, and a hash mapping those
+        keys to the patch's flow table entry and receivers as JSON (see
+        flowtableio.dumpReceivers), along with a version stamp.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import cPickle
+from uuid import uuid4
+
+import redis
+
+import flowtableio
+import metrics
+
+## Constants
+REDIS_DB = 15
+HASH_SUFFIX = '.hash'
+VERSION_SUFFIX = '.version'
+
+_connection = None
+
+def getConnection():
+    """ @brief Get the (shared) Redis connection holding flow tables """
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis(db=REDIS_DB)
+    return _connection
+
+def getPatchKey(fqPatchID):
+    """ @brief Get the key a patch is stored under """
+    return cPickle.dumps(fqPatchID)
+
+def loadFlowtable(name, path):
+    """ @brief Load a flow table file into the store, unless the loaded copy is
+        as recent as the file.  A changed file is read into scratch keys which
+        then replace the old copy in one step, so readers never see it half loaded.
+
+        @param name String representing the name of the flow table
+        @param path String representing the path of the flow table file
+    """
+    conn = getConnection()
+    version = '%.6f' % os.path.getmtime(path)
+    if conn.get(name + VERSION_SUFFIX) == version:
+        return
+    with metrics.timer('flowtable_read'):
+        flowTable = flowtableio.readFlowtable(path)
+    scratch = '%s.loading.%s' % (name, uuid4().hex)
+    pipe = conn.pipeline()
+    for fqPatchID, entry in flowTable.items():
+        key = getPatchKey(fqPatchID)
+        pipe.rpush(scratch, key)
+        pipe.hset(scratch + HASH_SUFFIX, key, flowtableio.dumpReceivers(entry))
+    pipe.execute()
+    pipe = conn.pipeline()
+    if flowTable:
+        pipe.rename(scratch, name)
+        pipe.rename(scratch + HASH_SUFFIX, name + HASH_SUFFIX)
+    else:
+        pipe.delete(name, name + HASH_SUFFIX)
+    pipe.set(name + VERSION_SUFFIX, version)
+    pipe.execute()
+
+def getFlowtableVersion(name):
+    """ @brief Get the version stamp of a loaded flow table
+        @return String, or None if the table is not loaded
+    """
+    return getConnection().get(name + VERSION_SUFFIX)
+
+def listPatches(name):
+    """ @brief List the patches of a flow table, in file order
+        @return List of pairs (FQPatchID, key)
+    """
+    conn = getConnection()
+    return [ (cPickle.loads(key), key) for key in conn.lrange(name, 0, conn.llen(name)) ]
+
+def getEntryJSON(name, fqPatchID):
+    """ @brief Get a patch's flow table entry and receivers as stored, without decoding
+
+        @param name String representing the name of the flow table
+        @param fqPatchID rhessystypes.FQPatchID, or a key as returned by listPatches
+
+        @return String of JSON as written by flowtableio.dumpReceivers, or None if
+        the patch is not in the table
+    """
+    key = fqPatchID if isinstance(fqPatchID, basestring) else getPatchKey(fqPatchID)
+    with metrics.timer('redis_hget'):
+        value = getConnection().hget(name + HASH_SUFFIX, key)
+    metrics.increment('redis_bytes_read', len(value or ''))
+    return value
+
+def getEntry(name, fqPatchID):
+    """ @brief Get a patch's flow table entry and receivers
+
+        @return List whose first element is the flowtableio.FlowTableEntry of the
+        patch, followed by its receivers (see flowtableio.loadReceivers)
+        @raise KeyError if the patch is not in the table
+    """
+    value = getEntryJSON(name, fqPatchID)
+    if value is None:
+        raise KeyError(fqPatchID)
+    return flowtableio.loadReceivers(value)
@@ -0,0 +1,261 @@
+"""@package grasscatalog
+
+@brief Catalog of the rasters of a GRASS mapset (and PERMANENT): names, cell
+        types, value ranges, resolution and modification stamps, read from the
+        mapset's files rather than by running g.list, r.info or r.info -r.
+        The catalog refreshes itself lazily, re-reading only rasters whose files
+        have changed.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import time
+import struct
+import threading
+from collections import namedtuple
+from collections import OrderedDict
+
+from rasterbackend import GRASS_RASTER_ELEMENTS, listGrassRasters
+
+## Constants
+DEFAULT_CHECK_INTERVAL = 1.0
+## Directories modified less than this many seconds before a scan may change again
+## without their modification time changing, on file systems with coarse timestamps
+STAMP_RESOLUTION = 1.0
+PERMANENT = 'PERMANENT'
+CELL = 'CELL'
+FCELL = 'FCELL'
+DCELL = 'DCELL'
+
+## Type definitions
+RasterInfo = namedtuple('RasterInfo', ['name', 'mapset', 'type', 'rows', 'cols', 'north', 'south', \
+                                       'east', 'west', 'nsres', 'ewres', 'min', 'max', 'stamp'], verbose=False)
+
+def getRasterStamp(mapsetPath, name):
+    """ @brief Get the modification stamp of a raster, i.e. the latest modification
+        time of its header and data files, or None if it has none in this mapset
+    """
+    mtimes = [ os.path.getmtime(os.path.join(mapsetPath, element, name)) \
+               for element in GRASS_RASTER_ELEMENTS \
+               if os.path.exists(os.path.join(mapsetPath, element, name)) ]
+    return max(mtimes) if mtimes else None
+
+def getElementStamps(mapsetPath):
+    """ @brief Get the modification times of the raster element directories of a
+        mapset, which change whenever GRASS writes (or removes) a raster, as GRASS
+        moves finished rasters into place
+
+        @return Tuple of floats, None for missing directories
+    """
+    return tuple( os.path.getmtime(os.path.join(mapsetPath, element)) \
+                  if os.path.isdir(os.path.join(mapsetPath, element)) else None \
+                  for element in GRASS_RASTER_ELEMENTS )
+
+def readCellHeader(path):
+    """ @brief Read a GRASS raster header (cellhd) file
+
+        @return Dict mapping header keys (e.g. 'north', 'rows', 'e-w resol') to strings
+    """
+    header = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if ':' in line:
+                (key, value) = line.split(':', 1)
+                header[key.strip()] = value.strip()
+    return header
+
+def readRange(mapsetPath, name, cellType):
+    """ @brief Read the range of a raster written by GRASS when the raster was
+        (re-)written, without scanning the data
+
+        @return Tuple (min, max); (None, None) if unknown or the raster is all null
+    """
+    miscPath = os.path.join(mapsetPath, 'cell_misc', name)
+    try:
+        if cellType == CELL:
+            with open(os.path.join(miscPath, 'range'), 'r') as f:
+                values = f.read().split()
+            if len(values) >= 2:
+                return (int(values[0]), int(values[1]))
+        else:
+            # Two XDR (big-endian) doubles
+            with open(os.path.join(miscPath, 'f_range'), 'rb') as f:
+                data = f.read(16)
+            if len(data) == 16:
+                return struct.unpack('>dd', data)
+    except (IOError, ValueError):
+        pass
+    return (None, None)
+
+def readRasterInfo(mapsetPath, name, mapset, stamp=None):
+    """ @brief Describe a raster from its header and support files
+
+        @param mapsetPath String representing the path of the mapset directory
+        @param name String representing the name of the raster
+        @param mapset String representing the name of the mapset
+        @param stamp Float representing the raster's modification stamp; read if None
+
+        @return RasterInfo
+    """
+    if stamp is None:
+        stamp = getRasterStamp(mapsetPath, name)
+    header = readCellHeader(os.path.join(mapsetPath, 'cellhd', name))
+
+    cellType = CELL
+    if os.path.exists(os.path.join(mapsetPath, 'fcell', name)):
+        cellType = FCELL
+        try:
+            with open(os.path.join(mapsetPath, 'cell_misc', name, 'f_format'), 'r') as f:
+                if 'double' in f.read():
+                    cellType = DCELL
+        except IOError:
+            pass
+    (rmin, rmax) = readRange(mapsetPath, name, cellType)
+
+    def number(key, convert=float):
+        try:
+            return convert(header[key])
+        except (KeyError, ValueError):
+            return None
+
+    return RasterInfo(name=name, mapset=mapset, type=cellType, \
+                      rows=number('rows', int), cols=number('cols', int), \
+                      north=number('north'), south=number('south'), \
+                      east=number('east'), west=number('west'), \
+                      nsres=number('n-s resol'), ewres=number('e-w resol'), \
+                      min=rmin, max=rmax, stamp=stamp)
+
+
+class RasterCatalog(object):
+    """ @brief Rasters visible from a GRASS mapset: those of the mapset itself, then
+        those of PERMANENT, in the order g.list reports them
+    """
+    def __init__(self, dbase, location, mapset, checkInterval=DEFAULT_CHECK_INTERVAL):
+        """ @param dbase String representing the path of the GRASS database
+            @param location String representing the GRASS location
+            @param mapset String representing the GRASS mapset
+            @param checkInterval Minimum number of seconds between checks of the
+            mapsets' files
+        """
+        self.dbase = dbase
+        self.location = location
+        self.mapset = mapset
+        self.checkInterval = checkInterval
+        self._lock = threading.Lock()
+        self._lastCheck = 0
+        self._elementStamps = None
+        self._rasters = OrderedDict()
+
+    @property
+    def mapsets(self):
+        """ @brief Mapsets searched, in order """
+        return [self.mapset] if self.mapset == PERMANENT else [self.mapset, PERMANENT]
+
+    def refresh(self, force=False):
+        """ @brief Re-read rasters whose modification stamp changed, add new rasters
+            and drop removed ones.  Does nothing if checked less than checkInterval
+            seconds ago (unless force is True) or if the mapsets' raster element
+            directories have not changed since the last scan.
+        """
+        now = time.time()
+        if not force and now - self._lastCheck < self.checkInterval:
+            return
+        with self._lock:
+            elementStamps = [ getElementStamps(os.path.join(self.dbase, self.location, mapset)) \
+                              for mapset in self.mapsets ]
+            if elementStamps == self._elementStamps:
+                self._lastCheck = now
+                return
+            # Directories modified too recently to tell later changes apart
+            # are scanned again next time
+            newest = max( [stamp for stamps in elementStamps for stamp in stamps if stamp] or [0] )
+            if now - newest < STAMP_RESOLUTION:
+                elementStamps = None
+            rasters = OrderedDict()
+            for mapset in self.mapsets:
+                mapsetPath = os.path.join(self.dbase, self.location, mapset)
+                for name in listGrassRasters(self.dbase, self.location, mapset):
+                    stamp = getRasterStamp(mapsetPath, name)
+                    info = self._rasters.get( (name, mapset) )
+                    if info is None or info.stamp != stamp:
+                        info = readRasterInfo(mapsetPath, name, mapset, stamp)
+                    rasters[(name, mapset)] = info
+            self._rasters = rasters
+            self._elementStamps = elementStamps
+            self._lastCheck = now
+
+    def rasters(self, mapset=None):
+        """ @brief Describe the rasters of the catalog
+            @param mapset String; if given, only rasters of this mapset are listed
+            @return List of RasterInfo
+        """
+        self.refresh()
+        return [ info for info in self._rasters.values() if mapset is None or info.mapset == mapset ]
+
+    def pairs(self):
+        """ @brief List rasters as g.list_pairs('rast') does
+            @return List of (name, mapset) tuples
+        """
+        return [ (info.name, info.mapset) for info in self.rasters() ]
+
+    def qualifiedNames(self):
+        """ @brief List rasters as g.list_strings('rast') does
+            @return List of 'name@mapset' strings
+        """
+        return [ '%s@%s' % (info.name, info.mapset) for info in self.rasters() ]
+
+    def get(self, name):
+        """ @brief Describe a raster, found as GRASS would: name@mapset, else the
+            mapset itself, else PERMANENT
+
+            @return RasterInfo
+            @raise KeyError if the raster does not exist
+        """
+        self.refresh()
+        if '@' in name:
+            (name, mapset) = name.split('@', 1)
+            return self._rasters[(name, mapset)]
+        for mapset in self.mapsets:
+            info = self._rasters.get( (name, mapset) )
+            if info is not None:
+                return info
+        raise KeyError(name)
+
+
+_catalogs = {}
+_catalogsLock = threading.Lock()
+
+def getRasterCatalog(dbase, location, mapset):
+    """ @brief Get the process-wide RasterCatalog for a mapset """
+    key = (dbase, location, mapset)
+    with _catalogsLock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = RasterCatalog(dbase, location, mapset)
+        return catalog
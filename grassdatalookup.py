@@ -40,14 +40,18 @@ from collections import OrderedDict
 from ctypes import *
 import importlib
 
+import numpy as np
 from osgeo import osr
 
 import rhessystypes
+import metrics
+from rasterbackend import GrassRasterBackend, getNullMask
+from rasterbackend import colToEasting, rowToNorthing, eastingToCol, northingToRow
 
 GRASSConfig = namedtuple('GRASSConfig', ['gisbase', 'dbase', 'location', 'mapset'], verbose=False)
 
 class GrassDataLookup(object): 
-    def __init__(self, grass_scripting=None, grass_lib=None, grass_config=None):
+    def __init__(self, grass_scripting=None, grass_lib=None, grass_config=None, backend=None):
         """ @brief Constructor for GrassDataLookup
         
             @param grass_scripting Previously imported grass.script (GRASS scripting API), 
@@ -55,19 +59,30 @@ class GrassDataLookup(object):
             @param grass_lib Previously imported grass.lib.gis (low-level GRASS API); if None
             grass.lib.gis will be imported
             @param grass_config GRASSConfig instance 
+            @param backend rasterbackend.RasterBackend used to read patch, zone and hillslope
+            maps; if None, maps are read through grass_lib.  If a backend is given, GRASS
+            APIs that were not passed in are not set up, so a backend alone is enough for
+            the lookup methods.
         """
         self.grass_config = grass_config
+        self.backend = backend
         
-        if not grass_scripting:
-            self.g = self._setupGrassScriptingEnvironment()
-        else:
+        if grass_scripting:
             self.g = grass_scripting
-            
-        if not grass_lib:
-            self.grass_lowlevel = self._setupGrassEnvironment()
-
+        elif backend:
+            self.g = None
         else:
+            self.g = self._setupGrassScriptingEnvironment()
+            
+        if grass_lib:
             self.grass_lowlevel = grass_lib 
+        elif backend:
+            self.grass_lowlevel = None
+        else:
+            self.grass_lowlevel = self._setupGrassEnvironment()
+        
+        if not self.backend:
+            self.backend = GrassRasterBackend(self.grass_lowlevel)
         
     def exportRasterAsGeoTIFF(self, rasterName, outputPath, outputFilename):
         """ @brief Export GRASS raster to GeoTIFF using GDAL
@@ -118,91 +133,38 @@ class GrassDataLookup(object):
         """
         coords = {}
         
-        # Set up GRASS environment
-        self.grass_lowlevel.G_gisinit('')
-        
         # Get the window so we can conver row,col to easting,northing
-        window = self.grass_lowlevel.Cell_head()
-        self.grass_lowlevel.G_get_window(byref(window))
-        numRows = self.grass_lowlevel.G_window_rows()
-        numCols = self.grass_lowlevel.G_window_cols()
-        
-        # Open patch map
-        patch = self.grass_lowlevel.G_find_cell2(patchMap, '')
-        patch = c_char_p(patch).value
-        patchType = self.grass_lowlevel.G_raster_map_type(patchMap, patch)
-        if patchType == 0: 
-            ptype = POINTER(c_int) 
-        elif patchType == 1: 
-            ptype = POINTER(c_float) 
-        elif patchType == 2: 
-            ptype = POINTER(c_double) 
-        patchFd = self.grass_lowlevel.G_open_cell_old(patchMap, patch) 
-        patchRast = self.grass_lowlevel.G_allocate_raster_buf(patchType)     
-        patchRast = cast(c_void_p(patchRast), ptype) 
-        
-        # Open zone map
-        zone = self.grass_lowlevel.G_find_cell2(zoneMap, '')
-        zone = c_char_p(zone).value
-        zoneType = self.grass_lowlevel.G_raster_map_type(zoneMap, zone)
-        if zoneType == 0: 
-            ptype = POINTER(c_int) 
-        elif zoneType == 1: 
-            ptype = POINTER(c_float) 
-        elif zoneType == 2: 
-            ptype = POINTER(c_double) 
-        zoneFd = self.grass_lowlevel.G_open_cell_old(zoneMap, zone) 
-        zoneRast = self.grass_lowlevel.G_allocate_raster_buf(zoneType)     
-        zoneRast = cast(c_void_p(zoneRast), ptype) 
-        
-        # Open hill map
-        hill = self.grass_lowlevel.G_find_cell2(hillslopeMap, '')
-        hill = c_char_p(hill).value
-        hillType = self.grass_lowlevel.G_raster_map_type(hillslopeMap, hill)
-        if hillType == 0: 
-            ptype = POINTER(c_int) 
-        elif hillType == 1: 
-            ptype = POINTER(c_float) 
-        elif hillType == 2: 
-            ptype = POINTER(c_double) 
-        hillFd = self.grass_lowlevel.G_open_cell_old(hillslopeMap, hill) 
-        hillRast = self.grass_lowlevel.G_allocate_raster_buf(hillType)     
-        hillRast = cast(c_void_p(hillRast), ptype) 
-#        print( "getCoordinatesForFQPatchIDs: patchIDs: %s" % (fqPatchIDs,) )
-         
-        for row in range(numRows):
-            # Get current row for each dataset
-            self.grass_lowlevel.G_get_raster_row(patchFd, patchRast, row, patchType)
-            self.grass_lowlevel.G_get_raster_row(zoneFd, zoneRast, row, zoneType)
-            self.grass_lowlevel.G_get_raster_row(hillFd, hillRast, row, hillType)
-        
-            for col in range(numCols):
-                for fqPatchID in fqPatchIDs:
-                    if patchRast[col] == fqPatchID.patchID and \
-                        zoneRast[col] == fqPatchID.zoneID and \
-                        hillRast[col] == fqPatchID.hillID:
-                        # Match found, get its coordinates
-                        easting = self.grass_lowlevel.G_col_to_easting(col + 0.5, byref(window))
-                        northing = self.grass_lowlevel.G_row_to_northing(row + 0.5, byref(window))
-                        try:
-                            coordList = coords[fqPatchID]
-                        except KeyError:
-                            coordList = []
-                            coords[fqPatchID] = coordList
-                        coordList.append(rhessystypes.getCoordinatePair(easting, northing))
-#                        print( "row: %d, col: %d; patch: %d, %d, %d; coordList: %s" % \
-#                               (row, col, fqPatchID.patchID, fqPatchID.zoneID, fqPatchID.hillID, coordList) )
-        
-        # Clean up
-        self.grass_lowlevel.G_close_cell(patchFd)
-        self.grass_lowlevel.G_free(patchRast)
-        self.grass_lowlevel.G_close_cell(zoneFd)
-        self.grass_lowlevel.G_free(zoneRast)
-        self.grass_lowlevel.G_close_cell(hillFd)
-        self.grass_lowlevel.G_free(hillRast)
+        window = self.backend.getWindow()
+        patchIDs = np.array([fqPatchID.patchID for fqPatchID in fqPatchIDs])
         
-#        os.environ['GIS_LOCK'] = ''
-#        os.unlink(os.environ['GISRC'])
+        for startRow, (patchRast, zoneRast, hillRast) in \
+                metrics.timedIter('raster_scan', self.backend.readBlocks([patchMap, zoneMap, hillslopeMap])):
+            metrics.increment('raster_bytes_read', patchRast.nbytes + zoneRast.nbytes + hillRast.nbytes)
+            # Only cells whose patch ID was asked for need the full comparison
+            candidates = np.flatnonzero(np.in1d(patchRast, patchIDs))
+            if not len(candidates):
+                continue
+            patches = patchRast.ravel()[candidates]
+            zones = zoneRast.ravel()[candidates]
+            hills = hillRast.ravel()[candidates]
+            
+            for fqPatchID in fqPatchIDs:
+                match = candidates[ (patches == fqPatchID.patchID) & \
+                                    (zones == fqPatchID.zoneID) & \
+                                    (hills == fqPatchID.hillID) ]
+                if not len(match):
+                    continue
+                # Match found, get its coordinates
+                (rows, cols) = np.divmod(match, window.cols)
+                eastings = colToEasting(window, cols)
+                northings = rowToNorthing(window, startRow + rows)
+                try:
+                    coordList = coords[fqPatchID]
+                except KeyError:
+                    coordList = []
+                    coords[fqPatchID] = coordList
+                coordList.extend( rhessystypes.getCoordinatePair(easting, northing) \
+                                  for (easting, northing) in zip(eastings, northings) )
         
         returnCoords = OrderedDict()
         for fqPatchID in fqPatchIDs:
@@ -249,24 +211,22 @@ class GrassDataLookup(object):
             @param zoneMap String representing the name of the zone map 
             @param hillslopeMap String representing the name of the hillslope map
             
-            @return FQPatchID
+            @return FQPatchID, or None if any of the maps is null at the coordinate
         """
         patchID = None
         zoneID = None
         hillID = None
         
         # Translate coordinates to row, col
-        window = self.grass_lowlevel.Cell_head()
-        self.grass_lowlevel.G_get_window(byref(window))
-        row = int( self.grass_lowlevel.G_northing_to_row(coordinate.northing, byref(window)) )
-        col = int( self.grass_lowlevel.G_easting_to_col(coordinate.easting, byref(window)) )
+        window = self.backend.getWindow()
+        row = int( northingToRow(window, coordinate.northing) )
+        col = int( eastingToCol(window, coordinate.easting) )
         #print("row: %d, col: %d\n" % (row, col) )
-        
-        # Get number of rows
-        numRows = self.grass_lowlevel.G_window_rows()
-        numCols = self.grass_lowlevel.G_window_cols()
-        #print("num rows: %d, num cols: %d\n" % (numRows, numCols) )
-        
+        if not (0 <= coordinate.northing - window.south < window.north - window.south) or \
+           not (0 <= coordinate.easting - window.west < window.east - window.west):
+            raise ValueError("Coordinate (%f, %f) lies outside the raster window" % \
+                             (coordinate.easting, coordinate.northing) )
+
         # Get patch ID
         patchID = self._getValueForCell(patchMap, row, col)
         #print("PatchID: %d\n" % (patchID,) )
@@ -279,12 +239,44 @@ class GrassDataLookup(object):
         hillID = self._getValueForCell(hillslopeMap, row, col)
         #print("HillID: %d\n" % (hillID,) )
         
-#        os.environ['GIS_LOCK'] = ''
-#        os.unlink(os.environ['GISRC'])
-        
+        if any(getNullMask(np.asarray(value)) for value in (patchID, zoneID, hillID)):
+            return None
         return rhessystypes.FQPatchID(patchID=int(patchID), zoneID=int(zoneID), hillID=int(hillID))
     
     
+    def getFQPatchIDsForCoordinates(self, coordinates, patchMap, zoneMap, hillslopeMap):
+        """ @brief Get the fully qualified IDs of the patches located at many coordinate
+            pairs, reading each raster row involved once per map
+        
+            @param coordinates List of rhessystypes.CoordinatePair
+            @param patchMap String representing the name of the patch map
+            @param zoneMap String representing the name of the zone map 
+            @param hillslopeMap String representing the name of the hillslope map
+            
+            @return List of FQPatchID, in the order of coordinates; None for coordinates
+            lying outside the raster window or where any of the maps is null
+        """
+        window = self.backend.getWindow()
+        eastings = np.array([c.easting for c in coordinates], dtype=np.float64)
+        northings = np.array([c.northing for c in coordinates], dtype=np.float64)
+        inside = (northings - window.south >= 0) & (northings - window.south < window.north - window.south) & \
+                 (eastings - window.west >= 0) & (eastings - window.west < window.east - window.west)
+        rows = northingToRow(window, northings[inside]).astype(np.int64)
+        cols = eastingToCol(window, eastings[inside]).astype(np.int64)
+        
+        patchIDs = self.backend.readCells(patchMap, rows, cols)
+        zoneIDs = self.backend.readCells(zoneMap, rows, cols)
+        hillIDs = self.backend.readCells(hillslopeMap, rows, cols)
+        
+        valid = ~(getNullMask(patchIDs) | getNullMask(zoneIDs) | getNullMask(hillIDs))
+        
+        fqPatchIDs = [None] * len(coordinates)
+        for (i, patchID, zoneID, hillID) in zip(np.flatnonzero(inside)[valid], patchIDs[valid],
+                                                zoneIDs[valid], hillIDs[valid]):
+            fqPatchIDs[i] = rhessystypes.FQPatchID(patchID=int(patchID), zoneID=int(zoneID), hillID=int(hillID))
+        return fqPatchIDs
+    
+    
     def _setupGrassScriptingEnvironment(self):
         """ @brief Set up GRASS environment for using GRASS scripting API from 
             Python (e.g. grass.script)
@@ -322,21 +314,4 @@ class GrassDataLookup(object):
         return grassRcFile.name
     
     def _getValueForCell(self, input, row, col):
-        mapset = self.grass_lowlevel.G_find_cell2(input, '')
-        mapset = c_char_p(mapset).value
-        data_type = self.grass_lowlevel.G_raster_map_type(input, mapset)
-        if data_type == 0: 
-            ptype = POINTER(c_int) 
-        elif data_type == 1: 
-            ptype = POINTER(c_float) 
-        elif data_type == 2: 
-            ptype = POINTER(c_double) 
-        infd = self.grass_lowlevel.G_open_cell_old(input, mapset) 
-        inrast = self.grass_lowlevel.G_allocate_raster_buf(data_type)     
-        inrast = cast(c_void_p(inrast), ptype) 
-        self.grass_lowlevel.G_get_raster_row(infd, inrast, row, data_type)
-        value = inrast[col]
-        self.grass_lowlevel.G_close_cell(infd)
-        self.grass_lowlevel.G_free(inrast)
-        
-        return value
+        return self.backend.readCell(input, row, col)
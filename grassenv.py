@@ -1,11 +1,76 @@
+import os
+import tempfile
+import threading
 import importlib
+from contextlib import contextmanager
 from django.conf import settings
 
+_lock = threading.Lock()
+_work_lock = threading.RLock()
+_current = None
+
+def use_grass_pool():
+    """True if GRASS work should go to pooled worker processes (see grasspool)
+    instead of this process.  Enable with settings.RHESSYSWEB_GRASS_POOL = True"""
+    return getattr(settings, 'RHESSYSWEB_GRASS_POOL', False)
+
+@contextmanager
+def grass_lock():
+    """Hold while doing GRASS work in this process from a thread other than the
+    request's, e.g. in a threaded Celery worker: init_grass switches a
+    process-wide mapset and the GRASS C library is not thread-safe.  Pooled
+    workers (see use_grass_pool) run in their own processes and need no lock."""
+    if use_grass_pool():
+        yield
+    else:
+        with _work_lock:
+            yield
+
+def _initializeGrassrc(dbase, location, mapset):
+    grassRcFile = tempfile.NamedTemporaryFile(prefix='grassrc-', delete=False)
+    grassRcContent = "GISDBASE: %s\nLOCATION_NAME: %s\nMAPSET: %s\n" % \
+        (dbase, location, mapset)
+    grassRcFile.write(grassRcContent)
+    return grassRcFile.name
+
+def init_grass(dbase, location, mapset):
+    """Set up GRASS in this process for a mapset and return (grass.script, grass.lib.gis).
+    The environment is only (re)initialized when the mapset differs from the one
+    set up last, rather than on every call."""
+    global _current
+    with _lock:
+        if 'GISRC' not in os.environ:
+            os.environ['LD_LIBRARY_PATH'] = ':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"])
+            os.putenv("LD_LIBRARY_PATH",':'.join([os.environ['LD_LIBRARY_PATH'], "/usr/lib/grass64/lib"]))
+            os.environ['DYLD_LIBRARY_PATH'] = os.path.join(settings.GISBASE, 'lib')
+            os.putenv("DYLD_LIBRARY_PATH", os.path.join(settings.GISBASE, "lib"))
+            os.environ['GIS_LOCK'] = str(os.getpid())
+            os.putenv('GIS_LOCK',str(os.getpid()))
+            os.environ['GISRC'] = _initializeGrassrc(dbase, location, mapset)
+            os.putenv('GISRC', os.environ['GISRC'])
+
+        if 'LOCATION_NAME' not in os.environ:
+            os.environ['LOCATION_NAME'] = location
+            os.putenv('LOCATION_NAME', location)
+
+        gsetup = importlib.import_module('grass.script.setup')
+        g = importlib.import_module("grass.script")
+        grass_lowlevel = importlib.import_module('grass.lib.gis')
+
+        if _current != (dbase, location, mapset):
+            grass_lowlevel.G_gisinit('')
+            gsetup.init(settings.GISBASE, dbase, location, mapset)
+            _current = (dbase, location, mapset)
+
+        return g, grass_lowlevel
+
 class GrassSession(object):
     def __init__(self, dbase, location, mapset):
-        self.g = importlib.import_module('grass.script')
-        self._gsetup = importlib.import_module('grass.script.setup')
-        self._gsetup.init(settings.GISBASE, dbase, location, mapset)
+        if use_grass_pool():
+            from grasspool import getPool, GrassScriptProxy
+            self.g = GrassScriptProxy(getPool().getMapsetWorker(dbase, location, mapset))
+        else:
+            self.g, _ = init_grass(dbase, location, mapset)
 
     def __enter__(self):
         return self.g
@@ -18,4 +83,3 @@ if __name__=='__main__':
         g.run_command('g.region', **{ 'n' : 4350605, 'w' : 349133, 'e' : 349659.5, 's' : 4350196 })
         g.run_command('r.out.tiff', flags='t', input='lulc_5m_roof', output='/tmp/out.tif')
         g.read_command('g.proj', flags='j')
-
@@ -0,0 +1,311 @@
+"""@package grasspool
+
+@brief Pool of long-lived GRASS worker processes.  Each worker is bound to one
+        GRASS database/location/mapset, initializes GRASS once when it starts,
+        and then serves GRASS scripting calls and raster reads over a pipe.
+        GRASS session state (GISRC, GIS_LOCK, LD_LIBRARY_PATH, G_gisinit) is
+        therefore private to each worker, so one web process can serve several
+        mapsets concurrently without mutating its own environment.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os, sys
+import atexit
+import tempfile
+import threading
+import traceback
+import importlib
+import multiprocessing
+from collections import OrderedDict
+
+from rasterbackend import RasterBackend
+import metrics
+
+## Constants
+DEFAULT_MAX_WORKERS = 8
+SHUTDOWN_TIMEOUT = 5
+
+class GrassWorkerError(Exception):
+    """ @brief Raised in the calling process when a call fails in a GRASS worker """
+    pass
+
+
+def _initializeGrassrc(dbase, location, mapset):
+    grassRcFile = tempfile.NamedTemporaryFile(prefix='grassrc-', delete=False)
+    grassRcContent = "GISDBASE: %s\nLOCATION_NAME: %s\nMAPSET: %s\n" % \
+        (dbase, location, mapset)
+    grassRcFile.write(grassRcContent)
+    grassRcFile.close()
+    return grassRcFile.name
+
+def _serve(conn, gisbase, dbase, location, mapset):
+    """ @brief Main loop of a worker process: set up GRASS once, then answer
+        requests of the form (method, args, kwargs) until None is received
+    """
+    os.environ['GISBASE'] = gisbase
+    libPath = os.path.join(gisbase, 'lib')
+    os.environ['LD_LIBRARY_PATH'] = ':'.join(filter(None, [os.environ.get('LD_LIBRARY_PATH'), libPath]))
+    os.environ['DYLD_LIBRARY_PATH'] = libPath
+    os.environ['GIS_LOCK'] = str(os.getpid())
+    os.environ['GISRC'] = gisrc = _initializeGrassrc(dbase, location, mapset)
+    os.environ['LOCATION_NAME'] = location
+    sys.path.append(os.path.join(gisbase, 'etc', 'python'))
+
+    from rasterbackend import GrassRasterBackend
+    try:
+        gsetup = importlib.import_module('grass.script.setup')
+        gsetup.init(gisbase, dbase, location, mapset)
+        g = importlib.import_module('grass.script')
+        grass_lowlevel = importlib.import_module('grass.lib.gis')
+        grass_lowlevel.G_gisinit('')
+        backend = GrassRasterBackend(grass_lowlevel)
+    except Exception:
+        conn.send( (False, traceback.format_exc()) )
+        return
+    conn.send( (True, None) )
+
+    def script(name, args, kwargs):
+        f = g
+        for part in name.split('.'):
+            f = getattr(f, part)
+        return f(*args, **kwargs)
+
+    handlers = {
+        'script' : script,
+        'window' : backend.getWindow,
+        'readRows' : backend.readRows,
+        'readCell' : lambda *args: backend.readCell(*args).item(),
+    }
+
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            (method, args, kwargs) = request
+            try:
+                conn.send( (True, handlers[method](*args, **kwargs)) )
+            except Exception:
+                conn.send( (False, traceback.format_exc()) )
+    finally:
+        os.unlink(gisrc)
+
+
+class GrassWorker(object):
+    """ @brief Handle on a worker process bound to one GRASS mapset.  Calls are
+        serialized; a worker serves one request at a time.
+    """
+    def __init__(self, gisbase, dbase, location, mapset):
+        self.key = (dbase, location, mapset)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, \
+                                                args=(child, gisbase, dbase, location, mapset))
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+        (ok, error) = self._conn.recv()
+        if not ok:
+            self._process.join(SHUTDOWN_TIMEOUT)
+            raise GrassWorkerError("Unable to start GRASS worker for %s:\n%s" % \
+                                   (os.path.join(*self.key), error) )
+
+    @property
+    def alive(self):
+        return not self._closed and self._process.is_alive()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def call(self, method, *args, **kwargs):
+        """ @brief Call a worker method ('script', 'window', 'readRows' or 'readCell')
+            @return The method's return value
+            @exception GrassWorkerError if the call raised in the worker
+        """
+        with self._lock, metrics.timer('grass_worker_' + method):
+            if self._closed:
+                raise GrassWorkerError("GRASS worker for %s was shut down" % (os.path.join(*self.key),) )
+            try:
+                self._conn.send( (method, args, kwargs) )
+                (ok, result) = self._conn.recv()
+            except (EOFError, IOError), e:
+                raise GrassWorkerError("GRASS worker for %s died: %s" % (os.path.join(*self.key), e) )
+        if not ok:
+            raise GrassWorkerError(result)
+        return result
+
+    def close(self):
+        """ @brief Ask the worker to exit, terminating it if it does not """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            try:
+                self._conn.send(None)
+            except (IOError, OSError):
+                pass
+            self._process.join(SHUTDOWN_TIMEOUT)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._conn.close()
+
+
+class MapsetWorker(object):
+    """ @brief Stand-in for the GrassWorker of a mapset that asks the pool for it on
+        every call, so that holders (drivers, proxies, backends) keep working after
+        the pool shuts the worker down to make room for others.  A call that finds
+        its worker shut down in the meantime is made once more on a new one.
+    """
+    def __init__(self, pool, dbase, location, mapset):
+        self.pool = pool
+        self.key = (dbase, location, mapset)
+
+    def call(self, method, *args, **kwargs):
+        """ @brief As GrassWorker.call """
+        worker = self.pool.getWorker(*self.key)
+        try:
+            return worker.call(method, *args, **kwargs)
+        except GrassWorkerError:
+            if not worker.closed:
+                raise
+        return self.pool.getWorker(*self.key).call(method, *args, **kwargs)
+
+
+class GrassScriptProxy(object):
+    """ @brief Stand-in for the grass.script module that forwards every call to a
+        GrassWorker, e.g. proxy.read_command('g.proj', flags='j') or
+        proxy.raster.list_pairs('rast')
+    """
+    def __init__(self, worker, name=None):
+        self._worker = worker
+        self._name = name
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return GrassScriptProxy(self._worker, name if not self._name else self._name + '.' + name)
+
+    def __call__(self, *args, **kwargs):
+        return self._worker.call('script', self._name, args, kwargs)
+
+
+class PooledRasterBackend(RasterBackend):
+    """ @brief RasterBackend reading maps through a GrassWorker, one call per block """
+    def __init__(self, worker):
+        self.worker = worker
+
+    def getWindow(self):
+        return self.worker.call('window')
+
+    def readRows(self, mapName, startRow, numRows):
+        return self.worker.call('readRows', mapName, startRow, numRows)
+
+    def readCell(self, mapName, row, col):
+        return self.worker.call('readCell', mapName, row, col)
+
+
+class GrassWorkerPool(object):
+    """ @brief Bounded set of GrassWorkers, one per mapset, started on first use.
+        When the pool is full the least recently used worker is shut down.
+    """
+    def __init__(self, gisbase, maxWorkers=DEFAULT_MAX_WORKERS):
+        self.gisbase = gisbase
+        self.maxWorkers = maxWorkers
+        self._workers = OrderedDict()
+        self._starting = {}
+        self._lock = threading.Lock()
+
+    def getWorker(self, dbase, location, mapset):
+        """ @brief Get the worker bound to a mapset, starting it if necessary.  Workers
+            are started outside the pool's lock, so a slow start only holds up
+            callers wanting the same mapset.
+            @return GrassWorker
+        """
+        key = (dbase, location, mapset)
+        while True:
+            with self._lock:
+                worker = self._workers.pop(key, None)
+                if worker is not None and worker.alive:
+                    self._workers[key] = worker
+                    return worker
+                started = self._starting.get(key)
+                if started is None:
+                    started = self._starting[key] = threading.Event()
+                    break
+            # Another caller is starting this mapset's worker; use it once ready
+            started.wait()
+
+        evicted = []
+        try:
+            worker = GrassWorker(self.gisbase, dbase, location, mapset)
+            with self._lock:
+                self._workers[key] = worker
+                while len(self._workers) > self.maxWorkers:
+                    evicted.append(self._workers.popitem(last=False)[1])
+        finally:
+            with self._lock:
+                del self._starting[key]
+            started.set()
+        for w in evicted:
+            w.close()
+        return worker
+
+    def getMapsetWorker(self, dbase, location, mapset):
+        """ @brief Get a MapsetWorker for a mapset, to hold on to instead of a GrassWorker """
+        return MapsetWorker(self, dbase, location, mapset)
+
+    def close(self):
+        """ @brief Shut down every worker in the pool """
+        with self._lock:
+            workers = self._workers.values()
+            self._workers = OrderedDict()
+        for w in workers:
+            w.close()
+
+
+_pool = None
+_poolLock = threading.Lock()
+
+def getPool():
+    """ @brief Get the process-wide GrassWorkerPool, sized by
+        settings.RHESSYSWEB_GRASS_POOL_SIZE
+    """
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            from django.conf import settings
+            _pool = GrassWorkerPool(settings.GISBASE, \
+                                    getattr(settings, 'RHESSYSWEB_GRASS_POOL_SIZE', DEFAULT_MAX_WORKERS))
+            atexit.register(_pool.close)
+        return _pool
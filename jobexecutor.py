@@ -0,0 +1,106 @@
+"""@package jobexecutor
+
+@brief Bookkeeping for blocking GRASS and GDAL work run as Celery tasks (see
+        tasks.py).  No more than a set number of jobs run at a time for any one
+        key (e.g. a GRASS environment), counted in Redis so that the limit holds
+        across worker processes.  Job status is Celery's, kept in its result
+        backend, so any process can answer a poll.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+from uuid import uuid4
+
+## Constants
+DEFAULT_PER_KEY_LIMIT = 2
+DEFAULT_SLOT_TTL = 3600
+INTERACTIVE_QUEUE = 'rhessysweb_interactive'
+BULK_QUEUE = 'rhessysweb_bulk'
+SLOTS_PREFIX = 'rhessysweb.jobs.slots.'
+## Deletes a slot only if it is still held by the given holder, in one step
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+## Job status for each Celery task state; Celery reports unknown tasks as PENDING
+CELERY_STATES = { 'PENDING' : PENDING, 'RECEIVED' : PENDING, 'RETRY' : PENDING, \
+                  'STARTED' : RUNNING, 'SUCCESS' : DONE, 'FAILURE' : FAILED, \
+                  'REVOKED' : CANCELLED }
+
+def getJobStatus(state):
+    """ @brief Get the job status for a Celery task state
+        @return String: PENDING, RUNNING, DONE, FAILED or CANCELLED
+    """
+    return CELERY_STATES.get(state, PENDING)
+
+
+class KeySlots(object):
+    """ @brief Counting semaphore per key, shared through Redis.  Each of the limit
+        slots of a key is a Redis key set (NX) to its holder with an expiry, so the
+        slots of a worker killed mid-job (e.g. at its time limit) come free again.
+    """
+    def __init__(self, conn, limit=DEFAULT_PER_KEY_LIMIT, prefix=SLOTS_PREFIX):
+        """ @param conn redis.Redis connection
+            @param limit Integer representing the number of holders a key may have
+            @param prefix String prefixed to the Redis keys of the slots
+        """
+        self.conn = conn
+        self.limit = limit
+        self.prefix = prefix
+
+    def _slotName(self, key, slot):
+        return '%s%s.%d' % (self.prefix, key, slot)
+
+    def acquire(self, key, ttl=DEFAULT_SLOT_TTL):
+        """ @brief Take a free slot of key without waiting
+
+            @param key String representing the key, e.g. 'env.3'
+            @param ttl Integer representing the number of seconds after which the
+            slot is freed if not released, at least the job's time limit
+
+            @return String identifying the slot taken, to pass to release, or None
+            if all slots of key are taken
+        """
+        holder = '%d-%s' % (os.getpid(), uuid4().hex)
+        for slot in xrange(self.limit):
+            name = self._slotName(key, slot)
+            if self.conn.set(name, holder, nx=True, ex=int(ttl)):
+                return '%s:%s' % (name, holder)
+        return None
+
+    def release(self, token):
+        """ @brief Free a slot taken by acquire, unless it expired and was taken again
+            @param token String returned by acquire
+        """
+        (name, holder) = token.rsplit(':', 1)
+        self.conn.eval(RELEASE_SCRIPT, 1, name, holder)
@@ -0,0 +1,226 @@
+"""@package metrics
+
+@brief Lightweight latency and throughput metrics for GRASS, Redis and raster
+        operations: counters and latency histograms kept per process, rendered
+        in the Prometheus text exposition format, plus per-request timings for
+        a Server-Timing header.  Collection is off until setEnabled(True); while
+        off, timers are a shared no-op and counters return immediately.
+
+        Nothing is shared between processes: each web or Celery worker process
+        counts only its own work, and renderPrometheus reports only the process
+        it runs in.  For figures covering a whole deployment, serve it from a
+        single (threaded) process, or scrape every process separately.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import re
+import time
+import threading
+import functools
+from collections import OrderedDict
+
+## Constants
+PREFIX = 'rhessysweb_'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+_enabled = False
+_lock = threading.Lock()
+_counters = OrderedDict()
+_histograms = OrderedDict()
+_local = threading.local()
+
+def setEnabled(enabled):
+    """ @brief Turn collection on or off for the process """
+    global _enabled
+    _enabled = bool(enabled)
+
+def isEnabled():
+    return _enabled
+
+def reset():
+    """ @brief Discard all collected metrics """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def increment(name, value=1):
+    """ @brief Add to a counter, e.g. calls, bytes read, cache hits or misses
+
+        @param name String representing the counter, e.g. 'pointcache_hits'
+        @param value Number to add
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """ @brief Record the duration of an operation in its latency histogram, and in
+        the timings of the current request if one is being timed
+
+        @param name String representing the operation, e.g. 'redis_hget'
+        @param seconds Float representing the duration
+    """
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = [ [0] * len(DEFAULT_BUCKETS), 0.0, 0 ]
+        (buckets, total, count) = histogram
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+        histogram[1] = total + seconds
+        histogram[2] = count + 1
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        (total, count) = timings.get(name, (0.0, 0))
+        timings[name] = (total + seconds, count + 1)
+
+
+class _Timer(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.time() - self.start)
+        return False
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name):
+    """ @brief Context manager timing the enclosed block as operation name
+
+        @code
+        with metrics.timer('grass_r_what'):
+            ...
+        @endcode
+    """
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+def timed(name):
+    """ @brief Decorator timing every call of a function as operation name """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def timedIter(name, iterable):
+    """ @brief Time the iteration over iterable (e.g. a generator reading raster
+        blocks) as a single operation, including the time spent by the consumer
+    """
+    if not _enabled:
+        return iterable
+    return _timedIter(name, iterable)
+
+def _timedIter(name, iterable):
+    with _Timer(name):
+        for item in iterable:
+            yield item
+
+def beginRequest():
+    """ @brief Start collecting the timings of the current thread's request """
+    _local.timings = OrderedDict()
+
+def endRequest():
+    """ @brief Stop collecting the timings of the current thread's request
+
+        @return OrderedDict mapping operation name to (total seconds, count), in
+        the order the operations first ran; empty if collection is off
+    """
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings or OrderedDict()
+
+def formatServerTiming(timings, total=None):
+    """ @brief Format request timings as the value of a Server-Timing header
+
+        @param timings OrderedDict as returned by endRequest
+        @param total Float representing the duration of the whole request in seconds
+
+        @return String, e.g. 'redis_hget;dur=0.412;desc="2 calls", total;dur=14.250'
+    """
+    entries = [ '%s;dur=%.3f;desc="%d call%s"' % (name, seconds * 1000.0, count, '' if count == 1 else 's') \
+                for name, (seconds, count) in timings.items() ]
+    if total is not None:
+        entries.append('total;dur=%.3f' % (total * 1000.0,))
+    return ', '.join(entries)
+
+def _metricName(name):
+    return PREFIX + INVALID_NAME_CHARS.sub('_', name)
+
+def renderPrometheus():
+    """ @brief Render all metrics of this process in the Prometheus text exposition
+        format (0.0.4)
+
+        @return String
+    """
+    with _lock:
+        counters = _counters.items()
+        histograms = [ (name, (list(h[0]), h[1], h[2])) for name, h in _histograms.items() ]
+
+    lines = []
+    for name, value in counters:
+        metric = _metricName(name) + '_total'
+        lines.append('# TYPE %s counter' % (metric,))
+        lines.append('%s %s' % (metric, repr(float(value))))
+    for name, (buckets, total, count) in histograms:
+        metric = _metricName(name) + '_seconds'
+        lines.append('# TYPE %s histogram' % (metric,))
+        cumulative = 0
+        for bound, n in zip(DEFAULT_BUCKETS, buckets):
+            cumulative += n
+            lines.append('%s_bucket{le="%s"} %d' % (metric, repr(bound), cumulative))
+        lines.append('%s_bucket{le="+Inf"} %d' % (metric, count))
+        lines.append('%s_sum %s' % (metric, repr(total)))
+        lines.append('%s_count %d' % (metric, count))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,25 @@
+import time
+from django.conf import settings
+
+from RHESSysWeb import metrics
+
+class ServerTimingMiddleware(object):
+    """Time GRASS, Redis and raster operations per request and report them in a
+    Server-Timing header.  Collection is enabled by settings.RHESSYSWEB_METRICS;
+    when it is off the middleware does nothing."""
+
+    def __init__(self):
+        metrics.setEnabled(getattr(settings, 'RHESSYSWEB_METRICS', False))
+
+    def process_request(self, request):
+        if metrics.isEnabled():
+            request._rhessysweb_start = time.time()
+            metrics.beginRequest()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_rhessysweb_start', None)
+        if start is not None:
+            total = time.time() - start
+            metrics.observe('request', total)
+            response['Server-Timing'] = metrics.formatServerTiming(metrics.endRequest(), total)
+        return response
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'FlowTable'
+        db.create_table(u'RHESSysWeb_flowtable', (
+            (u'page_ptr', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['pages.Page'], unique=True, primary_key=True)),
+            ('flow_table', self.gf('django.db.models.fields.files.FileField')(max_length=100, null=True, blank=True)),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['FlowTable'])
+
+        # Adding model 'WorldVars'
+        db.create_table(u'RHESSysWeb_worldvars', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('key', self.gf('django.db.models.fields.CharField')(max_length=255, db_index=True)),
+            ('value', self.gf('django.db.models.fields.TextField')()),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['WorldVars'])
+
+        # Adding model 'World'
+        db.create_table(u'RHESSysWeb_world', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('environment', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.GrassEnvironment'], null=True, blank=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['World'])
+
+        # Adding M2M table for field vars on 'World'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_world_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('world', models.ForeignKey(orm[u'RHESSysWeb.world'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['world_id', 'worldvars_id'])
+
+        # Adding model 'Basin'
+        db.create_table(u'RHESSysWeb_basin', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('point', self.gf('django.contrib.gis.db.models.fields.PointField')()),
+            ('world', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.World'])),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['Basin'])
+
+        # Adding M2M table for field vars on 'Basin'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_basin_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('basin', models.ForeignKey(orm[u'RHESSysWeb.basin'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['basin_id', 'worldvars_id'])
+
+        # Adding model 'Hillslope'
+        db.create_table(u'RHESSysWeb_hillslope', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('point', self.gf('django.contrib.gis.db.models.fields.PointField')()),
+            ('basin', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Basin'])),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['Hillslope'])
+
+        # Adding M2M table for field vars on 'Hillslope'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_hillslope_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('hillslope', models.ForeignKey(orm[u'RHESSysWeb.hillslope'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['hillslope_id', 'worldvars_id'])
+
+        # Adding model 'Zone'
+        db.create_table(u'RHESSysWeb_zone', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('point', self.gf('django.contrib.gis.db.models.fields.PointField')()),
+            ('hillslope', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Hillslope'])),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['Zone'])
+
+        # Adding M2M table for field vars on 'Zone'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_zone_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('zone', models.ForeignKey(orm[u'RHESSysWeb.zone'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['zone_id', 'worldvars_id'])
+
+        # Adding model 'Patch'
+        db.create_table(u'RHESSysWeb_patch', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('point', self.gf('django.contrib.gis.db.models.fields.PointField')()),
+            ('zone', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Zone'])),
+            ('hillslope', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Hillslope'])),
+            ('basin', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Basin'])),
+            ('world', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.World'])),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['Patch'])
+
+        # Adding M2M table for field vars on 'Patch'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_patch_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('patch', models.ForeignKey(orm[u'RHESSysWeb.patch'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['patch_id', 'worldvars_id'])
+
+        # Adding model 'Stratum'
+        db.create_table(u'RHESSysWeb_stratum', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('rhessys_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('patch', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Patch'])),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['Stratum'])
+
+        # Adding M2M table for field vars on 'Stratum'
+        m2m_table_name = db.shorten_name(u'RHESSysWeb_stratum_vars')
+        db.create_table(m2m_table_name, (
+            ('id', models.AutoField(verbose_name='ID', primary_key=True, auto_created=True)),
+            ('stratum', models.ForeignKey(orm[u'RHESSysWeb.stratum'], null=False)),
+            ('worldvars', models.ForeignKey(orm[u'RHESSysWeb.worldvars'], null=False))
+        ))
+        db.create_unique(m2m_table_name, ['stratum_id', 'worldvars_id'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'Stratum'
+        db.delete_table(u'RHESSysWeb_stratum')
+
+        # Removing M2M table for field vars on 'Stratum'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_stratum_vars'))
+
+        # Deleting model 'Patch'
+        db.delete_table(u'RHESSysWeb_patch')
+
+        # Removing M2M table for field vars on 'Patch'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_patch_vars'))
+
+        # Deleting model 'Zone'
+        db.delete_table(u'RHESSysWeb_zone')
+
+        # Removing M2M table for field vars on 'Zone'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_zone_vars'))
+
+        # Deleting model 'Hillslope'
+        db.delete_table(u'RHESSysWeb_hillslope')
+
+        # Removing M2M table for field vars on 'Hillslope'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_hillslope_vars'))
+
+        # Deleting model 'Basin'
+        db.delete_table(u'RHESSysWeb_basin')
+
+        # Removing M2M table for field vars on 'Basin'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_basin_vars'))
+
+        # Deleting model 'World'
+        db.delete_table(u'RHESSysWeb_world')
+
+        # Removing M2M table for field vars on 'World'
+        db.delete_table(db.shorten_name(u'RHESSysWeb_world_vars'))
+
+        # Deleting model 'WorldVars'
+        db.delete_table(u'RHESSysWeb_worldvars')
+
+        # Deleting model 'FlowTable'
+        db.delete_table(u'RHESSysWeb_flowtable')
+
+
+    models = {
+        u'RHESSysWeb.basin': {
+            'Meta': {'object_name': 'Basin'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'}),
+            'world': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.World']"})
+        },
+        u'RHESSysWeb.flowtable': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'FlowTable', '_ormbases': [u'pages.Page']},
+            'flow_table': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            u'page_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['pages.Page']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        u'RHESSysWeb.grassenvironment': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'GrassEnvironment', '_ormbases': [u'pages.Page']},
+            'content': ('mezzanine.core.fields.RichTextField', [], {}),
+            'database': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'default_raster': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'flow_table': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'hillslope_map': ('django.db.models.fields.CharField', [], {'default': "'hillslope'", 'max_length': '255'}),
+            'location': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'map_set': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'patch_map': ('django.db.models.fields.CharField', [], {'default': "'patch_5m'", 'max_length': '255'}),
+            u'page_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['pages.Page']", 'unique': 'True', 'primary_key': 'True'}),
+            'zone_map': ('django.db.models.fields.CharField', [], {'default': "'hillslope'", 'max_length': '255'})
+        },
+        u'RHESSysWeb.hillslope': {
+            'Meta': {'object_name': 'Hillslope'},
+            'basin': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Basin']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'})
+        },
+        u'RHESSysWeb.patch': {
+            'Meta': {'object_name': 'Patch'},
+            'basin': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Basin']"}),
+            'hillslope': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Hillslope']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'}),
+            'world': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.World']"}),
+            'zone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Zone']"})
+        },
+        u'RHESSysWeb.stratum': {
+            'Meta': {'object_name': 'Stratum'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'patch': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Patch']"}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'})
+        },
+        u'RHESSysWeb.world': {
+            'Meta': {'object_name': 'World'},
+            'environment': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.GrassEnvironment']", 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'})
+        },
+        u'RHESSysWeb.worldvars': {
+            'Meta': {'object_name': 'WorldVars'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'key': ('django.db.models.fields.CharField', [], {'max_length': '255', 'db_index': 'True'}),
+            'value': ('django.db.models.fields.TextField', [], {})
+        },
+        u'RHESSysWeb.zone': {
+            'Meta': {'object_name': 'Zone'},
+            'hillslope': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Hillslope']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'vars': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['RHESSysWeb.WorldVars']", 'symmetrical': 'False'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'generic.assignedkeyword': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'AssignedKeyword'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'keyword': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'assignments'", 'to': u"orm['generic.Keyword']"}),
+            'object_pk': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'generic.keyword': {
+            'Meta': {'object_name': 'Keyword'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'})
+        },
+        u'pages.page': {
+            'Meta': {'ordering': "('titles',)", 'object_name': 'Page'},
+            '_meta_title': ('django.db.models.fields.CharField', [], {'max_length': '500', 'null': 'True', 'blank': 'True'}),
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_model': ('django.db.models.fields.CharField', [], {'max_length': '50', 'null': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'expiry_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'gen_description': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_menus': ('mezzanine.pages.fields.MenusField', [], {'default': '(1, 2, 3)', 'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'in_sitemap': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'keywords': ('mezzanine.generic.fields.KeywordsField', [], {'object_id_field': "'object_pk'", 'to': u"orm['generic.AssignedKeyword']", 'frozen_by_south': 'True'}),
+            'keywords_string': ('django.db.models.fields.CharField', [], {'max_length': '500', 'blank': 'True'}),
+            'login_required': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'children'", 'null': 'True', 'to': u"orm['pages.Page']"}),
+            'publish_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'short_url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'null': 'True', 'blank': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'titles': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'null': 'True'})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "('domain',)", 'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['RHESSysWeb']
\ No newline at end of file
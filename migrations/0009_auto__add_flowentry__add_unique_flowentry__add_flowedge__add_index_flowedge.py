@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'FlowEntry'
+        db.create_table(u'RHESSysWeb_flowentry', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('flow_table', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('patch', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['RHESSysWeb.Patch'], null=True, blank=True)),
+            ('rhessys_patch_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('rhessys_zone_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('rhessys_hill_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('x', self.gf('django.db.models.fields.FloatField')()),
+            ('y', self.gf('django.db.models.fields.FloatField')()),
+            ('z', self.gf('django.db.models.fields.FloatField')()),
+            ('accum_area', self.gf('django.db.models.fields.FloatField')()),
+            ('area', self.gf('django.db.models.fields.IntegerField')()),
+            ('land_type', self.gf('django.db.models.fields.IntegerField')()),
+            ('total_gamma', self.gf('django.db.models.fields.FloatField')()),
+            ('num_adjacent', self.gf('django.db.models.fields.IntegerField')()),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['FlowEntry'])
+
+        # Adding unique constraint on 'FlowEntry', fields ['flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id']
+        db.create_unique(u'RHESSysWeb_flowentry', ['flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id'])
+
+        # Adding model 'FlowEdge'
+        db.create_table(u'RHESSysWeb_flowedge', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('source', self.gf('django.db.models.fields.related.ForeignKey')(related_name='outflows', to=orm['RHESSysWeb.FlowEntry'])),
+            ('target', self.gf('django.db.models.fields.related.ForeignKey')(blank=True, related_name='inflows', null=True, to=orm['RHESSysWeb.FlowEntry'])),
+            ('position', self.gf('django.db.models.fields.IntegerField')()),
+            ('rhessys_patch_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('rhessys_zone_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('rhessys_hill_id', self.gf('django.db.models.fields.IntegerField')()),
+            ('gamma', self.gf('django.db.models.fields.FloatField')(null=True, blank=True)),
+            ('road_width', self.gf('django.db.models.fields.FloatField')(null=True, blank=True)),
+        ))
+        db.send_create_signal(u'RHESSysWeb', ['FlowEdge'])
+
+        # Adding index on 'FlowEdge', fields ['source', 'target']
+        db.create_index(u'RHESSysWeb_flowedge', ['source_id', 'target_id'])
+
+        # Adding index on 'FlowEdge', fields ['target', 'source']
+        db.create_index(u'RHESSysWeb_flowedge', ['target_id', 'source_id'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'FlowEdge', fields ['target', 'source']
+        db.delete_index(u'RHESSysWeb_flowedge', ['target_id', 'source_id'])
+
+        # Removing index on 'FlowEdge', fields ['source', 'target']
+        db.delete_index(u'RHESSysWeb_flowedge', ['source_id', 'target_id'])
+
+        # Deleting model 'FlowEdge'
+        db.delete_table(u'RHESSysWeb_flowedge')
+
+        # Removing unique constraint on 'FlowEntry', fields ['flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id']
+        db.delete_unique(u'RHESSysWeb_flowentry', ['flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id'])
+
+        # Deleting model 'FlowEntry'
+        db.delete_table(u'RHESSysWeb_flowentry')
+
+
+    models = {
+        u'RHESSysWeb.basin': {
+            'Meta': {'object_name': 'Basin'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'world': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.World']"})
+        },
+        u'RHESSysWeb.flowedge': {
+            'Meta': {'object_name': 'FlowEdge', 'index_together': "[('source', 'target'), ('target', 'source')]"},
+            'gamma': ('django.db.models.fields.FloatField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'position': ('django.db.models.fields.IntegerField', [], {}),
+            'rhessys_hill_id': ('django.db.models.fields.IntegerField', [], {}),
+            'rhessys_patch_id': ('django.db.models.fields.IntegerField', [], {}),
+            'rhessys_zone_id': ('django.db.models.fields.IntegerField', [], {}),
+            'road_width': ('django.db.models.fields.FloatField', [], {'null': 'True', 'blank': 'True'}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'outflows'", 'to': u"orm['RHESSysWeb.FlowEntry']"}),
+            'target': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'inflows'", 'null': 'True', 'to': u"orm['RHESSysWeb.FlowEntry']"})
+        },
+        u'RHESSysWeb.flowentry': {
+            'Meta': {'unique_together': "(('flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id'),)", 'object_name': 'FlowEntry'},
+            'accum_area': ('django.db.models.fields.FloatField', [], {}),
+            'area': ('django.db.models.fields.IntegerField', [], {}),
+            'flow_table': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'land_type': ('django.db.models.fields.IntegerField', [], {}),
+            'num_adjacent': ('django.db.models.fields.IntegerField', [], {}),
+            'patch': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Patch']", 'null': 'True', 'blank': 'True'}),
+            'rhessys_hill_id': ('django.db.models.fields.IntegerField', [], {}),
+            'rhessys_patch_id': ('django.db.models.fields.IntegerField', [], {}),
+            'rhessys_zone_id': ('django.db.models.fields.IntegerField', [], {}),
+            'total_gamma': ('django.db.models.fields.FloatField', [], {}),
+            'x': ('django.db.models.fields.FloatField', [], {}),
+            'y': ('django.db.models.fields.FloatField', [], {}),
+            'z': ('django.db.models.fields.FloatField', [], {})
+        },
+        u'RHESSysWeb.flowtable': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'FlowTable', '_ormbases': [u'pages.Page']},
+            'flow_table': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            u'page_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['pages.Page']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        u'RHESSysWeb.grassenvironment': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'GrassEnvironment', '_ormbases': [u'pages.Page']},
+            'content': ('mezzanine.core.fields.RichTextField', [], {}),
+            'database': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'default_raster': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True', 'blank': 'True'}),
+            'flow_table': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'hillslope_map': ('django.db.models.fields.CharField', [], {'default': "'hillslope'", 'max_length': '255'}),
+            'location': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'map_set': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'patch_map': ('django.db.models.fields.CharField', [], {'default': "'patch_5m'", 'max_length': '255'}),
+            u'page_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['pages.Page']", 'unique': 'True', 'primary_key': 'True'}),
+            'zone_map': ('django.db.models.fields.CharField', [], {'default': "'hillslope'", 'max_length': '255'})
+        },
+        u'RHESSysWeb.hillslope': {
+            'Meta': {'object_name': 'Hillslope'},
+            'basin': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Basin']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'RHESSysWeb.patch': {
+            'Meta': {'object_name': 'Patch', 'index_together': "[('zone', 'id'), ('hillslope', 'id'), ('basin', 'id'), ('world', 'id'), ('world', 'rhessys_id')]"},
+            'basin': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Basin']"}),
+            'hillslope': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Hillslope']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {}),
+            'world': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.World']"}),
+            'zone': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Zone']"})
+        },
+        u'RHESSysWeb.rollup': {
+            'Meta': {'unique_together': "(('flow_table', 'level', 'hill_id', 'zone_id'),)", 'object_name': 'Rollup'},
+            'area': ('django.db.models.fields.FloatField', [], {}),
+            'flow_table': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'hill_id': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'level': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'patch_count': ('django.db.models.fields.IntegerField', [], {}),
+            'version': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'z_area_sum': ('django.db.models.fields.FloatField', [], {}),
+            'z_sum': ('django.db.models.fields.FloatField', [], {}),
+            'zone_id': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'RHESSysWeb.stratum': {
+            'Meta': {'object_name': 'Stratum'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'patch': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Patch']"}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'RHESSysWeb.world': {
+            'Meta': {'object_name': 'World'},
+            'environment': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.GrassEnvironment']", 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'RHESSysWeb.zone': {
+            'Meta': {'object_name': 'Zone'},
+            'hillslope': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['RHESSysWeb.Hillslope']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'point': ('django.contrib.gis.db.models.fields.PointField', [], {}),
+            'rhessys_id': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'generic.assignedkeyword': {
+            'Meta': {'ordering': "('_order',)", 'object_name': 'AssignedKeyword'},
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'keyword': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'assignments'", 'to': u"orm['generic.Keyword']"}),
+            'object_pk': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'generic.keyword': {
+            'Meta': {'object_name': 'Keyword'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'})
+        },
+        u'pages.page': {
+            'Meta': {'ordering': "('titles',)", 'object_name': 'Page'},
+            '_meta_title': ('django.db.models.fields.CharField', [], {'max_length': '500', 'null': 'True', 'blank': 'True'}),
+            '_order': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'content_model': ('django.db.models.fields.CharField', [], {'max_length': '50', 'null': 'True'}),
+            'description': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'expiry_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'gen_description': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'in_menus': ('mezzanine.pages.fields.MenusField', [], {'default': '(1, 2, 3)', 'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'in_sitemap': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'keywords': ('mezzanine.generic.fields.KeywordsField', [], {'object_id_field': "'object_pk'", 'to': u"orm['generic.AssignedKeyword']", 'frozen_by_south': 'True'}),
+            'keywords_string': ('django.db.models.fields.CharField', [], {'max_length': '500', 'blank': 'True'}),
+            'login_required': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'children'", 'null': 'True', 'to': u"orm['pages.Page']"}),
+            'publish_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'short_url': ('django.db.models.fields.URLField', [], {'max_length': '200', 'null': 'True', 'blank': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']"}),
+            'slug': ('django.db.models.fields.CharField', [], {'max_length': '2000', 'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '500'}),
+            'titles': ('django.db.models.fields.CharField', [], {'max_length': '1000', 'null': 'True'})
+        },
+        u'sites.site': {
+            'Meta': {'ordering': "('domain',)", 'object_name': 'Site', 'db_table': "'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        }
+    }
+
+    complete_apps = ['RHESSysWeb']
\ No newline at end of file
@@ -1,6 +1,15 @@
 #from django.db import models
 from django.contrib.gis.db import models
 from mezzanine.pages.models import Page, RichText
+from django.contrib.gis.db.models.query import GeoQuerySet
+from django.contrib.gis.geos import Polygon
+from django.conf import settings
+from django.db.models.signals import post_delete
+import numpy as np
+import shutil
+import os
+
+from RHESSysWeb.statestore import StateColumns, getStateDirectory, getWorldStateDirectory
 
 class GrassEnvironment(Page, RichText):
     database = models.CharField(max_length=255)
@@ -8,38 +17,200 @@ class GrassEnvironment(Page, RichText):
     map_set = models.CharField(max_length=255)
     default_raster = models.CharField(max_length=255, null=True, blank=True)
     flow_table = models.FileField(upload_to='rhessysweb', null=True, blank=True) # RHESSys specific.  move later.
+    patch_map = models.CharField(max_length=255, default='patch_5m')
+    zone_map = models.CharField(max_length=255, default='hillslope')
+    hillslope_map = models.CharField(max_length=255, default='hillslope')
 
 class FlowTable(Page):
     flow_table = models.FileField(upload_to='rhessysweb', null=True, blank=True) # RHESSys specific.  move later.
 
-class WorldVars(models.Model):
-    key = models.CharField(max_length=255, db_index=True)
-    value = models.TextField()
-    
-class Stratum(models.Model):
-    vars = models.ManyToMany(WorldVars)
-    
-class Patch(models.Model):
-    vars = models.ManyToMany(WorldVars)
+def get_state_root():
+    """Directory holding the state variables of every world, column-wise (see
+    statestore); settings.RHESSYSWEB_STATE_DIR or rhessysweb/state in MEDIA_ROOT."""
+    return getattr(settings, 'RHESSYSWEB_STATE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'rhessysweb', 'state')
+
+# The hierarchy of a RHESSys worldfile; see worldimport.import_worldfile.
+# rhessys_id is the ID of the block in the worldfile.  State variables are not
+# stored in the database but as columns per level of each world; see
+# World.read_state.
+class World(models.Model):
+    name = models.CharField(max_length=255)
+    environment = models.ForeignKey(GrassEnvironment, null=True, blank=True)
+    rhessys_id = models.IntegerField()
+
+    def state(self, level):
+        """statestore.StateColumns of the world's blocks at a level, e.g. 'patch'."""
+        return StateColumns(getStateDirectory(get_state_root(), self.pk, level))
+
+    def read_state(self, level, names, ids=None):
+        """State variables of many blocks of a level in one read, as a dict of
+        NumPy arrays aligned with ids (primary keys, e.g. of the patches of a
+        hillslope), or with all the level's blocks in primary key order."""
+        return self.state(level).read(names, ids)
+
+def _remove_world_state(sender, instance, **kwargs):
+    # State columns live outside the database; drop them with their world
+    shutil.rmtree(getWorldStateDirectory(get_state_root(), instance.pk), ignore_errors=True)
+
+post_delete.connect(_remove_world_state, sender=World, dispatch_uid='rhessysweb_world_state_delete')
+
+class Basin(models.Model):
+    rhessys_id = models.IntegerField()
     point = models.PointField()
-    zone = models.ForeignKey(Zone)
-    hillslope = models.ForeignKey(Hillslope)
-    basin = models.ForeignKey(Basin)
     world = models.ForeignKey(World)
-    
+
+    objects = models.GeoManager()
+
+class Hillslope(models.Model):
+    rhessys_id = models.IntegerField()
+    point = models.PointField()
+    basin = models.ForeignKey(Basin)
+
+    objects = models.GeoManager()
+
 class Zone(models.Model):
-    vars = models.ManyToMany(WorldVars)
+    rhessys_id = models.IntegerField()
     point = models.PointField()
     hillslope = models.ForeignKey(Hillslope)
 
-class Hillslope(models.Model):
-    vars = models.ManyToMany(WorldVars)
+    objects = models.GeoManager()
+
+class PatchQuerySet(GeoQuerySet):
+    """Patch queries served by an index: the spatial index on point, or the
+    (zone|hillslope|basin|world, id) indexes, which the copies of a patch's
+    ancestors' keys on Patch make single table lookups."""
+
+    def in_bbox(self, xmin, ymin, xmax, ymax, srid):
+        """Patches whose point falls in a box given in the coordinates of srid;
+        there is no default, as worlds are imported in their own projection."""
+        bbox = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+        bbox.srid = srid
+        return self.filter(point__bboverlaps=bbox)
+
+    def in_polygon(self, polygon):
+        return self.filter(point__intersects=polygon)
+
+    def in_zone(self, zone):
+        return self.filter(zone=zone)
+
+    def in_hillslope(self, hillslope):
+        return self.filter(hillslope=hillslope)
+
+    def in_basin(self, basin):
+        return self.filter(basin=basin)
+
+    def in_world(self, world):
+        return self.filter(world=world)
+
+    def ids(self):
+        """Primary keys of the patches in ascending order, as a NumPy int64 array
+        (e.g. for World.read_state)."""
+        return np.fromiter(self.order_by('id').values_list('id', flat=True).iterator(), dtype=np.int64)
+
+class PatchManager(models.GeoManager):
+    def get_query_set(self):
+        return PatchQuerySet(self.model, using=self._db)
+
+    def in_bbox(self, xmin, ymin, xmax, ymax, srid):
+        return self.get_query_set().in_bbox(xmin, ymin, xmax, ymax, srid)
+
+    def in_polygon(self, polygon):
+        return self.get_query_set().in_polygon(polygon)
+
+    def in_zone(self, zone):
+        return self.get_query_set().in_zone(zone)
+
+    def in_hillslope(self, hillslope):
+        return self.get_query_set().in_hillslope(hillslope)
+
+    def in_basin(self, basin):
+        return self.get_query_set().in_basin(basin)
+
+    def in_world(self, world):
+        return self.get_query_set().in_world(world)
+
+class Patch(models.Model):
+    rhessys_id = models.IntegerField()
     point = models.PointField()
+    # Copies of the ancestors' keys, so hierarchy queries need no joins
+    zone = models.ForeignKey(Zone)
+    hillslope = models.ForeignKey(Hillslope)
     basin = models.ForeignKey(Basin)
-    
-class Basin(models.Model):
-    vars = models.ManyToMany(WorldVars)
-    point = models.PointField()
     world = models.ForeignKey(World)
-    
-class World(models.Model):
\ No newline at end of file
+
+    objects = PatchManager()
+
+    class Meta:
+        index_together = [('zone', 'id'), ('hillslope', 'id'), ('basin', 'id'), ('world', 'id'), ('world', 'rhessys_id')]
+
+class Stratum(models.Model):
+    rhessys_id = models.IntegerField()
+    patch = models.ForeignKey(Patch)
+
+class Rollup(models.Model):
+    """Aggregates of a flow table's entries for its basin, one of its hillslopes
+    (hill_id) or one of its zones (hill_id, zone_id); see rollups."""
+    flow_table = models.CharField(max_length=255)
+    level = models.CharField(max_length=16)
+    hill_id = models.IntegerField(null=True, blank=True)
+    zone_id = models.IntegerField(null=True, blank=True)
+    patch_count = models.IntegerField()
+    area = models.FloatField()
+    z_sum = models.FloatField()
+    z_area_sum = models.FloatField()
+    version = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = (('flow_table', 'level', 'hill_id', 'zone_id'),)
+
+    @property
+    def z_mean(self):
+        return self.z_sum / self.patch_count if self.patch_count else None
+
+    @property
+    def z_area_mean(self):
+        return self.z_area_sum / self.area if self.area else None
+
+# A flow table in the database; see flowgraph.  Entries are keyed by the
+# RHESSys IDs of their patch and linked to the Patch if the flow table was
+# loaded for a world.
+class FlowEntry(models.Model):
+    flow_table = models.CharField(max_length=255)
+    patch = models.ForeignKey(Patch, null=True, blank=True)
+    rhessys_patch_id = models.IntegerField()
+    rhessys_zone_id = models.IntegerField()
+    rhessys_hill_id = models.IntegerField()
+    x = models.FloatField()
+    y = models.FloatField()
+    z = models.FloatField()
+    accum_area = models.FloatField()
+    area = models.IntegerField()
+    land_type = models.IntegerField()
+    total_gamma = models.FloatField()
+    num_adjacent = models.IntegerField()
+
+    class Meta:
+        unique_together = (('flow_table', 'rhessys_hill_id', 'rhessys_zone_id', 'rhessys_patch_id'),)
+
+# An edge of the flow graph: the share (gamma) of an entry's outflow going to a
+# receiver, or for a road patch the stream patch its road drains to
+# (road_width).  target is None if the receiver is not in the flow table.
+class FlowEdge(models.Model):
+    source = models.ForeignKey(FlowEntry, related_name='outflows')
+    target = models.ForeignKey(FlowEntry, related_name='inflows', null=True, blank=True)
+    position = models.IntegerField()
+    rhessys_patch_id = models.IntegerField()
+    rhessys_zone_id = models.IntegerField()
+    rhessys_hill_id = models.IntegerField()
+    gamma = models.FloatField(null=True, blank=True)
+    road_width = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        index_together = [('source', 'target'), ('target', 'source')]
+
+# The version of a flow table's file last loaded into the flow graph (FlowEntry
+# and FlowEdge), and the world its entries were linked to; see flowgraph.
+class FlowGraph(models.Model):
+    flow_table = models.CharField(max_length=255, unique=True)
+    version = models.CharField(max_length=32)
+    world = models.ForeignKey(World, null=True, blank=True)
@@ -0,0 +1,218 @@
+"""@package outputio
+
+@brief Streaming reader for RHESSys simulation output (basin, hillslope, zone,
+        patch and stratum daily, monthly and yearly text files).  Files are
+        read a chunk of rows at a time into typed NumPy record arrays, keeping
+        only the requested columns and the rows within a date range, so
+        multi-gigabyte outputs can be summarized without being loaded whole.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import itertools
+
+import numpy as np
+
+import metrics
+
+## Constants
+DEFAULT_CHUNK_ROWS = 65536
+DATE_COLUMNS = ('year', 'month', 'day')
+INTEGER_COLUMNS = frozenset(DATE_COLUMNS + ('basinID', 'hillID', 'zoneID', 'patchID', 'stratumID', 'ID'))
+
+def readOutputHeader(outfile):
+    """ @brief Read the column names of a RHESSys output file
+        @param outfile String representing the path of the file, or an open file
+        positioned at its start
+        @return List of strings representing the column names, in file order
+    """
+    if hasattr(outfile, 'readline'):
+        return outfile.readline().split()
+    with open(outfile, 'r') as f:
+        return f.readline().split()
+
+def getDates(batch):
+    """ @brief Dates of the rows of a batch read from a daily, monthly or yearly file
+        @param batch NumPy record array as returned by OutputReader, including its
+        date columns
+        @return NumPy datetime64[D] array; monthly and yearly rows fall on the first
+        day of their month or year
+    """
+    names = batch.dtype.names
+    dates = (batch['year'] - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+    if 'month' in names:
+        dates = dates + (batch['month'] - 1).astype('timedelta64[M]')
+    dates = dates.astype('datetime64[D]')
+    if 'day' in names:
+        dates = dates + (batch['day'] - 1).astype('timedelta64[D]')
+    return dates
+
+
+class OutputReader(object):
+    """ @brief Iterate over a RHESSys output file in chunks of rows.  Each chunk is
+        a NumPy record array with one field per projected column: date and ID
+        columns as int64, state and flux columns as dtype.  Rows are assumed to
+        be in date order, as RHESSys writes them, so chunks wholly before start
+        are skipped without being parsed and reading stops after end.
+    """
+    def __init__(self, outfile, columns=None, start=None, end=None, chunkRows=DEFAULT_CHUNK_ROWS,
+                 dtype=np.float64):
+        """ @param outfile String representing the path of the file, or an open file
+            positioned at its start
+            @param columns List of strings representing the columns to read, in the
+            order wanted; None for every column
+            @param start datetime.date of the first row to read, None for no bound;
+            compared at the resolution of the file (e.g. by month for monthly files)
+            @param end datetime.date of the last row to read, None for no bound
+            @param chunkRows Integer representing the number of rows parsed at a time
+            @param dtype NumPy type of the non-integer columns
+
+            @raise ValueError if a requested column is not in the file, or a date range
+            is given for a file without dates
+        """
+        if hasattr(outfile, 'readline'):
+            self.file = outfile
+            self._ownsFile = False
+        else:
+            self.file = open(outfile, 'r')
+            self._ownsFile = True
+        self.names = self.file.readline().split()
+        self.lineNumber = 1
+        if not self.names:
+            self.close()
+            raise ValueError("Output file has no header")
+
+        self.columns = list(columns) if columns is not None else list(self.names)
+        unknown = [c for c in self.columns if c not in self.names]
+        if unknown:
+            self.close()
+            raise ValueError("Columns %s not in output file" % (', '.join(unknown),))
+        self.indices = [self.names.index(c) for c in self.columns]
+        self.dtype = np.dtype([(c, np.int64 if c in INTEGER_COLUMNS else dtype) for c in self.columns])
+
+        # Dates compare as integers, e.g. 20010315 for daily files and 200103 for
+        # monthly ones
+        self.dateIndices = [self.names.index(c) for c in DATE_COLUMNS if c in self.names]
+        if (start is not None or end is not None) and DATE_COLUMNS[0] not in self.names:
+            self.close()
+            raise ValueError("Output file has no year column to filter dates by")
+        self.startKey = self._getDateKey(start) if start is not None else None
+        self.endKey = self._getDateKey(end) if end is not None else None
+        self.chunkRows = chunkRows
+
+    def _getDateKey(self, date):
+        parts = (date.year, date.month, date.day)[:len(self.dateIndices)]
+        return reduce(lambda key, part: key * 100 + part, parts, 0)
+
+    def _getRowKeys(self, table):
+        keys = np.zeros(len(table), dtype=np.int64)
+        for i in self.dateIndices:
+            keys = keys * 100 + table[:, i].astype(np.int64)
+        return keys
+
+    def _getLineKey(self, line):
+        tokens = line.split()
+        return reduce(lambda key, i: key * 100 + int(float(tokens[i])), self.dateIndices, 0)
+
+    def _parse(self, lines):
+        """ @brief Parse lines into a 2D float64 array of every column """
+        rows = [l for l in lines if l.strip()]
+        ncols = len(self.names)
+        values = np.fromstring(''.join(rows), dtype=np.float64, sep=' ')
+        if values.size != len(rows) * ncols:
+            # fromstring stops at the first bad token; find the line it is on
+            for offset, line in enumerate(lines):
+                tokens = line.split()
+                try:
+                    map(float, tokens)
+                except ValueError:
+                    tokens = None
+                if line.strip() and (tokens is None or len(tokens) != ncols):
+                    break
+            raise ValueError("Error in output file at line %d, expected %d numeric columns" %
+                             (self.lineNumber - len(lines) + offset + 1, ncols))
+        return values.reshape(len(rows), ncols)
+
+    def __iter__(self):
+        """ @return Iterator over NumPy record arrays of at most chunkRows rows;
+            chunks left empty by the date range are not yielded
+        """
+        while True:
+            lines = list(itertools.islice(self.file, self.chunkRows))
+            if not lines:
+                return
+            self.lineNumber += len(lines)
+
+            if self.startKey is not None or self.endKey is not None:
+                rows = [l for l in lines if l.strip()]
+                if not rows:
+                    continue
+                if self.startKey is not None and self._getLineKey(rows[-1]) < self.startKey:
+                    metrics.increment('output_rows_skipped', len(rows))
+                    continue
+                if self.endKey is not None and self._getLineKey(rows[0]) > self.endKey:
+                    return
+
+            table = self._parse(lines)
+            metrics.increment('output_rows_read', len(table))
+            if self.startKey is not None or self.endKey is not None:
+                keys = self._getRowKeys(table)
+                mask = np.ones(len(table), dtype=bool)
+                if self.startKey is not None:
+                    mask &= keys >= self.startKey
+                if self.endKey is not None:
+                    mask &= keys <= self.endKey
+                table = table[mask]
+
+            if len(table):
+                batch = np.empty(len(table), dtype=self.dtype)
+                for c, i in zip(self.columns, self.indices):
+                    batch[c] = table[:, i]
+                yield batch
+
+    def close(self):
+        if self._ownsFile:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def readOutput(outfile, columns=None, start=None, end=None, chunkRows=DEFAULT_CHUNK_ROWS, dtype=np.float64):
+    """ @brief Read the selected columns and date range of a RHESSys output file
+        into one NumPy record array; see OutputReader
+    """
+    with OutputReader(outfile, columns, start, end, chunkRows, dtype) as reader:
+        batches = list(reader)
+        if not batches:
+            return np.empty(0, dtype=reader.dtype)
+        return np.concatenate(batches)
@@ -0,0 +1,20 @@
+import os
+from django.conf import settings
+from mezzanine.pages.page_processors import processor_for
+
+from RHESSysWeb.models import GrassEnvironment
+from RHESSysWeb.rollups import get_rollups
+from RHESSysWeb.flowtablerollup import ROLLUP_BASIN, ROLLUP_HILLSLOPE
+
+@processor_for(GrassEnvironment)
+def basin_overview(request, page):
+    """The basin and hillslope rollups of the environment's flow table, for its
+    overview page."""
+    env = page.grassenvironment
+    if not env.flow_table:
+        return {}
+    rollups = list(get_rollups(env.flow_table.name, os.path.join(settings.MEDIA_ROOT, env.flow_table.name)))
+    return dict(
+        basin=([r for r in rollups if r.level == ROLLUP_BASIN] or [None])[0],
+        hillslopes=[r for r in rollups if r.level == ROLLUP_HILLSLOPE],
+    )
@@ -0,0 +1,171 @@
+"""@package patchgeometry
+
+@brief Build compact GeoJSON geometries for patches from the coordinates of
+        their cells: one MultiPoint or dissolved Polygon per patch instead of
+        one Point feature per cell.  Geometries can be generalized for a web map
+        zoom level and coordinates are rounded to the precision that zoom level
+        can show, which keeps responses small and byte-for-byte repeatable.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import json
+import math
+
+import numpy as np
+from osgeo import ogr
+
+from coordtransform import transformPoints
+
+## Constants
+GEOMETRY_CELLS = 'cells'
+GEOMETRY_MULTIPOINT = 'multipoint'
+GEOMETRY_POLYGON = 'polygon'
+GEOMETRY_MODES = (GEOMETRY_CELLS, GEOMETRY_MULTIPOINT, GEOMETRY_POLYGON)
+# Ground resolution of a web map tile pixel at zoom level 0, in meters
+METERS_PER_PIXEL_ZOOM_0 = 156543.03392804097
+METERS_PER_DEGREE = 111319.49
+DEFAULT_PRECISION_GEOGRAPHIC = 6
+DEFAULT_PRECISION_PROJECTED = 2
+
+def getMetersPerPixel(zoom):
+    """ @brief Get the ground resolution of a web map pixel at a zoom level """
+    return METERS_PER_PIXEL_ZOOM_0 / (2 ** zoom)
+
+def getCoordinatePrecision(t_srs, zoom=None):
+    """ @brief Get the number of decimal places needed for coordinates in a spatial
+        reference system to resolve one pixel at a zoom level
+
+        @param t_srs osgeo.osr.SpatialReference of the coordinates
+        @param zoom Integer web map zoom level; if None, the precision resolves
+        centimeters (projected) or about a decimeter (geographic)
+
+        @return Integer
+    """
+    geographic = bool(t_srs.IsGeographic())
+    if zoom is None:
+        return DEFAULT_PRECISION_GEOGRAPHIC if geographic else DEFAULT_PRECISION_PROJECTED
+    unitsPerPixel = getMetersPerPixel(zoom)
+    if geographic:
+        unitsPerPixel /= METERS_PER_DEGREE
+    return max(0, int(math.ceil(-math.log10(unitsPerPixel))))
+
+def roundCoordinates(coordinates, precision):
+    """ @brief Round the coordinates of a GeoJSON geometry, recursively
+
+        @param coordinates Coordinate, or (nested) list of coordinates
+        @param precision Integer number of decimal places
+
+        @return Coordinates as nested lists of floats
+    """
+    if len(coordinates) and isinstance(coordinates[0], (int, long, float)):
+        return [ round(c, precision) for c in coordinates[:2] ]
+    return [ roundCoordinates(c, precision) for c in coordinates ]
+
+def snapCells(pairs, cellSize, zoom=None):
+    """ @brief Generalize patch cells to the pixel size of a zoom level, keeping one
+        point per occupied pixel
+
+        @param pairs List of rhessystypes.CoordinatePair of cell centers
+        @param cellSize Float representing the raster resolution, in map units
+        (assumed to be meters)
+        @param zoom Integer web map zoom level; if None, or if a pixel is no larger
+        than a cell, pairs are returned unchanged
+
+        @return NumPy array of shape (n, 2) of eastings and northings
+    """
+    points = np.array( [ (p.easting, p.northing) for p in pairs ], dtype=np.float64 ).reshape(-1, 2)
+    if zoom is None:
+        return points
+    pixel = getMetersPerPixel(zoom)
+    if pixel <= cellSize or not len(points):
+        return points
+    pixels = np.floor(points / pixel).astype(np.int64)
+    pixels = pixels[ np.lexsort( (pixels[:, 1], pixels[:, 0]) ) ]
+    first = np.ones(len(pixels), dtype=bool)
+    first[1:] = np.any(pixels[1:] != pixels[:-1], axis=1)
+    return (pixels[first] + 0.5) * pixel
+
+def getPatchMultiPoint(crx, pairs, cellSize, zoom=None, precision=DEFAULT_PRECISION_PROJECTED):
+    """ @brief Build a GeoJSON MultiPoint of the cells of a patch
+
+        @param crx osgeo.osr.CoordinateTransformation from the raster's to the
+        output spatial reference system
+        @param pairs List of rhessystypes.CoordinatePair of cell centers
+        @param cellSize Float representing the raster resolution, in map units
+        @param zoom Integer web map zoom level used to generalize the cells
+        @param precision Integer number of decimal places of output coordinates
+
+        @return Dict representing the GeoJSON geometry
+    """
+    points = transformPoints(crx, [ tuple(p) for p in snapCells(pairs, cellSize, zoom) ])
+    coordinates = []
+    seen = set()
+    for point in roundCoordinates(points, precision):
+        # Generalized cells may round to the same coordinate
+        key = tuple(point)
+        if key not in seen:
+            seen.add(key)
+            coordinates.append(point)
+    return { "type" : "MultiPoint", "coordinates" : coordinates }
+
+def getPatchPolygon(crx, pairs, nsres, ewres, zoom=None, precision=DEFAULT_PRECISION_PROJECTED):
+    """ @brief Build a GeoJSON (Multi)Polygon outlining the cells of a patch
+
+        @param crx osgeo.osr.CoordinateTransformation from the raster's to the
+        output spatial reference system
+        @param pairs List of rhessystypes.CoordinatePair of cell centers
+        @param nsres Float representing the north-south raster resolution
+        @param ewres Float representing the east-west raster resolution
+        @param zoom Integer web map zoom level; the outline is simplified to within
+        half a pixel at this zoom level
+        @param precision Integer number of decimal places of output coordinates
+
+        @return Dict representing the GeoJSON geometry
+    """
+    (halfNS, halfEW) = (nsres / 2.0, ewres / 2.0)
+    cells = ogr.Geometry(ogr.wkbMultiPolygon)
+    for p in pairs:
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        ring.AddPoint_2D(p.easting - halfEW, p.northing - halfNS)
+        ring.AddPoint_2D(p.easting + halfEW, p.northing - halfNS)
+        ring.AddPoint_2D(p.easting + halfEW, p.northing + halfNS)
+        ring.AddPoint_2D(p.easting - halfEW, p.northing + halfNS)
+        ring.AddPoint_2D(p.easting - halfEW, p.northing - halfNS)
+        cell = ogr.Geometry(ogr.wkbPolygon)
+        cell.AddGeometry(ring)
+        cells.AddGeometry(cell)
+
+    outline = cells.UnionCascaded()
+    if zoom is not None:
+        outline = outline.SimplifyPreserveTopology(getMetersPerPixel(zoom) / 2.0)
+    outline.Transform(crx)
+
+    geometry = json.loads(outline.ExportToJson())
+    geometry['coordinates'] = roundCoordinates(geometry['coordinates'], precision)
+    return geometry
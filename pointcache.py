@@ -0,0 +1,149 @@
+"""@package pointcache
+
+@brief Bounded, least-recently-used cache of point query results.  Queries are
+        keyed by the raster cell they fall in rather than the exact coordinate,
+        so every click within a cell shares one entry.  Results are stored
+        pickled, so callers always get their own copy.  Entries can be tagged
+        (e.g. with the patches a result describes) and invalidated by tag;
+        invalidation only reaches the current process, so keys must also
+        include the version of the data a result was computed from.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import threading
+import cPickle
+from collections import OrderedDict
+
+from rasterbackend import northingToRow, eastingToCol
+import metrics
+
+## Constants
+DEFAULT_MAX_ENTRIES = 1024
+
+def getCellForCoordinates(window, easting, northing):
+    """ @brief Snap a coordinate to the raster cell containing it
+
+        @param window rasterbackend.RasterWindow
+        @param easting Float
+        @param northing Float
+
+        @return Tuple (row, col) of integers; may lie outside the window
+    """
+    return ( int(northingToRow(window, northing) // 1), int(eastingToCol(window, easting) // 1) )
+
+
+class PointCache(object):
+    """ @brief Thread-safe LRU mapping of query keys to results """
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES):
+        """ @param maxEntries Integer representing the number of results to keep """
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """ @brief Look up a result, marking it as recently used
+            @return A copy of the cached result, or None
+        """
+        with self._lock:
+            try:
+                (value, tags) = self._entries.pop(key)
+            except KeyError:
+                metrics.increment('pointcache_misses')
+                return None
+            self._entries[key] = (value, tags)
+        metrics.increment('pointcache_hits')
+        return cPickle.loads(value)
+
+    def put(self, key, value, namespace=None, tags=()):
+        """ @brief Cache a result, evicting the least recently used if full
+
+            @param key Hashable query key; it should include everything the result
+            depends on, such as the data version and output spatial reference system
+            @param value Picklable result; later changes to it do not affect the cache
+            @param namespace Hashable grouping the tags, e.g. the flow table name
+            @param tags Iterable of hashables, e.g. rhessystypes.FQPatchID of the
+            patches the result describes
+        """
+        tags = frozenset( (namespace, tag) for tag in tags )
+        value = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxEntries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, namespace, tag):
+        """ @brief Drop every result tagged with tag in namespace
+            @return Integer representing the number of results dropped
+        """
+        with self._lock:
+            keys = self._tags.get( (namespace, tag), set() ).copy()
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        (_, tags) = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+_cache = None
+_cacheLock = threading.Lock()
+
+def getPointCache(maxEntries=None):
+    """ @brief Get the process-wide PointCache
+
+        @param maxEntries Integer representing the number of results to keep; if
+        None, the cache keeps its current bound (DEFAULT_MAX_ENTRIES when created)
+    """
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            _cache = PointCache(maxEntries or DEFAULT_MAX_ENTRIES)
+        elif maxEntries is not None:
+            _cache.maxEntries = maxEntries
+        return _cache
@@ -0,0 +1,176 @@
+"""@package profiling
+
+@brief Opt-in profiling of individual calls.  A call is run under cProfile and
+        its statistics written to a named .prof file (readable with pstats or
+        snakeviz), next to a .json file describing the call: its name,
+        parameters, timing, host and process, and any metadata supplied by the
+        caller such as the GRASS environment.  A rate limit bounds how many
+        calls are profiled, so enabling profiling cannot overload the site;
+        calls over the limit simply run unprofiled.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import re
+import json
+import time
+import socket
+import cProfile
+import threading
+from uuid import uuid4
+from collections import deque
+
+## Constants
+DEFAULT_MAX_CALLS = 10
+DEFAULT_INTERVAL = 60
+DEFAULT_MAX_CONCURRENT = 1
+PROFILE_SUFFIX = '.prof'
+METADATA_SUFFIX = '.json'
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_.-]')
+
+
+class RateLimiter(object):
+    """ @brief Admit at most maxCalls calls per interval seconds, and at most
+        maxConcurrent at a time
+    """
+    def __init__(self, maxCalls=DEFAULT_MAX_CALLS, interval=DEFAULT_INTERVAL, maxConcurrent=DEFAULT_MAX_CONCURRENT):
+        self.maxCalls = maxCalls
+        self.interval = interval
+        self.maxConcurrent = maxConcurrent
+        self._lock = threading.Lock()
+        self._started = deque()
+        self._running = 0
+
+    def acquire(self, now=None):
+        """ @brief Try to admit a call; release must be called when it finishes
+            @param now Float representing the current time, for testing
+            @return True if the call is admitted, False if over the limit
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._started and self._started[0] <= now - self.interval:
+                self._started.popleft()
+            if len(self._started) >= self.maxCalls or self._running >= self.maxConcurrent:
+                return False
+            self._started.append(now)
+            self._running += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+
+
+class Profiler(object):
+    """ @brief Write profiles of rate limited calls to a directory """
+
+    def __init__(self, root, limiter=None):
+        """ @param root String representing the output directory; created if missing
+            @param limiter RateLimiter; defaults to DEFAULT_MAX_CALLS per DEFAULT_INTERVAL
+        """
+        self.root = root
+        self.limiter = limiter or RateLimiter()
+        if not os.path.exists(root):
+            try:
+                os.makedirs(root)
+            except OSError:
+                if not os.path.isdir(root):
+                    raise
+
+    def getProfileName(self, name, started):
+        """ @brief Base name of the files for a profile of call name started at started """
+        return '%s-%s-%s' % (time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)),
+                             INVALID_NAME_CHARS.sub('_', name), uuid4().hex[:8])
+
+    def call(self, name, metadata, func, *args, **kwargs):
+        """ @brief Call func, profiling it if the rate limit allows
+
+            @param name String naming the call, e.g. 'flowtable.get_data_for_point'
+            @param metadata Dictionary of JSON-serializable values to record with
+            the profile, e.g. the GRASS database, location and mapset
+            @param func Callable to profile; its positional and keyword arguments
+            follow and are recorded (as their repr) with the profile
+
+            @return The result of func.  Exceptions raised by func are recorded
+            with the profile and re-raised.
+        """
+        if not self.limiter.acquire():
+            return func(*args, **kwargs)
+        try:
+            profile = cProfile.Profile()
+            started = time.time()
+            clock = time.clock()
+            error = None
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            except Exception, e:
+                error = '%s: %s' % (type(e).__name__, e)
+                raise
+            finally:
+                self._write(name, metadata, profile, args, kwargs, started,
+                            time.time() - started, time.clock() - clock, error)
+        finally:
+            self.limiter.release()
+
+    def _write(self, name, metadata, profile, args, kwargs, started, duration, cpu, error):
+        base = os.path.join(self.root, self.getProfileName(name, started))
+        profile.dump_stats(base + PROFILE_SUFFIX)
+        info = {
+            'name' : name,
+            'started' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started)),
+            'duration' : duration,
+            'cpu' : cpu,
+            'host' : socket.gethostname(),
+            'pid' : os.getpid(),
+            'thread' : threading.current_thread().name,
+            'args' : [repr(a) for a in args],
+            'kwargs' : dict((k, repr(v)) for k, v in kwargs.items()),
+            'error' : error,
+            'profile' : os.path.basename(base + PROFILE_SUFFIX),
+            'metadata' : metadata,
+        }
+        with open(base + METADATA_SUFFIX, 'w') as f:
+            json.dump(info, f, indent=2, sort_keys=True, default=repr)
+
+
+_profilers = {}
+_profilersLock = threading.Lock()
+
+def getProfiler(root, maxCalls=DEFAULT_MAX_CALLS, interval=DEFAULT_INTERVAL):
+    """ @brief Get the process-wide Profiler for a directory; its rate limit is
+        shared by every caller in the process
+    """
+    with _profilersLock:
+        profiler = _profilers.get(root)
+        if profiler is None:
+            profiler = _profilers[root] = Profiler(root, RateLimiter(maxCalls, interval))
+        else:
+            profiler.limiter.maxCalls = maxCalls
+            profiler.limiter.interval = interval
+        return profiler
@@ -0,0 +1,500 @@
+"""@package rasterbackend
+
+@brief Pluggable readers for the raster maps used by grassdatalookup.  Lookups
+        are written against the RasterBackend interface so that they can be
+        served either through the GRASS low-level API (grass.lib.gis) or from
+        GeoTIFF / memory-mapped NumPy exports of the same maps, which do not
+        require a GRASS environment (G_gisinit) in the reading process.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from ctypes import *
+
+import numpy as np
+
+## Constants
+DEFAULT_BLOCK_ROWS = 256
+WINDOW_FILENAME = 'window.json'
+GRASS_CELL_TYPES = { 0: (c_int, np.int32), 1: (c_float, np.float32), 2: (c_double, np.float64) }
+GRASS_RASTER_ELEMENTS = ['cellhd', 'cell', 'fcell']
+CELL_NULL = np.iinfo(np.int32).min
+
+## Type definitions
+RasterWindow = namedtuple('RasterWindow', ['north', 'south', 'east', 'west', 'rows', 'cols', 'nsres', 'ewres'], verbose=False)
+
+def getRasterWindow(north, south, east, west, rows, cols):
+    """ @brief Build a RasterWindow, deriving cell resolution from the extent
+        @param north Northern edge of the window
+        @param south Southern edge of the window
+        @param east Eastern edge of the window
+        @param west Western edge of the window
+        @param rows Number of rows in the window
+        @param cols Number of columns in the window
+        @return RasterWindow
+    """
+    north = float(north); south = float(south)
+    east = float(east); west = float(west)
+    rows = int(rows); cols = int(cols)
+    return RasterWindow(north=north, south=south, east=east, west=west,
+                        rows=rows, cols=cols,
+                        nsres=(north - south) / rows, ewres=(east - west) / cols)
+
+def getNullMask(values, nodata=None):
+    """ @brief Find the null cells of values read from a RasterBackend.  Every backend
+        returns nulls as GRASS does (CELL_NULL for integer maps, NaN for floating
+        point maps), so this is the one test for null cells.
+
+        @param values NumPy array of CELL (integer) or FCELL/DCELL (floating point) values
+        @param nodata Value also to be treated as null, e.g. the nodata value of a GDAL band
+
+        @return NumPy boolean array, True where values is null
+    """
+    if values.dtype.kind == 'f':
+        mask = np.isnan(values)
+    else:
+        mask = (values == CELL_NULL)
+    if nodata is not None:
+        mask |= (values == nodata)
+    return mask
+
+def colToEasting(window, col):
+    """ @brief Easting of the center of a column (or array of columns), equivalent to
+        G_col_to_easting(col + 0.5, window)
+    """
+    return window.west + (col + 0.5) * window.ewres
+
+def rowToNorthing(window, row):
+    """ @brief Northing of the center of a row (or array of rows), equivalent to
+        G_row_to_northing(row + 0.5, window)
+    """
+    return window.north - (row + 0.5) * window.nsres
+
+def eastingToCol(window, easting):
+    """ @brief Fractional column of an easting, equivalent to G_easting_to_col """
+    return (easting - window.west) / window.ewres
+
+def northingToRow(window, northing):
+    """ @brief Fractional row of a northing, equivalent to G_northing_to_row """
+    return (window.north - northing) / window.nsres
+
+
+class RasterBackend(object):
+    """ @brief Interface for reading raster maps that share a common window (region).
+        Subclasses must implement getWindow and readRows; readBlocks and readCell
+        may be overridden where the underlying storage offers something cheaper.
+    """
+    def getWindow(self):
+        """ @brief Return the RasterWindow all maps are read in """
+        raise NotImplementedError()
+
+    def readRows(self, mapName, startRow, numRows):
+        """ @brief Read a contiguous block of rows of a raster map
+            @param mapName String representing the name of the map
+            @param startRow Index of the first row to read
+            @param numRows Number of rows to read
+            @return numpy.ndarray of shape (numRows, cols)
+        """
+        raise NotImplementedError()
+
+    def readCell(self, mapName, row, col):
+        """ @brief Read the value of a single cell of a raster map """
+        return self.readRows(mapName, row, 1)[0, col]
+
+    def readCells(self, mapName, rows, cols):
+        """ @brief Read the values of many cells of a raster map, reading each row
+            that contains a requested cell once
+            @param rows Sequence of row indices
+            @param cols Sequence of column indices, the same length as rows
+            @return numpy.ndarray of values, in the order of rows and cols
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = None
+        for row in np.unique(rows):
+            which = (rows == row)
+            rowValues = self.readRows(mapName, int(row), 1)[0]
+            if values is None:
+                values = np.empty(len(rows), dtype=rowValues.dtype)
+            values[which] = rowValues[cols[which]]
+        if values is None:
+            values = np.empty(0)
+        return values
+
+    def readBlocks(self, mapNames, blockRows=DEFAULT_BLOCK_ROWS):
+        """ @brief Iterate over several maps in blocks of rows
+            @param mapNames List of map names to read together
+            @param blockRows Number of rows per block
+            @return Generator yielding (startRow, [numpy.ndarray, ...]) with one
+            array per map in mapNames
+        """
+        numRows = self.getWindow().rows
+        for startRow in xrange(0, numRows, blockRows):
+            n = min(blockRows, numRows - startRow)
+            yield startRow, [self.readRows(m, startRow, n) for m in mapNames]
+
+    def close(self):
+        """ @brief Release any resources held by the backend """
+        pass
+
+
+class GrassRasterBackend(RasterBackend):
+    """ @brief RasterBackend reading maps in the current GRASS region through the
+        GRASS low-level API.  The GRASS environment must already be initialized
+        (see GrassDataLookup._setupGrassEnvironment).
+    """
+    def __init__(self, grass_lowlevel):
+        """ @param grass_lowlevel Previously imported and initialized grass.lib.gis """
+        self.grass_lowlevel = grass_lowlevel
+
+    def getWindow(self):
+        window = self.grass_lowlevel.Cell_head()
+        self.grass_lowlevel.G_get_window(byref(window))
+        return RasterWindow(north=window.north, south=window.south,
+                            east=window.east, west=window.west,
+                            rows=self.grass_lowlevel.G_window_rows(),
+                            cols=self.grass_lowlevel.G_window_cols(),
+                            nsres=window.ns_res, ewres=window.ew_res)
+
+    def _openMap(self, mapName):
+        if '@' in mapName:
+            (mapName, mapset) = mapName.split('@', 1)
+        else:
+            mapset = self.grass_lowlevel.G_find_cell2(mapName, '')
+            mapset = c_char_p(mapset).value
+        dataType = self.grass_lowlevel.G_raster_map_type(mapName, mapset)
+        ctype, dtype = GRASS_CELL_TYPES[dataType]
+        fd = self.grass_lowlevel.G_open_cell_old(mapName, mapset)
+        buf = self.grass_lowlevel.G_allocate_raster_buf(dataType)
+        buf = cast(c_void_p(buf), POINTER(ctype))
+        return (fd, buf, dataType, dtype)
+
+    def _closeMap(self, handle):
+        (fd, buf, _, _) = handle
+        self.grass_lowlevel.G_close_cell(fd)
+        self.grass_lowlevel.G_free(buf)
+
+    def _readInto(self, handle, row, out):
+        (fd, buf, dataType, _) = handle
+        self.grass_lowlevel.G_get_raster_row(fd, buf, row, dataType)
+        out[:] = np.ctypeslib.as_array(buf, shape=(out.shape[0],))
+
+    def readRows(self, mapName, startRow, numRows):
+        cols = self.grass_lowlevel.G_window_cols()
+        handle = self._openMap(mapName)
+        try:
+            block = np.empty((numRows, cols), dtype=handle[3])
+            for i in xrange(numRows):
+                self._readInto(handle, startRow + i, block[i])
+        finally:
+            self._closeMap(handle)
+        return block
+
+    def readBlocks(self, mapNames, blockRows=DEFAULT_BLOCK_ROWS):
+        # Re-initialize GRASS, as lookups always have, so that the current region
+        # is read again rather than the one cached by G_get_window
+        self.grass_lowlevel.G_gisinit('')
+        window = self.getWindow()
+        handles = []
+        try:
+            for mapName in mapNames:
+                handles.append(self._openMap(mapName))
+            for startRow in xrange(0, window.rows, blockRows):
+                n = min(blockRows, window.rows - startRow)
+                blocks = [np.empty((n, window.cols), dtype=h[3]) for h in handles]
+                for i in xrange(n):
+                    for handle, block in zip(handles, blocks):
+                        self._readInto(handle, startRow + i, block[i])
+                yield startRow, blocks
+        finally:
+            for handle in handles:
+                self._closeMap(handle)
+
+
+class ArrayRasterBackend(RasterBackend):
+    """ @brief RasterBackend serving maps held as NumPy arrays, typically memory-mapped
+        .npy exports written by exportRastersAsArrays.  Also convenient for
+        synthetic rasters in tests and benchmarks.
+    """
+    def __init__(self, window, arrays):
+        """ @param window RasterWindow shared by all arrays
+            @param arrays Dict mapping map name to a 2-D array of shape (rows, cols)
+        """
+        self.window = window
+        self.arrays = arrays
+        for name, array in arrays.items():
+            if array.shape != (window.rows, window.cols):
+                raise ValueError("Raster %s has shape %s, expected %s" % \
+                                 (name, array.shape, (window.rows, window.cols)) )
+
+    @classmethod
+    def fromDirectory(cls, directory, mapNames=None):
+        """ @brief Memory-map .npy exports written by exportRastersAsArrays
+            @param directory String representing the directory containing the exports
+            @param mapNames List of map names to load; if None, all exported maps are loaded
+            @return ArrayRasterBackend
+        """
+        with open(os.path.join(directory, WINDOW_FILENAME), 'r') as f:
+            window = RasterWindow(**json.load(f))
+        if mapNames is None:
+            mapNames = [os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith('.npy')]
+        arrays = dict( (m, np.load(os.path.join(directory, m + '.npy'), mmap_mode='r')) for m in mapNames )
+        return cls(window, arrays)
+
+    def getWindow(self):
+        return self.window
+
+    def readRows(self, mapName, startRow, numRows):
+        return self.arrays[mapName][startRow:startRow + numRows]
+
+    def readCell(self, mapName, row, col):
+        return self.arrays[mapName][row, col]
+
+    def readCells(self, mapName, rows, cols):
+        return self.arrays[mapName][np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)]
+
+
+class GDALRasterBackend(RasterBackend):
+    """ @brief RasterBackend reading GeoTIFF exports (one file per map, all sharing the
+        same grid) through GDAL.  Maps are opened on first use and kept open.
+        Cells equal to a band's nodata value are returned as GRASS nulls (see
+        getNullMask).
+    """
+    def __init__(self, directory, extension='.tif'):
+        """ @param directory String representing the directory containing the exports
+            @param extension String representing the extension of each map's file
+        """
+        from osgeo import gdal
+        self._gdal = gdal
+        self.directory = directory
+        self.extension = extension
+        self._datasets = {}
+        self._window = None
+
+    def _getBand(self, mapName):
+        try:
+            dataset = self._datasets[mapName]
+        except KeyError:
+            path = os.path.join(self.directory, mapName + self.extension)
+            dataset = self._gdal.Open(path)
+            if dataset is None:
+                raise IOError("Unable to open raster %s" % (path,) )
+            self._datasets[mapName] = dataset
+        return dataset.GetRasterBand(1)
+
+    def getWindow(self):
+        if self._window is None:
+            names = [os.path.splitext(f)[0] for f in sorted(os.listdir(self.directory)) \
+                     if f.endswith(self.extension)]
+            if not names:
+                raise IOError("No rasters found in %s" % (self.directory,) )
+            self._getBand(names[0])
+            dataset = self._datasets[names[0]]
+            (west, ewres, _, north, _, nsres) = dataset.GetGeoTransform()
+            rows = dataset.RasterYSize
+            cols = dataset.RasterXSize
+            self._window = RasterWindow(north=north, south=north + rows * nsres,
+                                        east=west + cols * ewres, west=west,
+                                        rows=rows, cols=cols,
+                                        nsres=-nsres, ewres=ewres)
+        return self._window
+
+    def _setNulls(self, band, values):
+        nodata = band.GetNoDataValue()
+        if nodata is None:
+            return values
+        if values.dtype.kind != 'f' and values.dtype != np.int32:
+            values = values.astype(np.int32)
+        mask = getNullMask(values, nodata)
+        values[mask] = np.nan if values.dtype.kind == 'f' else CELL_NULL
+        return values
+
+    def readRows(self, mapName, startRow, numRows):
+        band = self._getBand(mapName)
+        return self._setNulls(band, band.ReadAsArray(0, startRow, band.XSize, numRows))
+
+    def readCell(self, mapName, row, col):
+        band = self._getBand(mapName)
+        return self._setNulls(band, band.ReadAsArray(col, row, 1, 1))[0, 0]
+
+    def close(self):
+        self._datasets = {}
+
+
+def exportRastersAsArrays(backend, mapNames, outputDir, blockRows=DEFAULT_BLOCK_ROWS):
+    """ @brief Export maps from any RasterBackend as .npy files suitable for
+        memory-mapping with ArrayRasterBackend.fromDirectory
+
+        @param backend RasterBackend to read from (e.g. GrassRasterBackend)
+        @param mapNames List of map names to export
+        @param outputDir String representing the directory to write to
+        @param blockRows Number of rows to copy at a time
+    """
+    if not os.access(outputDir, os.W_OK):
+        raise IOError("Unable to write to output directory %s\n" % (outputDir,) )
+    window = backend.getWindow()
+    outputs = None
+    for startRow, blocks in backend.readBlocks(mapNames, blockRows):
+        if outputs is None:
+            outputs = [np.lib.format.open_memmap(os.path.join(outputDir, m + '.npy'), mode='w+', \
+                                                  dtype=b.dtype, shape=(window.rows, window.cols)) \
+                       for m, b in zip(mapNames, blocks)]
+        for output, block in zip(outputs, blocks):
+            output[startRow:startRow + block.shape[0]] = block
+    for output in outputs or []:
+        output.flush()
+    with open(os.path.join(outputDir, WINDOW_FILENAME), 'w') as f:
+        json.dump(window._asdict(), f)
+
+def exportRastersAsGeoTIFF(grass_scripting, mapNames, outputDir):
+    """ @brief Export GRASS maps in the current region as GeoTIFFs suitable for
+        GDALRasterBackend
+
+        @param grass_scripting Previously imported grass.script
+        @param mapNames List of map names to export
+        @param outputDir String representing the directory to write to
+    """
+    if not os.access(outputDir, os.W_OK):
+        raise IOError("Unable to write to output directory %s\n" % (outputDir,) )
+    for mapName in mapNames:
+        info = grass_scripting.raster_info(mapName)
+        outputType = 'Int32' if info['datatype'] == 'CELL' else 'Float64'
+        grass_scripting.run_command('r.out.gdal', flags='f', type=outputType, input=mapName, \
+                                    output=os.path.join(outputDir, mapName + '.tif'))
+
+def getGrassRasterStamp(dbase, location, mapset, mapName):
+    """ @brief Get the modification stamp of a GRASS raster map, i.e. the latest
+        modification time of its header and data files.  The map is looked for
+        in mapset and then in PERMANENT.
+
+        @param dbase String representing the path of the GRASS database
+        @param location String representing the GRASS location
+        @param mapset String representing the GRASS mapset
+        @param mapName String representing the name of the map
+
+        @return Float representing the modification time of the map
+    """
+    for m in (mapset, 'PERMANENT'):
+        mapsetPath = os.path.join(dbase, location, m)
+        mtimes = [ os.path.getmtime(os.path.join(mapsetPath, element, mapName)) \
+                   for element in GRASS_RASTER_ELEMENTS \
+                   if os.path.exists(os.path.join(mapsetPath, element, mapName)) ]
+        if mtimes:
+            return max(mtimes)
+    raise IOError("Unable to find raster %s in %s" % \
+                  (mapName, os.path.join(dbase, location, mapset)) )
+
+def listGrassRasters(dbase, location, mapset):
+    """ @brief List the raster maps stored in a GRASS mapset without running g.list
+
+        @param dbase String representing the path of the GRASS database
+        @param location String representing the GRASS location
+        @param mapset String representing the GRASS mapset
+
+        @return Sorted list of map names
+    """
+    cellhd = os.path.join(dbase, location, mapset, 'cellhd')
+    if not os.path.isdir(cellhd):
+        return []
+    return sorted(os.listdir(cellhd))
+
+def getGrassRegionStamp(dbase, location, mapset):
+    """ @brief Get the modification time of the current region (WIND file) of a mapset """
+    return os.path.getmtime(os.path.join(dbase, location, mapset, 'WIND'))
+
+def getGrassMapsetStamp(dbase, location, mapset):
+    """ @brief Get a cheap modification stamp for the rasters and region of a mapset:
+        the latest modification time of the WIND file and of the raster element
+        directories, which change whenever GRASS writes (or removes) a raster
+
+        @return Float representing the modification time
+    """
+    mapsetPath = os.path.join(dbase, location, mapset)
+    paths = [ os.path.join(mapsetPath, 'WIND') ] + \
+            [ os.path.join(mapsetPath, element) for element in GRASS_RASTER_ELEMENTS ]
+    return max( os.path.getmtime(path) for path in paths if os.path.exists(path) )
+
+_arrayBackends = {}
+_arrayBackendsLock = threading.Lock()
+
+def getCachedArrayBackend(sourceBackend, mapNames, cacheDir, stamp):
+    """ @brief Get an ArrayRasterBackend holding memory-mapped copies of maps, exporting
+        them from sourceBackend the first time they are needed.  Exports are
+        versioned by stamp so that processes sharing cacheDir share one copy
+        (through the page cache) and a changed stamp triggers a new export.
+
+        @param sourceBackend RasterBackend to export from, or a callable returning one;
+        only used when no export exists for stamp
+        @param mapNames List of map names to export
+        @param cacheDir String representing the directory holding exports
+        @param stamp Value identifying the version of the maps, e.g. the latest
+        getGrassRasterStamp of the maps
+
+        @return ArrayRasterBackend
+    """
+    key = (cacheDir, tuple(mapNames))
+    with _arrayBackendsLock:
+        cached = _arrayBackends.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+    prefix = '+'.join(mapNames) + '@'
+    exportDir = os.path.join(cacheDir, '%s%s' % (prefix, stamp))
+    if not os.path.exists(os.path.join(exportDir, WINDOW_FILENAME)):
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        if callable(sourceBackend):
+            sourceBackend = sourceBackend()
+        # Export to a private directory and rename it into place so readers
+        # never see a partial export
+        tmpDir = tempfile.mkdtemp(dir=cacheDir, prefix='.export-')
+        try:
+            exportRastersAsArrays(sourceBackend, mapNames, tmpDir)
+            os.rename(tmpDir, exportDir)
+        except OSError:
+            # Another process finished the same export first
+            if not os.path.exists(os.path.join(exportDir, WINDOW_FILENAME)):
+                raise
+        finally:
+            if os.path.exists(tmpDir):
+                shutil.rmtree(tmpDir)
+        # Drop exports of older versions of the same maps
+        for name in os.listdir(cacheDir):
+            if name.startswith(prefix) and os.path.join(cacheDir, name) != exportDir:
+                shutil.rmtree(os.path.join(cacheDir, name), ignore_errors=True)
+
+    backend = ArrayRasterBackend.fromDirectory(exportDir, mapNames)
+    with _arrayBackendsLock:
+        _arrayBackends[key] = (stamp, backend)
+    return backend
@@ -0,0 +1,290 @@
+"""@package rastercache
+
+@brief Size-bounded disk cache for exported rasters.  Entries are keyed by the
+        content they were generated from (raster, its modification stamp, mask,
+        output type and target spatial reference system), written atomically,
+        and evicted least recently used first when the cache outgrows its
+        disk budget.  Generation is single-flight: concurrent callers, in any
+        process, asking for the same missing entry wait for one build.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import re
+import time
+import errno
+import hashlib
+import fcntl
+import tempfile
+import threading
+
+import metrics
+
+## Constants
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MIN_AGE = 60
+ENTRY_SUFFIX = '.tif'
+ENTRY_PATTERN = re.compile(r'^[0-9a-f]{40}\.tif$')
+LOCK_SUFFIX = '.lock'
+LOCK_PATTERN = re.compile(r'^\.[0-9a-f]{40}\.lock$')
+
+def getCacheKey(*parts):
+    """ @brief Build a cache key from the values an entry was generated from
+        @param parts Values (strings, numbers, None) identifying the entry's content,
+        e.g. database, location, mapset, raster, raster stamp, mask, mask stamp,
+        output type and target SRS
+        @return String representing the key
+    """
+    return hashlib.sha1( '\0'.join(repr(p) for p in parts) ).hexdigest()
+
+def _openLocked(path, flags, mode='r'):
+    """ @brief Open a file and flock it, making sure the file locked is still the one
+        at path (it may have been removed or replaced while we waited)
+
+        @return Open file holding the lock (closing it releases the lock), or None if
+        the file does not exist or flags include LOCK_NB and the lock is held
+    """
+    while True:
+        try:
+            f = open(path, mode)
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            fcntl.flock(f, flags)
+        except IOError:
+            f.close()
+            return None
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                return f
+        except OSError:
+            pass
+        f.close()
+        if mode == 'r':
+            return None
+
+
+class RasterCache(object):
+    """ @brief Directory of cached rasters with a disk budget and LRU eviction.
+        Recency is recorded in each entry's modification time, so it is shared
+        by every process using the same directory.  Entries are never evicted
+        within minAge seconds of their last use, so a path returned by get or
+        getOrCreate stays readable for at least that long; readers and eviction
+        also serialize on a flock of the entry itself.
+    """
+    def __init__(self, root, maxBytes=DEFAULT_MAX_BYTES, minAge=DEFAULT_MIN_AGE):
+        """ @param root String representing the cache directory; created if missing
+            @param maxBytes Disk budget in bytes
+            @param minAge Number of seconds after its last use an entry may be evicted
+        """
+        self.root = root
+        self.maxBytes = maxBytes
+        self.minAge = minAge
+        if not os.path.exists(root):
+            try:
+                os.makedirs(root)
+            except OSError:
+                if not os.path.isdir(root):
+                    raise
+
+    def path(self, key):
+        """ @brief Path at which the entry for key is (or would be) stored """
+        return os.path.join(self.root, key + ENTRY_SUFFIX)
+
+    def _touch(self, path):
+        """ @brief Mark an entry as recently used, under a shared lock so that it is
+            not evicted at the same time
+            @return path, or None if the entry does not exist
+        """
+        entry = _openLocked(path, fcntl.LOCK_SH)
+        if entry is None:
+            return None
+        try:
+            os.utime(path, None)
+        finally:
+            entry.close()
+        return path
+
+    def get(self, key):
+        """ @brief Look up an entry, marking it as recently used
+            @return String representing the path of the entry, None if not cached
+        """
+        path = self._touch(self.path(key))
+        if path is None:
+            metrics.increment('rastercache_misses')
+            return None
+        metrics.increment('rastercache_hits')
+        return path
+
+    def put(self, key, builder):
+        """ @brief Generate an entry and add it to the cache
+
+            @param key String as returned by getCacheKey
+            @param builder Callable taking the path of a temporary file in the cache
+            directory, which it must write the entry to; the file is renamed into
+            place once builder returns, so readers never see a partial entry
+
+            @return String representing the path of the entry
+        """
+        (fd, tmp) = tempfile.mkstemp(dir=self.root, prefix='.partial-', suffix=ENTRY_SUFFIX)
+        os.close(fd)
+        try:
+            builder(tmp)
+            path = self.path(key)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.evict(keep=path)
+        return path
+
+    def lockPath(self, key):
+        """ @brief Path of the lock file serializing builds of the entry for key; it
+            only exists while the entry is being built
+        """
+        return os.path.join(self.root, '.' + key + LOCK_SUFFIX)
+
+    def getOrCreate(self, key, builder, blocking=True):
+        """ @brief Look up an entry, generating it if missing.  Only one caller at a
+            time, across processes, runs builder for a key; the others wait for it
+            and then use its result.
+
+            @param key String as returned by getCacheKey
+            @param builder Callable as for put
+            @param blocking Boolean; if False and another caller is already
+            generating the entry, return None immediately instead of waiting, so the
+            caller can poll
+
+            @return String representing the path of the entry, or None if blocking is
+            False and the entry is being generated elsewhere
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        flags = fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        lockPath = self.lockPath(key)
+        lock = _openLocked(lockPath, flags, mode='a')
+        if lock is None:
+            return None
+        try:
+            # Whoever held the lock before us may have just built it
+            path = self._touch(self.path(key))
+            if path is None:
+                path = self.put(key, builder)
+            return path
+        finally:
+            # Callers waiting on the removed lock file notice and look again
+            try:
+                os.unlink(lockPath)
+            except OSError:
+                pass
+            lock.close()
+
+    def isBuilding(self, key):
+        """ @brief Report whether some caller is currently generating the entry for key """
+        lock = _openLocked(self.lockPath(key), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if lock is None:
+            return os.path.exists(self.lockPath(key))
+        lock.close()
+        return False
+
+    def entries(self):
+        """ @brief List cached entries
+            @return List of (mtime, size, path) tuples, least recently used first
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if not ENTRY_PATTERN.match(name):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append( (st.st_mtime, st.st_size, path) )
+        entries.sort()
+        return entries
+
+    def evict(self, keep=None):
+        """ @brief Remove least recently used entries until the cache fits its budget.
+            Entries used within minAge seconds, or being read, are kept even if the
+            cache stays over budget.  Lock files left behind by builds that died are
+            removed too.
+            @param keep String representing the path of an entry never to evict
+            (typically the one just added)
+        """
+        entries = self.entries()
+        total = sum(size for (_, size, _) in entries)
+        cutoff = time.time() - self.minAge
+        for (mtime, size, path) in entries:
+            if total <= self.maxBytes:
+                break
+            if path == keep or mtime > cutoff:
+                continue
+            entry = _openLocked(path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if entry is None:
+                continue
+            try:
+                # Used since it was listed
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+            finally:
+                entry.close()
+
+        for name in os.listdir(self.root):
+            if LOCK_PATTERN.match(name):
+                lockPath = os.path.join(self.root, name)
+                lock = _openLocked(lockPath, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if lock is not None:
+                    try:
+                        os.unlink(lockPath)
+                    except OSError:
+                        pass
+                    lock.close()
+
+
+_caches = {}
+_cachesLock = threading.Lock()
+
+def getRasterCache(root, maxBytes=DEFAULT_MAX_BYTES):
+    """ @brief Get the process-wide RasterCache for a directory """
+    with _cachesLock:
+        cache = _caches.get(root)
+        if cache is None or cache.maxBytes != maxBytes:
+            cache = _caches[root] = RasterCache(root, maxBytes)
+        return cache
@@ -0,0 +1,239 @@
+"""@package rasterexport
+
+@brief Export GRASS rasters as web-ready GeoTIFFs: reprojected, internally tiled,
+        compressed, and carrying overviews (Cloud-Optimized GeoTIFF layout), so
+        that rendering at any zoom level only reads the blocks it needs.  Rasters
+        and masks are read once through a rasterbackend.RasterBackend and masked
+        in memory, then warped block by block into a temporary tiled GeoTIFF,
+        from which the Cloud-Optimized GeoTIFF is copied.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import tempfile
+
+import numpy as np
+from osgeo import gdal
+from osgeo import gdal_array
+from osgeo import osr
+
+from rasterbackend import getGrassRasterStamp, getNullMask
+from rastercache import getCacheKey
+import metrics
+
+## Constants
+BLOCK_SIZE = 256
+COMPRESSION = 'DEFLATE'
+TILED_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=%d' % BLOCK_SIZE, 'BLOCKYSIZE=%d' % BLOCK_SIZE, \
+                 'COMPRESS=%s' % COMPRESSION]
+ALPHA_OPAQUE = 255
+
+def getOverviewLevels(xSize, ySize, blockSize=BLOCK_SIZE):
+    """ @brief Get the overview decimation factors needed for a raster of the given
+        size, halving until the smallest overview fits in a single block
+
+        @return List of integers, e.g. [2, 4, 8]
+    """
+    levels = []
+    factor = 2
+    while max(xSize, ySize) > blockSize * (factor // 2):
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+def writeCloudOptimizedGeoTIFF(dataset, dst, resampling='NEAREST'):
+    """ @brief Copy a GDAL dataset to a tiled, compressed GeoTIFF whose overviews are
+        stored ahead of the full resolution data.  The destination is written to a
+        temporary file and renamed into place, so it never appears half-written.
+
+        @param dataset osgeo.gdal.Dataset to copy; overviews are added to it in place,
+        so it should be writable (e.g. an in-memory dataset)
+        @param dst String representing the path of the GeoTIFF to write
+        @param resampling String representing the overview resampling method; the
+        default, NEAREST, keeps categorical rasters' values intact
+    """
+    levels = getOverviewLevels(dataset.RasterXSize, dataset.RasterYSize)
+    if levels:
+        dataset.BuildOverviews(resampling, levels)
+
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(dst), prefix='.cog-', suffix='.tif')
+    os.close(fd)
+    try:
+        copy = gdal.GetDriverByName('GTiff').CreateCopy(tmp, dataset, \
+                                                         options=TILED_OPTIONS + ['COPY_SRC_OVERVIEWS=YES'])
+        if copy is None:
+            raise IOError("Unable to write raster %s" % (tmp,) )
+        copy = None
+        os.rename(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+def buildCloudOptimizedGeoTIFF(src, dst, resampling='NEAREST'):
+    """ @brief Copy a GeoTIFF to a Cloud-Optimized GeoTIFF (see writeCloudOptimizedGeoTIFF)
+
+        @param src String representing the path of the GeoTIFF to copy; overviews are
+        added to it in place
+        @param dst String representing the path of the GeoTIFF to write
+        @param resampling String representing the overview resampling method
+    """
+    dataset = gdal.Open(src, gdal.GA_Update)
+    if dataset is None:
+        raise IOError("Unable to open raster %s" % (src,) )
+    try:
+        writeCloudOptimizedGeoTIFF(dataset, dst, resampling)
+    finally:
+        dataset = None
+
+def readMaskedRaster(backend, raster, s_srs, mask=None, outputType='UInt16'):
+    """ @brief Read a raster and its mask through a RasterBackend into an in-memory
+        GDAL dataset with a value band and an alpha band.  Cells that are null, zero
+        (the nodata value of earlier exports), or 0 in mask are transparent.
+
+        @param backend rasterbackend.RasterBackend for the mapset
+        @param raster String representing the name of the raster
+        @param s_srs osgeo.osr.SpatialReference of the mapset
+        @param mask String representing the name of a 0|1 raster, 0 representing
+        areas to exclude
+        @param outputType String representing the GDAL data type of the value band
+
+        @return osgeo.gdal.Dataset
+    """
+    window = backend.getWindow()
+    gdalType = gdal.GetDataTypeByName(outputType)
+    numpyType = gdal_array.GDALTypeCodeToNumericTypeCode(gdalType)
+
+    dataset = gdal.GetDriverByName('MEM').Create('', window.cols, window.rows, 2, gdalType)
+    dataset.SetGeoTransform( (window.west, window.ewres, 0, window.north, 0, -window.nsres) )
+    dataset.SetProjection(s_srs.ExportToWkt())
+    valueBand = dataset.GetRasterBand(1)
+    alphaBand = dataset.GetRasterBand(2)
+    alphaBand.SetColorInterpretation(gdal.GCI_AlphaBand)
+
+    mapNames = [raster, mask] if mask else [raster]
+    for startRow, blocks in backend.readBlocks(mapNames):
+        values = blocks[0]
+        transparent = getNullMask(values)
+        values = np.where(transparent, 0, values).astype(numpyType)
+        transparent |= (values == 0)
+        if mask:
+            maskValues = blocks[1]
+            transparent |= getNullMask(maskValues) | (maskValues == 0)
+            values[transparent] = 0
+        alpha = np.where(transparent, 0, ALPHA_OPAQUE).astype(numpyType)
+        valueBand.WriteArray(values, 0, startRow)
+        alphaBand.WriteArray(alpha, 0, startRow)
+
+    return dataset
+
+@metrics.timed('raster_export')
+def exportRaster(backend, raster, s_srs, outputFile, mask=None, t_srs='EPSG:3857', \
+                 outputType='UInt16'):
+    """ @brief Export a raster, optionally masked, as a Cloud-Optimized GeoTIFF in
+        another spatial reference system.  The masked raster is held in memory once,
+        in its own spatial reference system, and warped from there into a temporary
+        tiled GeoTIFF on disk next to outputFile; overviews are added to that and it
+        is copied to outputFile by writeCloudOptimizedGeoTIFF.
+
+        @param backend rasterbackend.RasterBackend for the mapset
+        @param raster String representing the name of the raster to export
+        @param s_srs osgeo.osr.SpatialReference of the mapset
+        @param outputFile String representing the path of the GeoTIFF to write
+        @param mask String representing the name of a 0|1 raster, 0 representing areas to
+        exclude; masked areas are made transparent in the output
+        @param t_srs String representing the spatial reference system of the output
+        @param outputType String representing the GDAL data type of the output
+    """
+    source = readMaskedRaster(backend, raster, s_srs, mask=mask, outputType=outputType)
+    target = osr.SpatialReference()
+    target.SetFromUserInput(t_srs)
+    s_wkt = s_srs.ExportToWkt()
+    t_wkt = target.ExportToWkt()
+
+    # The warped VRT is only used to work out the output grid; nothing is read
+    # through it
+    warped = gdal.AutoCreateWarpedVRT(source, s_wkt, t_wkt, gdal.GRA_NearestNeighbour)
+    if warped is None:
+        raise IOError("Unable to reproject raster %s to %s" % (raster, t_srs) )
+    (xSize, ySize, geoTransform) = (warped.RasterXSize, warped.RasterYSize, warped.GetGeoTransform())
+    warped = None
+
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(outputFile), prefix='.warped-', suffix='.tif')
+    os.close(fd)
+    output = None
+    try:
+        output = gdal.GetDriverByName('GTiff').Create(tmp, xSize, ySize, source.RasterCount, \
+                                                      source.GetRasterBand(1).DataType, \
+                                                      options=TILED_OPTIONS + ['ALPHA=YES'])
+        if output is None:
+            raise IOError("Unable to write raster %s" % (tmp,) )
+        output.SetGeoTransform(geoTransform)
+        output.SetProjection(t_wkt)
+        if gdal.ReprojectImage(source, output, s_wkt, t_wkt, gdal.GRA_NearestNeighbour) != gdal.CE_None:
+            raise IOError("Unable to reproject raster %s to %s" % (raster, t_srs) )
+        source = None
+        writeCloudOptimizedGeoTIFF(output, outputFile)
+    finally:
+        output = source = None
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+def exportCachedRaster(cache, backend, dbase, location, mapset, raster, s_srs, \
+                       mask=None, t_srs='EPSG:3857', outputType='UInt16', blocking=True, catalog=None):
+    """ @brief Get a GRASS raster exported by exportRaster from a
+        rastercache.RasterCache, exporting it on a miss.  Entries are keyed by the
+        raster and mask and their modification stamps, so editing either in GRASS
+        yields a new entry rather than a stale one.  Concurrent misses on the same
+        entry run a single export.
+
+        @param cache rastercache.RasterCache
+        @param backend rasterbackend.RasterBackend for the mapset
+        @param dbase String representing the path of the GRASS database
+        @param location String representing the GRASS location
+        @param mapset String representing the GRASS mapset
+        @param blocking Boolean; if False, return None rather than wait while another
+        caller exports the raster
+        @param catalog grasscatalog.RasterCatalog of the mapset to take modification
+        stamps from; if None, they are read from the mapset
+
+        See exportRaster for the remaining parameters.
+
+        @return String representing the path of the cached GeoTIFF, or None (see blocking)
+    """
+    if catalog:
+        getStamp = lambda name: catalog.get(name).stamp
+    else:
+        getStamp = lambda name: getGrassRasterStamp(dbase, location, mapset, name)
+    rasterStamp = getStamp(raster)
+    maskStamp = getStamp(mask) if mask else None
+    key = getCacheKey(dbase, location, mapset, raster, rasterStamp, mask, maskStamp, outputType, t_srs)
+
+    return cache.getOrCreate(key, lambda tmp: exportRaster(backend, raster, s_srs, tmp, mask=mask, \
+                                                           t_srs=t_srs, outputType=outputType), \
+                             blocking=blocking)
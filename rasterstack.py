@@ -0,0 +1,211 @@
+"""@package rasterstack
+
+@brief Point queries against every raster visible from a GRASS mapset (its own,
+        then PERMANENT's) at once.  Each raster
+        is exported once to a memory-mapped array aligned to the mapset's
+        region; queries for a point or a batch of points are then plain array
+        indexing.  A raster is re-exported when its modification stamp changes,
+        and the whole stack when the region changes.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rasterbackend import RasterWindow, WINDOW_FILENAME
+from rasterbackend import exportRastersAsArrays
+from rasterbackend import getGrassRegionStamp
+from rasterbackend import northingToRow, eastingToCol
+from rasterbackend import getNullMask
+from grasscatalog import RasterCatalog
+
+## Constants
+DEFAULT_CHECK_INTERVAL = 1.0
+
+class RasterStack(object):
+    """ @brief Aligned, memory-mapped copies of the rasters of one GRASS mapset """
+
+    def __init__(self, dbase, location, mapset, cacheDir, sourceBackend, \
+                 checkInterval=DEFAULT_CHECK_INTERVAL, catalog=None):
+        """ @param dbase String representing the path of the GRASS database
+            @param location String representing the GRASS location
+            @param mapset String representing the GRASS mapset
+            @param cacheDir String representing the directory holding the exported arrays
+            @param sourceBackend rasterbackend.RasterBackend reading the mapset in its
+            current region (e.g. GrassRasterBackend), or a callable returning one, called
+            each time a raster has to be (re-)exported; rasters are read by qualified
+            name (name@mapset)
+            @param checkInterval Minimum number of seconds between checks of the
+            rasters' modification stamps
+            @param catalog grasscatalog.RasterCatalog of the mapset to share; one is
+            created if None
+        """
+        self.dbase = dbase
+        self.location = location
+        self.mapset = mapset
+        self.cacheDir = cacheDir
+        self.checkInterval = checkInterval
+        self._source = sourceBackend
+        self.catalog = catalog or RasterCatalog(dbase, location, mapset, checkInterval)
+        self._lock = threading.Lock()
+        self._lastCheck = 0
+        self._regionStamp = None
+        self._stamps = {}
+        self._arrays = OrderedDict()
+        self.window = None
+
+    def _getSource(self):
+        if callable(self._source):
+            return self._source()
+        return self._source
+
+    def _path(self, name, stamp):
+        return os.path.join(self.cacheDir, '%s@%.6f@%.6f.npy' % (name, stamp, self._regionStamp))
+
+    def _loadWindow(self):
+        path = os.path.join(self.cacheDir, '%s@%.6f' % (WINDOW_FILENAME, self._regionStamp))
+        if not os.path.exists(path):
+            window = self._getSource().getWindow()
+            tmp = tempfile.NamedTemporaryFile(dir=self.cacheDir, prefix='.window-', delete=False)
+            json.dump(window._asdict(), tmp)
+            tmp.close()
+            os.rename(tmp.name, path)
+        with open(path, 'r') as f:
+            return RasterWindow(**json.load(f))
+
+    def _loadArray(self, name, stamp):
+        path = self._path(name, stamp)
+        if not os.path.exists(path):
+            # Export to a private directory and rename into place so that other
+            # processes sharing cacheDir never map a partial file
+            tmpDir = tempfile.mkdtemp(dir=self.cacheDir, prefix='.export-')
+            try:
+                exportRastersAsArrays(self._getSource(), [name], tmpDir)
+                os.rename(os.path.join(tmpDir, name + '.npy'), path)
+            finally:
+                shutil.rmtree(tmpDir)
+            self._removeStale(name + '@', path)
+        return np.load(path, mmap_mode='r')
+
+    def _removeStale(self, prefix, current):
+        for f in os.listdir(self.cacheDir):
+            if f.startswith(prefix) and os.path.join(self.cacheDir, f) != current:
+                try:
+                    os.unlink(os.path.join(self.cacheDir, f))
+                except OSError:
+                    pass
+
+    def refresh(self, force=False):
+        """ @brief Re-export any raster whose modification stamp changed since it was
+            exported, and drop rasters that no longer exist.  Does nothing if the
+            stamps were checked less than checkInterval seconds ago, unless force
+            is True.
+        """
+        now = time.time()
+        if not force and now - self._lastCheck < self.checkInterval:
+            return
+        with self._lock:
+            if not os.path.exists(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            regionStamp = getGrassRegionStamp(self.dbase, self.location, self.mapset)
+            if regionStamp != self._regionStamp:
+                self._regionStamp = regionStamp
+                self._stamps = {}
+                self._arrays = OrderedDict()
+                self.window = self._loadWindow()
+                self._removeStale(WINDOW_FILENAME + '@', \
+                                  os.path.join(self.cacheDir, '%s@%.6f' % (WINDOW_FILENAME, regionStamp)))
+
+            # The mapset's rasters and then PERMANENT's, as r.what is given them
+            self.catalog.refresh(force=True)
+            rasters = self.catalog.rasters()
+            names = [ '%s@%s' % (info.name, info.mapset) for info in rasters ]
+            arrays = OrderedDict()
+            for (name, stamp) in zip(names, [ info.stamp for info in rasters ]):
+                if self._stamps.get(name) == stamp:
+                    arrays[name] = self._arrays[name]
+                else:
+                    arrays[name] = self._loadArray(name, stamp)
+                    self._stamps[name] = stamp
+            for name in set(self._stamps) - set(names):
+                del self._stamps[name]
+            self._arrays = arrays
+            self._lastCheck = now
+
+    def _snapshot(self):
+        """ @brief The current window and arrays, which refresh replaces together """
+        self.refresh()
+        with self._lock:
+            return (self.window, self._arrays)
+
+    @property
+    def names(self):
+        """ @brief Qualified names (name@mapset) of the rasters in the stack """
+        return self._snapshot()[1].keys()
+
+    def queryMany(self, eastings, northings):
+        """ @brief Get the value of every raster at a batch of points
+
+            @param eastings Sequence of eastings in the mapset's coordinate system
+            @param northings Sequence of northings in the mapset's coordinate system
+
+            @return OrderedDict mapping qualified raster name to a numpy.ma.MaskedArray of
+            values, masked where the raster is null or the point lies outside the region
+        """
+        (window, arrays) = self._snapshot()
+        rows = np.floor(northingToRow(window, np.asarray(northings, dtype=np.float64))).astype(np.int64)
+        cols = np.floor(eastingToCol(window, np.asarray(eastings, dtype=np.float64))).astype(np.int64)
+        outside = (rows < 0) | (rows >= window.rows) | (cols < 0) | (cols >= window.cols)
+        rows[outside] = 0
+        cols[outside] = 0
+
+        values = OrderedDict()
+        for name, array in arrays.items():
+            v = array[rows, cols]
+            values[name] = np.ma.MaskedArray(v, mask=(getNullMask(v) | outside))
+        return values
+
+    def query(self, easting, northing):
+        """ @brief Get the value of every raster at a point
+
+            @param easting Easting in the mapset's coordinate system
+            @param northing Northing in the mapset's coordinate system
+
+            @return OrderedDict mapping qualified raster name to its value, None where the
+            raster is null or the point lies outside the region
+        """
+        return OrderedDict( (name, None if v.mask[0] else v.data[0].item()) \
+                            for name, v in self.queryMany([easting], [northing]).items() )
@@ -0,0 +1,51 @@
+import os
+from django.db import connection, transaction
+
+from RHESSysWeb.models import Rollup
+from RHESSysWeb.flowtablerollup import readFlowtableArrays, getRollups
+from RHESSysWeb.flowtablerollup import ROLLUP_LEVELS, ROLLUP_BASIN, ROLLUP_HILLSLOPE, ROLLUP_ZONE
+
+# Rollup columns holding the key fields of a group at each level
+LEVEL_COLUMNS = { ROLLUP_BASIN : (), ROLLUP_HILLSLOPE : ('hill_id',), ROLLUP_ZONE : ('hill_id', 'zone_id') }
+
+def get_version(path):
+    """Version of a flow table file, as recorded by flowtablestore."""
+    return '%.6f' % os.path.getmtime(path)
+
+def get_loaded_version(name):
+    """Version of the file the rollups of a flow table were computed from, or None."""
+    versions = Rollup.objects.filter(flow_table=name, level=ROLLUP_BASIN).values_list('version', flat=True)
+    return (list(versions[:1]) or [None])[0]
+
+def refresh_rollups(name, path, if_changed=False):
+    """Recompute every rollup of a flow table from its file, in one pass over
+    the file and one vectorized group-by per level.  Refreshes of the same table
+    are serialized; with if_changed, a refresh finding the file's version
+    already computed does nothing.  Requires PostgreSQL."""
+    version = get_version(path)
+    with transaction.commit_on_success():
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ['rollups:' + name])
+        if if_changed and get_loaded_version(name) == version:
+            return
+        arrays = readFlowtableArrays(path)
+        Rollup.objects.filter(flow_table=name).delete()
+        for level in ROLLUP_LEVELS:
+            keys, rollups = getRollups(arrays, level)
+            Rollup.objects.bulk_create([
+                Rollup(flow_table=name, level=level, version=version,
+                    patch_count=int(rollups['patchCount'][i]), area=rollups['area'][i],
+                    z_sum=rollups['zSum'][i], z_area_sum=rollups['zAreaSum'][i],
+                    **dict(zip(LEVEL_COLUMNS[level], key)))
+                for i, key in enumerate(keys)
+            ], batch_size=1000)
+
+def get_rollups(name, path, level=None):
+    """Rollups of a flow table, of one level or all, recomputed first if the file
+    changed since they were."""
+    if get_loaded_version(name) != get_version(path):
+        refresh_rollups(name, path, if_changed=True)
+    rollups = Rollup.objects.filter(flow_table=name)
+    if level is not None:
+        rollups = rollups.filter(level=level)
+    return rollups.order_by('level', 'hill_id', 'zone_id')
@@ -0,0 +1,256 @@
+"""@package statestore
+
+@brief Column-wise storage of the state variables of one level (e.g. the
+        patches) of a RHESSys world.  Each variable is a typed array on disk,
+        aligned with an array of the entities' primary keys, so reading a few
+        variables for many entities is one memory-mapped read per variable
+        rather than a query per entity or variable.  Columns are written in
+        batches while a worldfile is streamed in, in constant memory.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+import os
+import json
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+## Constants
+DEFAULT_BATCH_SIZE = 5000
+METADATA_FILENAME = 'columns.json'
+ID_COLUMN = 'id'
+RHESSYS_ID_COLUMN = 'rhessys_id'
+ID_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+# Suffix distinguishing repeated variables of an entity, e.g. its second
+# base_station_ID is stored as base_station_ID#2
+REPEAT_SEPARATOR = '#'
+
+def getWorldStateDirectory(root, worldID):
+    """ @brief Directory holding the columns of every level of a world
+        @param root String representing the directory holding all worlds' columns
+        @param worldID Primary key of the world
+    """
+    return os.path.join(root, 'world-%d' % (worldID,))
+
+def getStateDirectory(root, worldID, levelName):
+    """ @brief Directory holding the columns of one level of a world
+        @param root String representing the directory holding all worlds' columns
+        @param worldID Primary key of the world
+        @param levelName String representing the level, e.g. 'patch'
+    """
+    return os.path.join(getWorldStateDirectory(root, worldID), levelName)
+
+def parseStateValue(value):
+    """ @brief Convert a state variable as written in a worldfile to a float, NaN
+        if it is not a number
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class StateColumnWriter(object):
+    """ @brief Write the columns of one level, an entity at a time.  Entities must be
+        appended in increasing order of primary key.  Columns are written to a
+        private directory and renamed into place by close, so readers never see
+        a partial level.
+    """
+    def __init__(self, directory, batchSize=DEFAULT_BATCH_SIZE):
+        """ @param directory String representing the directory to write; replaced if
+            it exists
+            @param batchSize Number of entities to buffer before appending to the
+            column files
+        """
+        self.directory = directory
+        self.batchSize = batchSize
+        parent = os.path.dirname(directory)
+        if not os.path.exists(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not os.path.isdir(parent):
+                    raise
+        self._tmpDir = tempfile.mkdtemp(dir=parent, prefix='.partial-')
+        # Column name to file name, in order of first appearance
+        self._files = OrderedDict()
+        self._ids = []
+        self._rhessysIDs = []
+        self._rows = []
+        self.count = 0
+        self.lastID = None
+
+    def append(self, id, rhessysID, vars):
+        """ @brief Add an entity
+            @param id Integer representing the primary key of the entity
+            @param rhessysID Integer representing the entity's ID in the worldfile
+            @param vars List of (name, value) pairs, e.g. WorldfileBlock.vars;
+            values are stored as floats
+        """
+        if self.lastID is not None and id <= self.lastID:
+            raise ValueError("State columns must be appended in increasing order of id, %d follows %d" % (id, self.lastID))
+        self.lastID = id
+        row = {}
+        names = []
+        for (name, value) in vars:
+            if name in row:
+                n = 2
+                while '%s%s%d' % (name, REPEAT_SEPARATOR, n) in row:
+                    n += 1
+                name = '%s%s%d' % (name, REPEAT_SEPARATOR, n)
+            row[name] = parseStateValue(value)
+            names.append(name)
+        row = (names, row)
+        self._ids.append(id)
+        self._rhessysIDs.append(rhessysID)
+        self._rows.append(row)
+        if len(self._rows) >= self.batchSize:
+            self.flush()
+
+    def _append(self, fileName, values):
+        with open(os.path.join(self._tmpDir, fileName), 'ab') as f:
+            f.write(values.tostring())
+
+    def flush(self):
+        """ @brief Append buffered entities to the column files """
+        if not self._rows:
+            return
+        for (names, _) in self._rows:
+            for name in names:
+                if name not in self._files:
+                    # Entities before the first one having the variable lack it
+                    self._files[name] = 'c%05d.f8' % (len(self._files),)
+                    for start in xrange(0, self.count, self.batchSize):
+                        self._append(self._files[name], \
+                                     np.ones(min(self.batchSize, self.count - start), VALUE_DTYPE) * np.nan)
+        self._append('id.i8', np.array(self._ids, ID_DTYPE))
+        self._append('rhessys_id.i8', np.array(self._rhessysIDs, ID_DTYPE))
+        for name, fileName in self._files.items():
+            self._append(fileName, np.array([row.get(name, np.nan) for (_, row) in self._rows], VALUE_DTYPE))
+        self.count += len(self._rows)
+        self._ids = []
+        self._rhessysIDs = []
+        self._rows = []
+
+    def close(self):
+        """ @brief Write the buffered entities and publish the columns """
+        self.finish()
+        self.publish()
+
+    def finish(self):
+        """ @brief Write the buffered entities and the metadata without publishing
+            them, e.g. until the rows they describe are committed; then call
+            publish, or abort
+        """
+        self.flush()
+        columns = [ dict(name=ID_COLUMN, file='id.i8', dtype=ID_DTYPE.str),
+                    dict(name=RHESSYS_ID_COLUMN, file='rhessys_id.i8', dtype=ID_DTYPE.str) ]
+        columns += [ dict(name=name, file=fileName, dtype=VALUE_DTYPE.str) for name, fileName in self._files.items() ]
+        with open(os.path.join(self._tmpDir, METADATA_FILENAME), 'w') as f:
+            json.dump(dict(count=self.count, columns=columns), f)
+
+    def publish(self):
+        """ @brief Rename the columns written by finish into place """
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        os.rename(self._tmpDir, self.directory)
+
+    def abort(self):
+        """ @brief Discard everything written """
+        shutil.rmtree(self._tmpDir, ignore_errors=True)
+
+
+class StateColumns(object):
+    """ @brief Read the columns of one level, as written by StateColumnWriter """
+
+    def __init__(self, directory):
+        """ @param directory String representing the directory of the level """
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILENAME)) as f:
+            metadata = json.load(f)
+        self.count = metadata['count']
+        self._columns = OrderedDict( (c['name'], c) for c in metadata['columns'] )
+        self._arrays = {}
+        self.ids = self.column(ID_COLUMN)
+
+    def names(self):
+        """ @brief Names of the state variables stored for the level
+            @return List of strings, in order of first appearance in the worldfile
+        """
+        return [n for n in self._columns if n not in (ID_COLUMN, RHESSYS_ID_COLUMN)]
+
+    def column(self, name):
+        """ @brief Read-only memory-mapped array of one column, aligned with ids
+            @raise KeyError if the level has no such column
+        """
+        array = self._arrays.get(name)
+        if array is None:
+            column = self._columns[name]
+            if self.count == 0:
+                array = np.empty(0, np.dtype(str(column['dtype'])))
+            else:
+                array = np.memmap(os.path.join(self.directory, column['file']), dtype=np.dtype(str(column['dtype'])),
+                                  mode='r', shape=(self.count,))
+            array = self._arrays[name] = array
+        return array
+
+    def getIndices(self, ids):
+        """ @brief Positions of entities in the columns
+            @param ids Sequence of primary keys
+            @return NumPy array of integers
+            @raise KeyError if an id is not in the level
+        """
+        ids = np.asarray(ids, ID_DTYPE)
+        indices = np.searchsorted(self.ids, ids)
+        missing = (indices >= self.count) | (self.ids[np.minimum(indices, self.count - 1)] != ids) \
+                  if self.count else np.ones(ids.shape, bool)
+        if missing.any():
+            raise KeyError("No state for id %d" % (ids[missing][0],))
+        return indices
+
+    def read(self, names, ids=None):
+        """ @brief Read state variables of many entities at once
+
+            @param names List of strings representing the columns to read, e.g.
+            ['sat_deficit', 'rz_storage'], or 'id' or 'rhessys_id'
+            @param ids Sequence of primary keys of the entities to read, e.g. the
+            patches of a hillslope; None to read every entity of the level
+
+            @return OrderedDict mapping each name to a NumPy array, aligned with ids
+            if given and otherwise with the ids attribute.  Variables an entity
+            lacks are NaN.
+            @raise KeyError if a column or id does not exist
+        """
+        if ids is None:
+            return OrderedDict( (name, np.array(self.column(name))) for name in names )
+        indices = self.getIndices(ids)
+        return OrderedDict( (name, self.column(name)[indices]) for name in names )
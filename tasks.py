@@ -0,0 +1,93 @@
+from celery.task import task
+from django.conf import settings
+from ga_resources.models import DataResource
+
+## Hard time limits, after which the worker running a job is killed
+JOB_TIMEOUT = getattr(settings, 'RHESSYSWEB_JOB_TIMEOUT', 60)
+EXPORT_TIMEOUT = getattr(settings, 'RHESSYSWEB_EXPORT_TIMEOUT', 3600)
+## Seconds between attempts to get a slot of a busy GRASS environment
+SLOT_RETRY = 1
+
+def job_queue():
+    """Queue for interactive jobs, served by workers of their own so clicks do
+    not wait behind exports."""
+    from RHESSysWeb.jobexecutor import INTERACTIVE_QUEUE
+    return getattr(settings, 'RHESSYSWEB_JOB_QUEUE', INTERACTIVE_QUEUE)
+
+def export_queue():
+    from RHESSysWeb.jobexecutor import BULK_QUEUE
+    return getattr(settings, 'RHESSYSWEB_EXPORT_QUEUE', BULK_QUEUE)
+
+def _run_in_environment(current, slug, timeout, func, profile=False):
+    """Call func with the driver of a resource, at most
+    settings.RHESSYSWEB_JOB_ENV_LIMIT jobs at a time per GRASS environment
+    across all workers.  While the environment is busy the task is retried
+    every SLOT_RETRY seconds, for up to timeout seconds.  Only the GRASS work
+    itself runs under grassenv.grass_lock, which is per process: threads of one
+    worker take turns at GRASS, but wait for slots without holding it."""
+    from RHESSysWeb import flowtablestore
+    from RHESSysWeb.drivercache import get_driver
+    from RHESSysWeb.grassenv import grass_lock
+    from RHESSysWeb.jobexecutor import KeySlots, DEFAULT_PER_KEY_LIMIT
+
+    slots = KeySlots(flowtablestore.getConnection(), getattr(settings, 'RHESSYSWEB_JOB_ENV_LIMIT', DEFAULT_PER_KEY_LIMIT))
+    with grass_lock():
+        driver = get_driver(slug, profile=profile)
+    token = slots.acquire('env.%s' % (driver.env.pk,), ttl=timeout)
+    if token is None:
+        raise current.retry(countdown=SLOT_RETRY, max_retries=timeout // SLOT_RETRY)
+    try:
+        with grass_lock():
+            # Another thread may have switched GRASS to its own mapset since
+            driver.ensure_grass()
+            return func(driver)
+    finally:
+        slots.release(token)
+
+@task(time_limit=JOB_TIMEOUT)
+def get_patch(slug, srs, wherex, wherey, profile=False):
+    """The patch at a point, as views.get_patch returns it."""
+    patch, hillslope, zone = _run_in_environment(get_patch, slug, JOB_TIMEOUT,
+        lambda driver: driver.get_fqpatch(srs, wherex, wherey), profile)
+    return dict(patchId=patch, hillId=hillslope, zoneId=zone)
+
+@task(time_limit=JOB_TIMEOUT)
+def get_data_for_point(slug, wherex, wherey, srs, profile=False, **kwargs):
+    """A resource driver's data for a point; see Driver.get_data_for_point."""
+    return _run_in_environment(get_data_for_point, slug, JOB_TIMEOUT,
+        lambda driver: driver.get_data_for_point(wherex, wherey, srs, **kwargs), profile)
+
+@task(time_limit=EXPORT_TIMEOUT)
+def ready_data_resource(slug, profile=False, **kwargs):
+    """Generate the cached GeoTIFF for a resource (and optionally a RASTER other
+    than the environment's default) ahead of the first request for it."""
+    return _run_in_environment(ready_data_resource, slug, EXPORT_TIMEOUT,
+        lambda driver: driver.ready_data_resource(**kwargs), profile)
+
+@task
+def ready_all_rasters(slug):
+    """Queue GeoTIFF generation for every raster of a resource's environment."""
+    driver = DataResource.objects.get(slug=slug).driver_instance
+    for raster, mapset in driver.get_data_fields():
+        ready_data_resource.apply_async((slug,), dict(RASTER=raster), queue=export_queue())
+
+@task
+def import_worldfile(path, name, srid, environment_id=None):
+    """Load a RHESSys worldfile into the World hierarchy; see
+    worldimport.import_worldfile.  Returns the World's primary key."""
+    from RHESSysWeb.models import GrassEnvironment
+    from RHESSysWeb.worldimport import import_worldfile as load
+    environment = GrassEnvironment.objects.get(pk=environment_id) if environment_id is not None else None
+    return load(path, name, srid, environment).pk
+
+@task
+def load_flowgraph(slug, world_id=None):
+    """Load the flow table of a resource's environment into the flow graph
+    tables; see flowgraph.load_flowtable."""
+    import os
+    from django.conf import settings
+    from RHESSysWeb.models import World
+    from RHESSysWeb.flowgraph import load_flowtable
+    env = DataResource.objects.get(slug=slug).driver_instance.env
+    world = World.objects.get(pk=world_id) if world_id is not None else None
+    load_flowtable(env.flow_table.name, os.path.join(settings.MEDIA_ROOT, env.flow_table.name), world)
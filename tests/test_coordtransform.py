@@ -0,0 +1,101 @@
+"""@package tests.test_coordtransform
+
+@brief Test methods for rhessysweb.coordtransform
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_coordtransform
+@endcode
+@note Requires the GDAL Python bindings; skipped otherwise.
+"""
+import threading
+from unittest import TestCase, skipIf
+
+import coordtransform
+from coordtransform import getSpatialReference, getCoordinateTransformation, transformPoints
+
+try:
+    from osgeo import osr
+    HAVE_OSR = hasattr(osr, 'SpatialReference')
+except ImportError:
+    HAVE_OSR = False
+
+## Constants
+ZERO = 0.001
+UTM18N = '+proj=utm +zone=18 +ellps=GRS80 +datum=NAD83 +units=m +no_defs'
+
+## Unit tests
+@skipIf(not HAVE_OSR, "GDAL Python bindings not available")
+class TestCoordTransform(TestCase):
+
+    def testCacheHits(self):
+        self.assertTrue( getSpatialReference(4326) is getSpatialReference(4326) )
+        self.assertTrue( getSpatialReference('EPSG:3857') is getSpatialReference('EPSG:3857') )
+        crx = getCoordinateTransformation(4326, UTM18N)
+        self.assertTrue( getCoordinateTransformation(4326, UTM18N) is crx )
+        self.assertTrue( getCoordinateTransformation(UTM18N, 4326) is not crx )
+
+    def testCachesAreBounded(self):
+        first = getSpatialReference(4326)
+        for code in xrange(32601, 32601 + coordtransform.MAX_SPATIAL_REFERENCES):
+            getSpatialReference(code)
+        self.assertTrue( len(coordtransform._getCache('srs')) == coordtransform.MAX_SPATIAL_REFERENCES )
+        self.assertTrue( getSpatialReference(4326) is not first )
+
+        # Lookups keep an entry recently used
+        crx = getCoordinateTransformation(4326, UTM18N)
+        for code in xrange(32601, 32601 + coordtransform.MAX_TRANSFORMATIONS - 1):
+            getCoordinateTransformation(4326, UTM18N)
+            getCoordinateTransformation(code, 4326)
+        self.assertTrue( len(coordtransform._getCache('transformations')) == coordtransform.MAX_TRANSFORMATIONS )
+        self.assertTrue( getCoordinateTransformation(4326, UTM18N) is crx )
+
+    def testCachePerThread(self):
+        mine = getCoordinateTransformation(4326, UTM18N)
+        theirs = []
+        def lookup():
+            theirs.append(getCoordinateTransformation(4326, UTM18N))
+            theirs.append(getCoordinateTransformation(4326, UTM18N))
+        t = threading.Thread(target=lookup)
+        t.start()
+        t.join()
+        self.assertTrue( theirs[0] is theirs[1] )
+        self.assertTrue( theirs[0] is not mine )
+
+    def testTransformPointsMatchesTransformPoint(self):
+        crx = getCoordinateTransformation(4326, UTM18N)
+        points = [ (-76.75, 39.25), (-76.7, 39.3), (-76.65, 39.35) ]
+        batch = transformPoints(crx, points)
+        self.assertTrue( len(batch) == len(points) )
+        for ((x, y), (bx, by)) in zip(points, batch):
+            (px, py, _) = crx.TransformPoint(x, y)
+            self.assertTrue( abs(px - bx) < ZERO and abs(py - by) < ZERO )
+        self.assertTrue( transformPoints(crx, []) == [] )
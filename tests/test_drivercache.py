@@ -0,0 +1,120 @@
+"""@package tests.test_drivercache
+
+@brief Test methods for rhessysweb.drivercache
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+DJANGO_SETTINGS_MODULE=<settings> python -m unittest test_drivercache
+@endcode
+
+@note Requires Django and the RHESSysWeb app to be importable; skipped
+otherwise.  Pages and the Redis connection are replaced with stand-ins.
+"""
+import os
+from unittest import TestCase, skipIf
+
+try:
+    HAVE_DJANGO = bool(os.environ.get('DJANGO_SETTINGS_MODULE'))
+    if HAVE_DJANGO:
+        from RHESSysWeb import drivercache
+except ImportError:
+    HAVE_DJANGO = False
+
+class Grass(object):
+    """ @brief Stand-in for grassenv: one mapset set up per process """
+    current = None
+
+class FakeDriver(object):
+    def __init__(self, mapset):
+        self.mapset = mapset
+        self.ensure_grass()
+
+    def ensure_grass(self):
+        Grass.current = self.mapset
+
+    def get_fqpatch(self):
+        # The mapset GRASS commands would run against
+        return Grass.current
+
+class FakePages(object):
+    class objects(object):
+        @staticmethod
+        def get(slug):
+            page = type('Page', (object,), {})()
+            page.dataresource = type('DataResource', (object,), {})()
+            page.dataresource.driver_instance = FakeDriver(slug)
+            return page
+
+class FakeConnection(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def incr(self, name):
+        self.values[name] = str(int(self.values.get(name, 0)) + 1)
+
+class FakeStore(object):
+    connection = FakeConnection()
+
+    @classmethod
+    def getConnection(cls):
+        return cls.connection
+
+## Unit tests
+@skipIf(not HAVE_DJANGO, "Django settings not configured")
+class TestDriverCache(TestCase):
+
+    def setUp(self):
+        self.saved = (drivercache.Page, drivercache.flowtablestore)
+        drivercache.Page = FakePages
+        drivercache.flowtablestore = FakeStore
+        drivercache._local.drivers = None
+
+    def tearDown(self):
+        (drivercache.Page, drivercache.flowtablestore) = self.saved
+        drivercache._local.drivers = None
+
+    def testSwitchEnvironments(self):
+        first = drivercache.get_driver('dr5')
+        second = drivercache.get_driver('ellerbe')
+        self.assertTrue( second.get_fqpatch() == 'ellerbe' )
+        # A cached driver sets GRASS up for its own mapset again
+        self.assertTrue( drivercache.get_driver('dr5') is first )
+        self.assertTrue( first.get_fqpatch() == 'dr5' )
+        self.assertTrue( drivercache.get_driver('ellerbe') is second )
+        self.assertTrue( second.get_fqpatch() == 'ellerbe' )
+
+    def testInvalidate(self):
+        first = drivercache.get_driver('dr5')
+        drivercache.invalidate()
+        self.assertTrue( drivercache.get_driver('dr5') is not first )
@@ -0,0 +1,138 @@
+"""@package tests.test_flowgraph
+
+@brief Test methods for rhessysweb.flowgraph
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+DJANGO_SETTINGS_MODULE=<settings> python -m unittest test_flowgraph
+@endcode
+
+@note Requires Django configured with a PostgreSQL database; skipped otherwise.
+Each test runs in a transaction that is rolled back.
+"""
+import os
+import time
+import tempfile
+from shutil import rmtree
+from collections import OrderedDict
+from unittest import skipIf
+
+from flowtableio import FlowTableEntry, FlowTableEntryReceiver, FlowTableEntryRoad, writeFlowtable
+import rhessystypes
+
+try:
+    from django.db import connection
+    HAVE_POSTGRES = bool(os.environ.get('DJANGO_SETTINGS_MODULE')) and connection.vendor == 'postgresql'
+except Exception:
+    HAVE_POSTGRES = False
+
+if HAVE_POSTGRES:
+    from django.test import TestCase
+    from RHESSysWeb import flowgraph
+    from RHESSysWeb.models import FlowEntry
+else:
+    from unittest import TestCase
+
+NAME = 'test_flowgraph.flow'
+
+# Patch: receivers, and for a road patch the stream patch it drains to.  2 and 4
+# drain to each other; 7 drains to a patch that is not in the table.
+GRAPH = OrderedDict( [ (1, ([2, 3], None)), (2, ([4], None)), (3, ([4], None)), (4, ([2], None)),
+                       (5, ([6], 7)), (6, ([7], None)), (7, ([999], None)) ] )
+
+def writeGraph(path, graph, mtime=None):
+    flowtable = OrderedDict()
+    for patchID, (receivers, stream) in graph.items():
+        entry = FlowTableEntry(patchID=patchID, zoneID=1, hillID=1, x=349140.0 + patchID, y=4350600.0, \
+                               z=250.0, accumArea=25.0, area=25, landType=2 if stream else 0, \
+                               totalGamma=0.05, numAdjacent=len(receivers))
+        items = [entry] + [ FlowTableEntryReceiver(r, 1, 1, 1.0 / len(receivers)) for r in receivers ]
+        if stream:
+            items.append(FlowTableEntryRoad(streamPatchID=stream, streamZoneID=1, streamHillID=1, roadWidth=5.0))
+        flowtable[rhessystypes.FQPatchID(patchID=patchID, zoneID=1, hillID=1)] = items
+    writeFlowtable(flowtable, path)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+## Unit tests
+@skipIf(not HAVE_POSTGRES, "PostgreSQL database not configured")
+class TestFlowGraph(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, NAME)
+        writeGraph(self.path, GRAPH)
+        flowgraph.load_flowtable(NAME, self.path)
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def entryID(self, patchID):
+        return flowgraph.get_entry_id(NAME, rhessystypes.FQPatchID(patchID=patchID, zoneID=1, hillID=1))
+
+    def patches(self, entryIDs):
+        return sorted(FlowEntry.objects.filter(id__in=entryIDs.tolist()).values_list('rhessys_patch_id', flat=True))
+
+    def testDownstreamThroughCycle(self):
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(1)])) == [1, 2, 3, 4] )
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(4)])) == [2, 4] )
+
+    def testUpstreamThroughCycle(self):
+        self.assertTrue( self.patches(flowgraph.upstream([self.entryID(4)])) == [1, 2, 3, 4] )
+        self.assertTrue( self.patches(flowgraph.upstream([self.entryID(1)])) == [1] )
+
+    def testRoadDrain(self):
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(5)])) == [5, 6, 7] )
+        self.assertTrue( self.patches(flowgraph.upstream([self.entryID(7)])) == [5, 6, 7] )
+        # Receivers not in the table end the path
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(7)])) == [7] )
+
+    def testMaxDepth(self):
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(1)], 0)) == [1] )
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(1)], 1)) == [1, 2, 3] )
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(1)], 2)) == [1, 2, 3, 4] )
+        # The road drain is one edge
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(5)], 1)) == [5, 6, 7] )
+        self.assertTrue( self.patches(flowgraph.upstream([self.entryID(4)], 1)) == [2, 3, 4] )
+        # Depths beyond the cycle still end
+        self.assertTrue( self.patches(flowgraph.upstream([self.entryID(2)], 10)) == [1, 2, 3, 4] )
+
+    def testReloadOnChange(self):
+        version = flowgraph.get_loaded_version(NAME)
+        self.assertTrue( flowgraph.ensure_flowtable(NAME, self.path) == version )
+        entryID = self.entryID(1)
+        graph = OrderedDict(GRAPH)
+        graph[1] = ([3], None)
+        writeGraph(self.path, graph, mtime=time.time() + 10)
+        newVersion = flowgraph.ensure_flowtable(NAME, self.path)
+        self.assertTrue( newVersion != version and flowgraph.get_loaded_version(NAME) == newVersion )
+        self.assertTrue( self.entryID(1) != entryID )
+        self.assertTrue( self.patches(flowgraph.downstream([self.entryID(1)], 1)) == [1, 3] )
@@ -0,0 +1,117 @@
+"""@package tests.test_flowtablepatch
+
+@brief Test methods for rhessysweb.flowtableio flow table patches
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_flowtablepatch
+@endcode
+"""
+import os
+import filecmp
+import tempfile
+from shutil import rmtree
+from collections import OrderedDict
+from unittest import TestCase
+
+from flowtableio import FlowTableEntry, FlowTableEntryReceiver, FlowTableEntryRoad
+from flowtableio import readFlowtable, writeFlowtable, iterFlowtable
+from flowtableio import writeFlowtablePatch, readFlowtablePatch, applyFlowtablePatch
+import rhessystypes
+
+## Unit tests
+class TestFlowtablePatch(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.flowtablePath = os.path.join(self.tmpDir, 'base.flow')
+        self.patchPath = os.path.join(self.tmpDir, 'edits.patch')
+        self.outPath = os.path.join(self.tmpDir, 'patched.flow')
+
+        flowtable = OrderedDict()
+        for patchID in (101, 102, 103):
+            key = rhessystypes.FQPatchID(patchID=patchID, zoneID=67, hillID=67)
+            entry = FlowTableEntry(patchID=patchID, zoneID=67, hillID=67, x=349140.0 + patchID, \
+                                   y=4350600.0, z=250.5, accumArea=25.0, area=25, \
+                                   landType=2 if patchID == 103 else 0, totalGamma=0.05, numAdjacent=2)
+            items = [ entry, FlowTableEntryReceiver(patchID + 1, 67, 67, 0.025), \
+                      FlowTableEntryReceiver(patchID + 2, 67, 67, 0.025) ]
+            if patchID == 103:
+                items.append(FlowTableEntryRoad(streamPatchID=200, streamZoneID=67, streamHillID=67, roadWidth=5.0))
+            flowtable[key] = items
+        writeFlowtable(flowtable, self.flowtablePath)
+        self.flowtable = readFlowtable(self.flowtablePath)
+
+        self.edited = rhessystypes.FQPatchID(patchID=102, zoneID=67, hillID=67)
+        entry = self.flowtable[self.edited][0]._replace(numAdjacent=1)
+        self.changes = OrderedDict( [ (self.edited, [ entry, FlowTableEntryReceiver(150, 67, 67, 0.05) ]) ] )
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def testIterFlowtable(self):
+        items = list(iterFlowtable(self.flowtablePath))
+        self.assertTrue( [ key for key, _ in items ] == self.flowtable.keys() )
+        self.assertTrue( isinstance(items[2][1][-1], FlowTableEntryRoad) )
+        self.assertTrue( len(items[0][1]) == 3 )
+
+    def testReadWritePatch(self):
+        writeFlowtablePatch(self.changes, self.patchPath, base='base.flow', baseVersion='1.0')
+        (header, changes) = readFlowtablePatch(self.patchPath)
+        self.assertTrue( header['base'] == 'base.flow' and header['numEntries'] == 1 )
+        self.assertTrue( changes.keys() == [self.edited] )
+        self.assertTrue( changes[self.edited][0] == self.changes[self.edited][0] )
+        self.assertTrue( changes[self.edited][1].patchID == 150 )
+
+    def testApplyPatch(self):
+        writeFlowtablePatch(self.changes, self.patchPath)
+        applyFlowtablePatch(self.flowtablePath, self.patchPath, self.outPath)
+        patched = readFlowtable(self.outPath)
+        self.assertTrue( patched.keys() == self.flowtable.keys() )
+        self.assertTrue( len(patched[self.edited]) == 2 )
+        self.assertTrue( patched[self.edited][1].patchID == 150 )
+        for key in self.flowtable:
+            if key != self.edited:
+                self.assertTrue( len(patched[key]) == len(self.flowtable[key]) )
+
+        # Patching back to the original reproduces the base table exactly
+        revert = OrderedDict( [ (self.edited, self.flowtable[self.edited]) ] )
+        writeFlowtablePatch(revert, self.patchPath)
+        revertedPath = os.path.join(self.tmpDir, 'reverted.flow')
+        applyFlowtablePatch(self.outPath, self.patchPath, revertedPath)
+        self.assertTrue( filecmp.cmp(self.flowtablePath, revertedPath, shallow=False) )
+
+    def testApplyPatchToWrongTable(self):
+        missing = rhessystypes.FQPatchID(patchID=999, zoneID=67, hillID=67)
+        entry = self.changes[self.edited][0]._replace(patchID=999)
+        writeFlowtablePatch(OrderedDict( [ (missing, [entry]) ] ), self.patchPath)
+        self.assertRaises(KeyError, applyFlowtablePatch, self.flowtablePath, self.patchPath, self.outPath)
+        self.assertTrue( not os.path.exists(self.outPath) )
@@ -0,0 +1,100 @@
+"""@package tests.test_flowtablerollup
+
+@brief Test methods for rhessysweb.flowtablerollup
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_flowtablerollup
+@endcode
+"""
+import os
+import tempfile
+from shutil import rmtree
+from collections import OrderedDict
+from unittest import TestCase
+
+import numpy as np
+
+from flowtableio import FlowTableEntry, FlowTableEntryReceiver, writeFlowtable
+from flowtablerollup import readFlowtableArrays, getEntryArrays, getRollups, getMeans
+from flowtablerollup import ROLLUP_BASIN, ROLLUP_HILLSLOPE, ROLLUP_ZONE
+import rhessystypes
+
+def _entry(patchID, zoneID, hillID, area, z):
+    return FlowTableEntry(patchID=patchID, zoneID=zoneID, hillID=hillID, x=0.0, y=0.0, z=z, accumArea=area,
+                          area=area, landType=0, totalGamma=0.05, numAdjacent=1)
+
+ENTRIES = [ _entry(1, 10, 2, 25, 100.0), _entry(2, 10, 2, 75, 200.0), _entry(3, 11, 2, 50, 300.0),
+            _entry(4, 10, 1, 100, 400.0) ]
+
+## Unit tests
+class TestFlowtableRollup(TestCase):
+
+    def testGetRollups(self):
+        arrays = getEntryArrays(ENTRIES)
+
+        keys, rollups = getRollups(arrays, ROLLUP_BASIN)
+        self.assertTrue(keys == [()])
+        self.assertTrue(rollups['patchCount'].tolist() == [4])
+        self.assertTrue(rollups['area'].tolist() == [250])
+
+        keys, rollups = getRollups(arrays, ROLLUP_HILLSLOPE)
+        self.assertTrue(keys == [(1,), (2,)])
+        self.assertTrue(rollups['patchCount'].tolist() == [1, 3])
+        self.assertTrue(rollups['area'].tolist() == [100, 150])
+        (zMean, zAreaMean) = getMeans(rollups)
+        self.assertTrue(np.allclose(zMean, [400.0, 200.0]))
+        self.assertTrue(np.allclose(zAreaMean, [400.0, (25 * 100.0 + 75 * 200.0 + 50 * 300.0) / 150]))
+
+        keys, rollups = getRollups(arrays, ROLLUP_ZONE)
+        self.assertTrue(keys == [(1, 10), (2, 10), (2, 11)])
+        self.assertTrue(rollups['patchCount'].tolist() == [1, 2, 1])
+        self.assertTrue(rollups['zSum'].tolist() == [400.0, 300.0, 300.0])
+
+    def testGetRollupsEmpty(self):
+        keys, rollups = getRollups(getEntryArrays([]), ROLLUP_ZONE)
+        self.assertTrue(keys == [])
+        self.assertTrue(len(rollups['area']) == 0)
+
+    def testReadFlowtableArrays(self):
+        tmpDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpDir, 'test.flow')
+            flowtable = OrderedDict()
+            for entry in ENTRIES:
+                key = rhessystypes.FQPatchID(patchID=entry.patchID, zoneID=entry.zoneID, hillID=entry.hillID)
+                flowtable[key] = [ entry, FlowTableEntryReceiver(99, 10, 1, 0.05) ]
+            writeFlowtable(flowtable, path)
+            arrays = readFlowtableArrays(path)
+            self.assertTrue(arrays['hillID'].tolist() == [2, 2, 2, 1])
+            self.assertTrue(arrays['area'].tolist() == [25, 75, 50, 100])
+        finally:
+            rmtree(tmpDir)
@@ -0,0 +1,145 @@
+"""@package tests.test_grasscatalog
+
+@brief Test methods for rhessysweb.grasscatalog
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_grasscatalog
+@endcode
+
+@note Uses a synthetic GRASS location; does not require GRASS.
+"""
+import os
+import time
+import struct
+import tempfile
+from shutil import rmtree
+from unittest import TestCase
+
+from grasscatalog import RasterCatalog, CELL, FCELL, DCELL
+
+CELLHD = """proj:       1
+zone:       17
+north:      100
+south:      0
+east:       50
+west:       0
+cols:       10
+rows:       20
+e-w resol:  5
+n-s resol:  5
+format:     %d
+compressed: 1
+"""
+
+## Unit tests
+class TestGrassCatalog(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.locationPath = os.path.join(self.tmpDir, 'GRASSData', 'DR5_5m')
+        self.writeRaster('taehee', 'patch_5m', CELL, (1, 300))
+        self.writeRaster('taehee', 'elev', DCELL, (101.5, 250.25))
+        self.writeRaster('PERMANENT', 'basin_dr5', CELL, (0, 1))
+        self.writeRaster('PERMANENT', 'elev', FCELL, None)
+        self.catalog = RasterCatalog(os.path.join(self.tmpDir, 'GRASSData'), 'DR5_5m', 'taehee', \
+                                     checkInterval=0)
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def writeRaster(self, mapset, name, cellType, valueRange, mtime=None):
+        mapsetPath = os.path.join(self.locationPath, mapset)
+        for element in ('cellhd', 'cell', 'fcell', os.path.join('cell_misc', name)):
+            if not os.path.isdir(os.path.join(mapsetPath, element)):
+                os.makedirs(os.path.join(mapsetPath, element))
+        with open(os.path.join(mapsetPath, 'cellhd', name), 'w') as f:
+            f.write(CELLHD % (3 if cellType == CELL else -1,))
+        open(os.path.join(mapsetPath, 'cell', name), 'w').close()
+        miscPath = os.path.join(mapsetPath, 'cell_misc', name)
+        if cellType == CELL:
+            with open(os.path.join(miscPath, 'range'), 'w') as f:
+                if valueRange:
+                    f.write('%d %d\n' % valueRange)
+        else:
+            open(os.path.join(mapsetPath, 'fcell', name), 'w').close()
+            with open(os.path.join(miscPath, 'f_format'), 'w') as f:
+                f.write('type: %s\n' % ('double' if cellType == DCELL else 'float',))
+            with open(os.path.join(miscPath, 'f_range'), 'wb') as f:
+                if valueRange:
+                    f.write(struct.pack('>dd', *valueRange))
+        if mtime:
+            for element in ('cellhd', 'cell'):
+                os.utime(os.path.join(mapsetPath, element, name), (mtime, mtime))
+
+    def testSearchPathOrder(self):
+        self.assertTrue( self.catalog.pairs() == [('elev', 'taehee'), ('patch_5m', 'taehee'), \
+                                                  ('basin_dr5', 'PERMANENT'), ('elev', 'PERMANENT')] )
+        self.assertTrue( self.catalog.qualifiedNames()[0] == 'elev@taehee' )
+        self.assertTrue( self.catalog.get('elev').mapset == 'taehee' )
+        self.assertTrue( self.catalog.get('elev@PERMANENT').mapset == 'PERMANENT' )
+        self.assertTrue( self.catalog.get('basin_dr5').mapset == 'PERMANENT' )
+        self.assertRaises(KeyError, self.catalog.get, 'hillslope')
+
+    def testRasterInfo(self):
+        patch = self.catalog.get('patch_5m')
+        self.assertTrue( patch.type == CELL )
+        self.assertTrue( (patch.min, patch.max) == (1, 300) )
+        self.assertTrue( (patch.rows, patch.cols, patch.nsres, patch.ewres) == (20, 10, 5.0, 5.0) )
+        elev = self.catalog.get('elev')
+        self.assertTrue( elev.type == DCELL )
+        self.assertTrue( (elev.min, elev.max) == (101.5, 250.25) )
+        # All-null raster
+        elev = self.catalog.get('elev@PERMANENT')
+        self.assertTrue( elev.type == FCELL )
+        self.assertTrue( (elev.min, elev.max) == (None, None) )
+
+    def testRefreshOnChange(self):
+        self.assertTrue( self.catalog.get('patch_5m').max == 300 )
+        self.writeRaster('taehee', 'patch_5m', CELL, (1, 600), mtime=time.time() + 10)
+        self.writeRaster('taehee', 'hillslope', CELL, (1, 12))
+        self.assertTrue( self.catalog.get('patch_5m').max == 600 )
+        self.assertTrue( self.catalog.get('hillslope').max == 12 )
+
+    def testNoRescanWithoutDirectoryChange(self):
+        for mapset in ('taehee', 'PERMANENT'):
+            for element in ('cellhd', 'cell', 'fcell'):
+                os.utime(os.path.join(self.locationPath, mapset, element), (1, 1))
+        stamp = self.catalog.get('patch_5m').stamp
+        path = os.path.join(self.locationPath, 'taehee', 'cell', 'patch_5m')
+        mtime = int(stamp) + 10
+        os.utime(path, (mtime, mtime))
+        # Rewriting a file in place does not change its directory
+        self.assertTrue( self.catalog.get('patch_5m').stamp == stamp )
+        # GRASS moves rasters into place, which does
+        os.rename(path, path + '.tmp')
+        os.rename(path + '.tmp', path)
+        self.assertTrue( self.catalog.get('patch_5m').stamp == mtime )
@@ -0,0 +1,107 @@
+"""@package tests.test_jobexecutor
+
+@brief Test methods for rhessysweb.jobexecutor
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_jobexecutor
+@endcode
+"""
+from unittest import TestCase
+
+from jobexecutor import KeySlots, getJobStatus
+from jobexecutor import PENDING, RUNNING, DONE, FAILED, CANCELLED
+
+class DictConnection(object):
+    """ @brief The part of redis.Redis used by KeySlots, with expiries set by hand """
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def set(self, name, value, nx=False, ex=None):
+        if nx and name in self.values:
+            return None
+        self.values[name] = value
+        self.ttls[name] = ex
+        return True
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def delete(self, name):
+        self.values.pop(name, None)
+
+    def eval(self, script, numkeys, name, holder):
+        # Stands in for RELEASE_SCRIPT
+        if self.values.get(name) == holder:
+            self.delete(name)
+            return 1
+        return 0
+
+    def expire(self, name):
+        self.delete(name)
+
+## Unit tests
+class TestKeySlots(TestCase):
+
+    def setUp(self):
+        self.conn = DictConnection()
+        self.slots = KeySlots(self.conn, limit=2)
+
+    def testPerKeyLimit(self):
+        first = self.slots.acquire('env.1', ttl=60)
+        second = self.slots.acquire('env.1', ttl=60)
+        self.assertTrue( first and second and first != second )
+        self.assertTrue( self.slots.acquire('env.1') is None )
+        # Other keys have their own slots
+        self.assertTrue( self.slots.acquire('env.2') is not None )
+        self.slots.release(first)
+        self.assertTrue( self.slots.acquire('env.1') is not None )
+
+    def testSlotsExpire(self):
+        token = self.slots.acquire('env.1', ttl=60)
+        self.assertTrue( 60 in self.conn.ttls.values() )
+        self.slots.acquire('env.1', ttl=60)
+        # A worker killed mid-job never releases its slot; it expires instead
+        self.conn.expire(token.rsplit(':', 1)[0])
+        other = self.slots.acquire('env.1', ttl=60)
+        self.assertTrue( other is not None )
+        # Releasing the expired slot leaves its new holder alone
+        self.slots.release(token)
+        self.assertTrue( self.slots.acquire('env.1') is None )
+
+    def testJobStatus(self):
+        self.assertTrue( getJobStatus('PENDING') == PENDING )
+        self.assertTrue( getJobStatus('RETRY') == PENDING )
+        self.assertTrue( getJobStatus('STARTED') == RUNNING )
+        self.assertTrue( getJobStatus('SUCCESS') == DONE )
+        self.assertTrue( getJobStatus('FAILURE') == FAILED )
+        self.assertTrue( getJobStatus('REVOKED') == CANCELLED )
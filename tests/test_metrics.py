@@ -0,0 +1,112 @@
+"""@package tests.test_metrics
+
+@brief Test methods for rhessysweb.metrics
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_metrics
+@endcode
+"""
+from unittest import TestCase
+
+import metrics
+
+## Unit tests
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        metrics.setEnabled(True)
+
+    def tearDown(self):
+        metrics.setEnabled(False)
+        metrics.reset()
+        metrics.endRequest()
+
+    def testDisabledIsNoop(self):
+        metrics.setEnabled(False)
+        metrics.increment('calls')
+        with metrics.timer('op'):
+            pass
+        items = [1, 2, 3]
+        self.assertTrue(metrics.timedIter('scan', items) is items)
+        self.assertTrue(metrics.renderPrometheus() == '\n')
+
+    def testCounters(self):
+        metrics.increment('pointcache_hits')
+        metrics.increment('pointcache_hits')
+        metrics.increment('raster_bytes_read', 1024)
+        text = metrics.renderPrometheus()
+        self.assertTrue('# TYPE rhessysweb_pointcache_hits_total counter' in text)
+        self.assertTrue('rhessysweb_pointcache_hits_total 2.0' in text)
+        self.assertTrue('rhessysweb_raster_bytes_read_total 1024.0' in text)
+
+    def testHistogram(self):
+        metrics.observe('redis_hget', 0.002)
+        metrics.observe('redis_hget', 0.2)
+        metrics.observe('redis_hget', 100.0)
+        lines = metrics.renderPrometheus().splitlines()
+        self.assertTrue('# TYPE rhessysweb_redis_hget_seconds histogram' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_bucket{le="0.001"} 0' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_bucket{le="0.0025"} 1' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_bucket{le="0.25"} 2' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_bucket{le="60.0"} 2' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_bucket{le="+Inf"} 3' in lines)
+        self.assertTrue('rhessysweb_redis_hget_seconds_count 3' in lines)
+
+    def testTimedIter(self):
+        self.assertTrue(list(metrics.timedIter('raster_scan', iter([1, 2, 3]))) == [1, 2, 3])
+        self.assertTrue('rhessysweb_raster_scan_seconds_count 1' in metrics.renderPrometheus())
+
+    def testRequestTimings(self):
+        @metrics.timed('grass_r_what')
+        def query():
+            return 42
+
+        metrics.beginRequest()
+        self.assertTrue(query() == 42)
+        with metrics.timer('redis_hget'):
+            pass
+        with metrics.timer('redis_hget'):
+            pass
+        timings = metrics.endRequest()
+        self.assertTrue(timings.keys() == ['grass_r_what', 'redis_hget'])
+        self.assertTrue(timings['redis_hget'][1] == 2)
+
+        header = metrics.formatServerTiming(timings, 0.5)
+        self.assertTrue(header.startswith('grass_r_what;dur='))
+        self.assertTrue('desc="2 calls"' in header)
+        self.assertTrue(header.endswith('total;dur=500.000'))
+
+        # Operations outside a request are not attributed to one
+        with metrics.timer('redis_hget'):
+            pass
+        self.assertTrue(len(metrics.endRequest()) == 0)
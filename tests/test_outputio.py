@@ -0,0 +1,108 @@
+"""@package tests.test_outputio
+
+@brief Test methods for rhessysweb.outputio
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_outputio
+@endcode
+"""
+from datetime import date
+from StringIO import StringIO
+from unittest import TestCase
+
+import numpy as np
+
+from outputio import OutputReader, readOutput, readOutputHeader, getDates
+
+HEADER = 'day month year basinID hillID zoneID patchID rz_storage evap lai \n'
+
+def _daily(years):
+    lines = [HEADER]
+    for year in years:
+        for (month, day) in ((1, 1), (6, 15), (12, 31)):
+            for patchID in (101, 102):
+                lines.append('%d %d %d 1 67 67 %d %f 0.5 nan \n' % (day, month, year, patchID, year + patchID / 1000.0))
+    return ''.join(lines)
+
+## Unit tests
+class TestOutputIO(TestCase):
+
+    def testReadOutputHeader(self):
+        self.assertTrue(readOutputHeader(StringIO(_daily([2000]))) ==
+                        ['day', 'month', 'year', 'basinID', 'hillID', 'zoneID', 'patchID', 'rz_storage', 'evap', 'lai'])
+
+    def testReadOutput(self):
+        out = readOutput(StringIO(_daily([2000, 2001])), chunkRows=4)
+        self.assertTrue(len(out) == 12)
+        self.assertTrue(out.dtype['year'] == np.int64)
+        self.assertTrue(out.dtype['evap'] == np.float64)
+        self.assertTrue(list(out['patchID'][:4]) == [101, 102, 101, 102])
+        self.assertTrue(np.isnan(out['lai']).all())
+        self.assertTrue(abs(out['rz_storage'][-1] - 2001.102) < 1e-9)
+
+    def testProjection(self):
+        out = readOutput(StringIO(_daily([2000])), columns=['patchID', 'evap'], dtype=np.float32)
+        self.assertTrue(out.dtype.names == ('patchID', 'evap'))
+        self.assertTrue(out.dtype['evap'] == np.float32)
+        self.assertRaises(ValueError, readOutput, StringIO(_daily([2000])), columns=['missing'])
+
+    def testDateRange(self):
+        f = StringIO(_daily(range(1990, 2010)))
+        with OutputReader(f, columns=['patchID', 'rz_storage'], start=date(2000, 6, 15), end=date(2001, 6, 15),
+                          chunkRows=6) as reader:
+            batches = list(reader)
+            self.assertTrue(all(len(b) <= 6 for b in batches))
+            out = np.concatenate(batches)
+        self.assertTrue(len(out) == 8)
+        self.assertTrue(np.floor(out['rz_storage']).tolist() == [2000] * 4 + [2001] * 4)
+        # Reading stops after the end of the range
+        self.assertTrue(reader.lineNumber < 1 + 20 * 6)
+
+    def testMonthly(self):
+        f = StringIO('month year basinID streamflow\n' +
+                     ''.join('%d %d 1 %d.5\n' % (m, y, m) for y in (2000, 2001) for m in range(1, 13)))
+        out = readOutput(f, start=date(2000, 11, 30), end=date(2001, 2, 1))
+        self.assertTrue(out['month'].tolist() == [11, 12, 1, 2])
+        self.assertTrue(getDates(out).tolist() == [date(2000, 11, 1), date(2000, 12, 1),
+                                                   date(2001, 1, 1), date(2001, 2, 1)])
+
+    def testGetDates(self):
+        out = readOutput(StringIO(_daily([2004])), columns=['year', 'month', 'day'])
+        self.assertTrue(getDates(out)[-1] == np.datetime64('2004-12-31'))
+
+    def testBadLine(self):
+        f = StringIO(HEADER + '1 1 2000 1 67 67 101 0.1 0.5 0.2\n' + '2 1 2000 1 67 67 101 x 0.5 0.2\n')
+        try:
+            readOutput(f)
+            self.assertTrue(False)
+        except ValueError as e:
+            self.assertTrue('line 3' in str(e))
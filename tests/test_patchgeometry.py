@@ -0,0 +1,73 @@
+"""@package tests.test_patchgeometry
+
+@brief Test methods for rhessysweb.patchgeometry
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_patchgeometry
+@endcode
+"""
+from unittest import TestCase
+
+from rhessystypes import getCoordinatePair
+from patchgeometry import snapCells, roundCoordinates, getMetersPerPixel
+
+## Unit tests
+class TestPatchGeometry(TestCase):
+
+    def setUp(self):
+        # A 20 x 10 block of 5 m cells
+        self.pairs = [ getCoordinatePair(e + 2.5, n + 2.5) \
+                       for e in range(0, 100, 5) for n in range(0, 50, 5) ]
+
+    def testSnapCellsWithoutZoom(self):
+        points = snapCells(self.pairs, 5.0)
+        self.assertTrue(points.shape == (200, 2))
+        self.assertTrue(points[0][0] == 2.5 and points[0][1] == 2.5)
+
+    def testSnapCellsFinerThanCells(self):
+        # At zoom 18 a pixel (~0.6 m) is smaller than a cell: nothing to generalize
+        points = snapCells(self.pairs, 5.0, zoom=18)
+        self.assertTrue(points.shape == (200, 2))
+
+    def testSnapCellsCoarserThanCells(self):
+        # At zoom 14 a pixel is ~9.6 m, so several cells share each pixel
+        pixel = getMetersPerPixel(14)
+        points = snapCells(self.pairs, 5.0, zoom=14)
+        self.assertTrue(len(points) < len(self.pairs))
+        pixels = set( (int(e // pixel), int(n // pixel)) for (e, n) in points )
+        self.assertTrue(len(pixels) == len(points))
+        for p in self.pairs:
+            self.assertTrue( (int(p.easting // pixel), int(p.northing // pixel)) in pixels )
+
+    def testRoundCoordinates(self):
+        rounded = roundCoordinates([ [(1.23456, 2.34567), (3, 4)] ], 2)
+        self.assertTrue(rounded == [ [[1.23, 2.35], [3.0, 4.0]] ])
@@ -0,0 +1,92 @@
+"""@package tests.test_patchqueryset
+
+@brief Test methods for rhessysweb.models.PatchQuerySet
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+DJANGO_SETTINGS_MODULE=<settings> python -m unittest test_patchqueryset
+@endcode
+
+@note Requires Django configured with a PostGIS database; skipped otherwise.
+Each test runs in a transaction that is rolled back.
+"""
+import os
+from unittest import skipIf
+
+try:
+    from django.db import connection
+    HAVE_POSTGRES = bool(os.environ.get('DJANGO_SETTINGS_MODULE')) and connection.vendor == 'postgresql'
+except Exception:
+    HAVE_POSTGRES = False
+
+if HAVE_POSTGRES:
+    from django.test import TestCase
+    from django.contrib.gis.geos import Point
+    from RHESSysWeb.models import World, Basin, Hillslope, Zone, Patch
+else:
+    from unittest import TestCase
+
+## Unit tests
+@skipIf(not HAVE_POSTGRES, "PostgreSQL database not configured")
+class TestPatchQuerySet(TestCase):
+
+    def setUp(self):
+        origin = Point(-79.0, 35.9, srid=4326)
+        self.world = World.objects.create(name='DR5', rhessys_id=1)
+        basin = Basin.objects.create(rhessys_id=1, point=origin, world=self.world)
+        self.hillslope = Hillslope.objects.create(rhessys_id=1, point=origin, basin=basin)
+        self.zones = [ Zone.objects.create(rhessys_id=i, point=origin, hillslope=self.hillslope) for i in (1, 2) ]
+        # Created out of primary key order
+        self.patches = {}
+        for pk, zone, lon in ( (9000030, 0, -79.0), (9000010, 1, -78.0), (9000020, 0, -77.0) ):
+            self.patches[pk] = Patch.objects.create(id=pk, rhessys_id=pk, point=Point(lon, 35.9, srid=4326),
+                zone=self.zones[zone], hillslope=self.hillslope, basin=basin, world=self.world)
+
+    def testIdsAscending(self):
+        ids = Patch.objects.in_world(self.world).ids()
+        self.assertTrue( ids.dtype.name == 'int64' )
+        self.assertTrue( ids.tolist() == [9000010, 9000020, 9000030] )
+        # Any ordering of the query is replaced
+        self.assertTrue( Patch.objects.in_world(self.world).order_by('-id').ids().tolist() == [9000010, 9000020, 9000030] )
+
+    def testChaining(self):
+        self.assertTrue( Patch.objects.in_world(self.world).in_zone(self.zones[0]).ids().tolist() == [9000020, 9000030] )
+        self.assertTrue( Patch.objects.in_hillslope(self.hillslope).in_bbox(-79.5, 35.0, -77.5, 36.5, 4326).ids().tolist() == \
+                         [9000010, 9000030] )
+        self.assertTrue( Patch.objects.in_bbox(-79.5, 35.0, -77.5, 36.5, 4326).in_zone(self.zones[1]).ids().tolist() == \
+                         [9000010] )
+        self.assertTrue( len(Patch.objects.in_zone(self.zones[1]).in_zone(self.zones[0]).ids()) == 0 )
+
+    def testBboxInOtherSRID(self):
+        corner = Point(-79.5, 35.0, srid=4326).transform(3857, clone=True)
+        opposite = Point(-77.5, 36.5, srid=4326).transform(3857, clone=True)
+        ids = Patch.objects.in_world(self.world).in_bbox(corner.x, corner.y, opposite.x, opposite.y, 3857).ids()
+        self.assertTrue( ids.tolist() == [9000010, 9000030] )
@@ -0,0 +1,85 @@
+"""@package tests.test_pointcache
+
+@brief Test methods for rhessysweb.pointcache
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_pointcache
+@endcode
+"""
+from unittest import TestCase
+
+from rhessystypes import FQPatchID
+from rasterbackend import getRasterWindow
+from pointcache import PointCache, getCellForCoordinates
+
+## Unit tests
+class TestPointCache(TestCase):
+
+    def setUp(self):
+        self.cache = PointCache(maxEntries=2)
+
+    def testCellForCoordinates(self):
+        window = getRasterWindow(north=150.0, south=0.0, east=200.0, west=0.0, rows=30, cols=40)
+        self.assertTrue(getCellForCoordinates(window, 0.1, 149.9) == (0, 0))
+        self.assertTrue(getCellForCoordinates(window, 4.9, 145.1) == (0, 0))
+        self.assertTrue(getCellForCoordinates(window, 5.1, 144.9) == (1, 1))
+        self.assertTrue(getCellForCoordinates(window, -0.1, 150.1) == (-1, -1))
+
+    def testEvictsLeastRecentlyUsed(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.assertTrue(self.cache.get('a') == 1)
+        self.cache.put('c', 3)
+        self.assertTrue(len(self.cache) == 2)
+        self.assertTrue(self.cache.get('b') is None)
+        self.assertTrue(self.cache.get('a') == 1)
+        self.assertTrue(self.cache.get('c') == 3)
+
+    def testInvalidateByTag(self):
+        edited = FQPatchID(patchID=1, zoneID=1, hillID=1)
+        other = FQPatchID(patchID=2, zoneID=1, hillID=1)
+        self.cache.put('a', 1, namespace='flow.txt', tags=[edited])
+        self.cache.put('b', 2, namespace='flow.txt', tags=[other])
+        # Tags are scoped to their namespace
+        self.assertTrue(self.cache.invalidate('other.txt', edited) == 0)
+        self.assertTrue(self.cache.invalidate('flow.txt', edited) == 1)
+        self.assertTrue(self.cache.get('a') is None)
+        self.assertTrue(self.cache.get('b') == 2)
+
+    def testReturnsCopies(self):
+        result = {'features': [1]}
+        self.cache.put('a', result)
+        result['features'].append(2)
+        cached = self.cache.get('a')
+        self.assertTrue(cached == {'features': [1]})
+        cached['features'].append(3)
+        self.assertTrue(self.cache.get('a') == {'features': [1]})
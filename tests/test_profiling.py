@@ -0,0 +1,113 @@
+"""@package tests.test_profiling
+
+@brief Test methods for rhessysweb.profiling
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_profiling
+@endcode
+"""
+import os
+import json
+import pstats
+import shutil
+import tempfile
+from unittest import TestCase
+
+from profiling import Profiler, RateLimiter, PROFILE_SUFFIX, METADATA_SUFFIX
+
+def _work(n, scale=1):
+    return sum(i * scale for i in xrange(n))
+
+def _fail():
+    raise ValueError("bad raster")
+
+## Unit tests
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _files(self, suffix):
+        return sorted(f for f in os.listdir(self.root) if f.endswith(suffix))
+
+    def testRateLimiter(self):
+        limiter = RateLimiter(maxCalls=2, interval=10, maxConcurrent=1)
+        self.assertTrue(limiter.acquire(now=100))
+        # One call at a time
+        self.assertTrue(not limiter.acquire(now=101))
+        limiter.release()
+        self.assertTrue(limiter.acquire(now=102))
+        limiter.release()
+        # Two calls per interval
+        self.assertTrue(not limiter.acquire(now=105))
+        self.assertTrue(limiter.acquire(now=110.5))
+        limiter.release()
+
+    def testCall(self):
+        shutil.rmtree(self.root)
+        # The directory is created if missing
+        profiler = Profiler(self.root)
+        result = profiler.call('test.get_data_for_point', dict(mapset='PERMANENT'), _work, 1000, scale=2)
+        self.assertTrue(result == _work(1000, 2))
+
+        profiles = self._files(PROFILE_SUFFIX)
+        self.assertTrue(len(profiles) == 1)
+        self.assertTrue('test.get_data_for_point' in profiles[0])
+        stats = pstats.Stats(os.path.join(self.root, profiles[0]))
+        self.assertTrue(any(func[2] == '_work' for func in stats.stats))
+
+        with open(os.path.join(self.root, self._files(METADATA_SUFFIX)[0])) as f:
+            info = json.load(f)
+        self.assertTrue(info['name'] == 'test.get_data_for_point')
+        self.assertTrue(info['metadata'] == dict(mapset='PERMANENT'))
+        self.assertTrue(info['args'] == ['1000'])
+        self.assertTrue(info['kwargs'] == dict(scale='2'))
+        self.assertTrue(info['profile'] == profiles[0])
+        self.assertTrue(info['error'] is None)
+
+    def testCallOverLimit(self):
+        profiler = Profiler(self.root, RateLimiter(maxCalls=1, interval=3600))
+        profiler.call('first', {}, _work, 10)
+        self.assertTrue(profiler.call('second', {}, _work, 10) == _work(10))
+        self.assertTrue(len(self._files(PROFILE_SUFFIX)) == 1)
+
+    def testCallError(self):
+        profiler = Profiler(self.root)
+        self.assertRaises(ValueError, profiler.call, 'failing', {}, _fail)
+        with open(os.path.join(self.root, self._files(METADATA_SUFFIX)[0])) as f:
+            info = json.load(f)
+        self.assertTrue(info['error'] == 'ValueError: bad raster')
+        # The limiter is released after a failure
+        self.assertTrue(profiler.limiter._running == 0)
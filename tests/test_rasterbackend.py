@@ -0,0 +1,239 @@
+"""@package tests.test_rasterbackend
+
+@brief Test methods for rhessysweb.rasterbackend
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_rasterbackend
+@endcode
+
+@note Uses synthetic rasters; does not require GRASS.  The GDAL backend tests
+are skipped when the GDAL Python bindings are not available.
+"""
+import os
+import tempfile
+from shutil import rmtree
+from unittest import TestCase, skipIf
+
+import numpy as np
+
+import rhessystypes
+from rasterbackend import RasterBackend
+from rasterbackend import ArrayRasterBackend
+from rasterbackend import GDALRasterBackend
+from rasterbackend import getRasterWindow
+from rasterbackend import getNullMask, CELL_NULL
+from rasterbackend import exportRastersAsArrays
+from rasterbackend import getCachedArrayBackend
+from grassdatalookup import GrassDataLookup
+
+try:
+    from osgeo import gdal
+    HAVE_GDAL = gdal.GetDriverByName('GTiff') is not None
+except (ImportError, AttributeError):
+    HAVE_GDAL = False
+
+## Constants
+ZERO = 0.001
+NODATA = 0
+
+## Unit tests
+class TestArrayRasterBackend(TestCase):
+
+    def setUp(self):
+        # 40 x 30 grid of 5m cells; each patch covers a 2 x 2 block of cells,
+        # zones cover 10 rows, and hillslopes split the grid east/west
+        self.window = getRasterWindow(north=4350605.0, south=4350405.0, \
+                                      east=349283.0, west=349133.0, rows=40, cols=30)
+        rows, cols = np.indices((40, 30))
+        self.patch = ((rows // 2) * 15 + (cols // 2) + 1).astype(np.int32)
+        self.zone = (rows // 10 + 1).astype(np.int32)
+        self.hill = np.where(cols < 15, 1, 2).astype(np.int32)
+        self.backend = ArrayRasterBackend(self.window, \
+                                          { 'patch' : self.patch, 'zone' : self.zone, 'hill' : self.hill })
+        self.grassdatalookup = GrassDataLookup(backend=self.backend)
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def testReadBlocksCoversWindow(self):
+        rows = []
+        for startRow, (patch, zone) in self.backend.readBlocks(['patch', 'zone'], blockRows=7):
+            self.assertTrue( patch.shape == zone.shape )
+            rows.append(patch)
+        self.assertTrue( np.array_equal(np.vstack(rows), self.patch) )
+
+    def testGetCoordinatesForFQPatchIDs(self):
+        fqPatchIDs = [ rhessystypes.FQPatchID(patchID=1, zoneID=1, hillID=1), \
+                       rhessystypes.FQPatchID(patchID=300, zoneID=4, hillID=2) ]
+        coords = self.grassdatalookup.getCoordinatesForFQPatchIDs(fqPatchIDs, 'patch', 'zone', 'hill')
+        self.assertTrue( coords.keys() == fqPatchIDs )
+        first = coords[fqPatchIDs[0]]
+        self.assertTrue( len(first) == 4 )
+        self.assertTrue( abs(first[0].easting - 349135.5) < ZERO )
+        self.assertTrue( abs(first[0].northing - 4350602.5) < ZERO )
+        self.assertTrue( abs(first[3].easting - 349140.5) < ZERO )
+        self.assertTrue( abs(first[3].northing - 4350597.5) < ZERO )
+        last = coords[fqPatchIDs[1]]
+        self.assertTrue( len(last) == 4 )
+        self.assertTrue( abs(last[3].easting - 349280.5) < ZERO )
+        self.assertTrue( abs(last[3].northing - 4350407.5) < ZERO )
+
+    def testGetCoordinatesForMissingFQPatchID(self):
+        fqPatchIDs = [ rhessystypes.FQPatchID(patchID=1, zoneID=2, hillID=1) ]
+        self.assertRaises(KeyError, self.grassdatalookup.getCoordinatesForFQPatchIDs, \
+                          fqPatchIDs, 'patch', 'zone', 'hill')
+
+    def testGetFQPatchIDForCoordinates(self):
+        coordinate = rhessystypes.getCoordinatePair(349210.0, 4350500.0)
+        (patchID, zoneID, hillID) = \
+            self.grassdatalookup.getFQPatchIDForCoordinates(coordinate, 'patch', 'zone', 'hill')
+        self.assertTrue( patchID == self.patch[21, 15] )
+        self.assertTrue( zoneID == 3 )
+        self.assertTrue( hillID == 2 )
+
+    def testGetFQPatchIDOutsideWindow(self):
+        coordinate = rhessystypes.getCoordinatePair(349100.0, 4350500.0)
+        self.assertRaises(ValueError, self.grassdatalookup.getFQPatchIDForCoordinates, \
+                          coordinate, 'patch', 'zone', 'hill')
+
+    def testGetFQPatchIDsForCoordinates(self):
+        coordinates = [ rhessystypes.getCoordinatePair(349210.0, 4350500.0), \
+                        rhessystypes.getCoordinatePair(349100.0, 4350500.0), \
+                        rhessystypes.getCoordinatePair(349135.0, 4350600.0), \
+                        rhessystypes.getCoordinatePair(349282.0, 4350406.0) ]
+        fqPatchIDs = self.grassdatalookup.getFQPatchIDsForCoordinates(coordinates, 'patch', 'zone', 'hill')
+        self.assertTrue( fqPatchIDs[1] is None )
+        for (coordinate, fqPatchID) in zip(coordinates, fqPatchIDs):
+            if fqPatchID is not None:
+                self.assertTrue( fqPatchID == self.grassdatalookup.getFQPatchIDForCoordinates( \
+                                     coordinate, 'patch', 'zone', 'hill') )
+
+    def testReadCellsByRow(self):
+        rows = [21, 0, 21, 39]
+        cols = [15, 0, 3, 29]
+        # The generic implementation reads row by row; arrays index directly
+        values = RasterBackend.readCells(self.backend, 'patch', rows, cols)
+        self.assertTrue( values.tolist() == [ self.patch[r, c] for (r, c) in zip(rows, cols) ] )
+        self.assertTrue( np.array_equal(values, self.backend.readCells('patch', rows, cols)) )
+
+    def testCachedArrayBackendFollowsStamp(self):
+        cached = getCachedArrayBackend(self.backend, ['patch', 'zone'], self.tmpDir, '1')
+        self.assertTrue( getCachedArrayBackend(self.backend, ['patch', 'zone'], self.tmpDir, '1') is cached )
+        self.assertTrue( np.array_equal(cached.readRows('zone', 0, 40), self.zone) )
+        
+        self.zone[:] = 7
+        updated = getCachedArrayBackend(self.backend, ['patch', 'zone'], self.tmpDir, '2')
+        self.assertTrue( updated is not cached )
+        self.assertTrue( updated.readCell('zone', 3, 3) == 7 )
+        self.assertTrue( len(os.listdir(self.tmpDir)) == 1 )
+
+    def testExportedArraysMatch(self):
+        exportRastersAsArrays(self.backend, ['patch', 'zone', 'hill'], self.tmpDir, blockRows=16)
+        exported = ArrayRasterBackend.fromDirectory(self.tmpDir)
+        self.assertTrue( exported.getWindow() == self.window )
+        lookup = GrassDataLookup(backend=exported)
+        fqPatchIDs = [ rhessystypes.FQPatchID(patchID=17, zoneID=1, hillID=1) ]
+        self.assertTrue( lookup.getCoordinatesForFQPatchIDs(fqPatchIDs, 'patch', 'zone', 'hill') == \
+                         self.grassdatalookup.getCoordinatesForFQPatchIDs(fqPatchIDs, 'patch', 'zone', 'hill') )
+
+    def testNullCells(self):
+        self.patch[1, 0] = CELL_NULL
+        coordinate = rhessystypes.getCoordinatePair(349135.0, 4350600.0)
+        self.assertTrue( self.grassdatalookup.getFQPatchIDForCoordinates(coordinate, 'patch', 'zone', 'hill') is None )
+        fqPatchIDs = self.grassdatalookup.getFQPatchIDsForCoordinates( \
+            [ coordinate, rhessystypes.getCoordinatePair(349210.0, 4350500.0) ], 'patch', 'zone', 'hill')
+        self.assertTrue( fqPatchIDs[0] is None )
+        self.assertTrue( fqPatchIDs[1] is not None )
+
+    def testNullMask(self):
+        self.assertTrue( getNullMask(np.array([1, CELL_NULL, 0], dtype=np.int32)).tolist() == [False, True, False] )
+        self.assertTrue( getNullMask(np.array([1.0, np.nan, 0.0])).tolist() == [False, True, False] )
+        self.assertTrue( getNullMask(np.array([1, CELL_NULL, 0], dtype=np.int32), NODATA).tolist() == [False, True, True] )
+
+
+@skipIf(not HAVE_GDAL, "GDAL Python bindings not available")
+class TestGDALRasterBackend(TestCase):
+
+    def setUp(self):
+        # The grid of TestArrayRasterBackend, with a few cells left null in each
+        # map: GRASS nulls in the arrays, nodata in the GeoTIFFs
+        self.window = getRasterWindow(north=4350605.0, south=4350405.0, \
+                                      east=349283.0, west=349133.0, rows=40, cols=30)
+        rows, cols = np.indices((40, 30))
+        maps = { 'patch' : ((rows // 2) * 15 + (cols // 2) + 1).astype(np.int32),
+                 'zone' : (rows // 10 + 1).astype(np.int32),
+                 'hill' : np.where(cols < 15, 1, 2).astype(np.int32) }
+        self.nulls = [ (1, 0), (20, 15), (39, 29) ]
+        self.tmpDir = tempfile.mkdtemp()
+        driver = gdal.GetDriverByName('GTiff')
+        for (i, (name, values)) in enumerate(sorted(maps.items())):
+            (row, col) = self.nulls[i]
+            values[row, col] = NODATA
+            dataset = driver.Create(os.path.join(self.tmpDir, name + '.tif'), 30, 40, 1, gdal.GDT_Int32)
+            dataset.SetGeoTransform( (self.window.west, self.window.ewres, 0, self.window.north, 0, -self.window.nsres) )
+            band = dataset.GetRasterBand(1)
+            band.SetNoDataValue(NODATA)
+            band.WriteArray(values)
+            dataset = None
+            values[row, col] = CELL_NULL
+        self.arrayLookup = GrassDataLookup(backend=ArrayRasterBackend(self.window, maps))
+        self.gdalLookup = GrassDataLookup(backend=GDALRasterBackend(self.tmpDir))
+
+    def tearDown(self):
+        self.gdalLookup.backend.close()
+        rmtree(self.tmpDir)
+
+    def testWindow(self):
+        window = self.gdalLookup.backend.getWindow()
+        for (a, b) in zip(window, self.window):
+            self.assertTrue( abs(a - b) < ZERO )
+
+    def testReadRowsMatch(self):
+        for name in ('patch', 'zone', 'hill'):
+            self.assertTrue( np.array_equal(self.gdalLookup.backend.readRows(name, 0, 40), \
+                                            self.arrayLookup.backend.readRows(name, 0, 40)) )
+
+    def testLookupsMatch(self):
+        coordinates = [ rhessystypes.getCoordinatePair(self.window.west + (c + 0.5) * self.window.ewres, \
+                                                        self.window.north - (r + 0.5) * self.window.nsres) \
+                        for (r, c) in self.nulls + [ (0, 0), (21, 15), (39, 0) ] ]
+        fqPatchIDs = self.gdalLookup.getFQPatchIDsForCoordinates(coordinates, 'patch', 'zone', 'hill')
+        self.assertTrue( fqPatchIDs == self.arrayLookup.getFQPatchIDsForCoordinates(coordinates, 'patch', 'zone', 'hill') )
+        self.assertTrue( fqPatchIDs[:3] == [None, None, None] )
+        for (coordinate, fqPatchID) in zip(coordinates, fqPatchIDs):
+            self.assertTrue( self.gdalLookup.getFQPatchIDForCoordinates(coordinate, 'patch', 'zone', 'hill') == fqPatchID )
+            self.assertTrue( self.arrayLookup.getFQPatchIDForCoordinates(coordinate, 'patch', 'zone', 'hill') == fqPatchID )
+
+        found = [ f for f in fqPatchIDs if f is not None ]
+        self.assertTrue( self.gdalLookup.getCoordinatesForFQPatchIDs(found, 'patch', 'zone', 'hill') == \
+                         self.arrayLookup.getCoordinatesForFQPatchIDs(found, 'patch', 'zone', 'hill') )
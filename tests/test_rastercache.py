@@ -0,0 +1,173 @@
+"""@package tests.test_rastercache
+
+@brief Test methods for rhessysweb.rastercache
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_rastercache
+@endcode
+
+@note Uses a temporary directory; does not require GRASS or GDAL.
+"""
+import os
+import fcntl
+import tempfile
+import threading
+from shutil import rmtree
+from unittest import TestCase
+
+from rastercache import RasterCache
+from rastercache import getCacheKey
+
+## Unit tests
+class TestRasterCache(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cache = RasterCache(os.path.join(self.tmpDir, 'rasters'), maxBytes=250, minAge=0)
+        self.builds = 0
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def _builder(self, size):
+        def build(path):
+            self.builds += 1
+            with open(path, 'w') as f:
+                f.write('x' * size)
+        return build
+
+    def testKeyDependsOnContent(self):
+        key = getCacheKey('dr5', 'patch_5m', 100.0, 'basin_dr5', 50.0, 'UInt16', 'EPSG:3857')
+        self.assertTrue(key == getCacheKey('dr5', 'patch_5m', 100.0, 'basin_dr5', 50.0, 'UInt16', 'EPSG:3857'))
+        self.assertTrue(key != getCacheKey('dr5', 'patch_5m', 101.0, 'basin_dr5', 50.0, 'UInt16', 'EPSG:3857'))
+        self.assertTrue(key != getCacheKey('dr5', 'patch_5m', 100.0, None, None, 'UInt16', 'EPSG:3857'))
+        self.assertTrue(key != getCacheKey('dr5', 'patch_5m', 100.0, 'basin_dr5', 50.0, 'UInt16', 'EPSG:4326'))
+
+    def testGetAfterPut(self):
+        key = getCacheKey('patch_5m', 1.0)
+        self.assertTrue(self.cache.get(key) is None)
+        path = self.cache.put(key, self._builder(100))
+        self.assertTrue(self.cache.get(key) == path)
+        self.assertTrue(os.path.getsize(path) == 100)
+        # Only the entry itself is left in the cache directory
+        self.assertTrue(os.listdir(self.cache.root) == [os.path.basename(path)])
+
+    def testFailedBuildLeavesNoEntry(self):
+        key = getCacheKey('patch_5m', 1.0)
+        def fail(path):
+            raise IOError("export failed")
+        self.assertRaises(IOError, self.cache.put, key, fail)
+        self.assertTrue(self.cache.get(key) is None)
+        self.assertTrue(os.listdir(self.cache.root) == [])
+
+    def testEvictsLeastRecentlyUsed(self):
+        keys = [getCacheKey('raster', i) for i in range(3)]
+        paths = [self.cache.put(key, self._builder(100)) for key in keys[:2]]
+        # Make the first entry the most recently used
+        os.utime(paths[0], (1000, 1000))
+        os.utime(paths[1], (500, 500))
+        self.cache.get(keys[0])
+        self.cache.put(keys[2], self._builder(100))
+        self.assertTrue(self.cache.get(keys[0]) is not None)
+        self.assertTrue(self.cache.get(keys[1]) is None)
+        self.assertTrue(self.cache.get(keys[2]) is not None)
+
+    def testKeepsOversizedNewEntry(self):
+        key = getCacheKey('dem', 1.0)
+        path = self.cache.put(key, self._builder(1000))
+        self.assertTrue(os.path.exists(path))
+
+    def testSingleFlight(self):
+        key = getCacheKey('patch_5m', 1.0)
+        started = threading.Event()
+        release = threading.Event()
+        def slowBuild(path):
+            started.set()
+            release.wait(5)
+            self._builder(100)(path)
+
+        results = []
+        builder = threading.Thread(target=lambda: results.append(self.cache.getOrCreate(key, slowBuild)))
+        builder.start()
+        started.wait(5)
+        # A non-blocking caller sees the build in flight rather than starting another
+        self.assertTrue(self.cache.isBuilding(key))
+        self.assertTrue(self.cache.getOrCreate(key, self._builder(100), blocking=False) is None)
+        waiter = threading.Thread(target=lambda: results.append(self.cache.getOrCreate(key, self._builder(100))))
+        waiter.start()
+        release.set()
+        builder.join()
+        waiter.join()
+
+        self.assertTrue(self.builds == 1)
+        self.assertTrue(len(results) == 2 and results[0] == results[1])
+        self.assertTrue(not self.cache.isBuilding(key))
+        # The build lock is gone once the entry is in place
+        self.assertTrue(os.listdir(self.cache.root) == [os.path.basename(results[0])])
+
+    def testFailedBuildLeavesNoLock(self):
+        key = getCacheKey('patch_5m', 1.0)
+        def fail(path):
+            raise IOError("export failed")
+        self.assertRaises(IOError, self.cache.getOrCreate, key, fail)
+        self.assertTrue(os.listdir(self.cache.root) == [])
+        self.assertTrue(not self.cache.isBuilding(key))
+
+    def testStaleLocksRemoved(self):
+        key = getCacheKey('patch_5m', 1.0)
+        open(self.cache.lockPath(key), 'w').close()
+        self.cache.evict()
+        self.assertTrue(os.listdir(self.cache.root) == [])
+
+    def testRecentlyUsedNotEvicted(self):
+        self.cache.minAge = 3600
+        keys = [getCacheKey('raster', i) for i in range(3)]
+        paths = [self.cache.put(key, self._builder(100)) for key in keys]
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+        # Once old enough, entries go least recently used first
+        os.utime(paths[0], (1000, 1000))
+        self.cache.evict()
+        self.assertTrue(not os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]) and os.path.exists(paths[2]))
+
+    def testEntryBeingReadNotEvicted(self):
+        keys = [getCacheKey('raster', i) for i in range(3)]
+        self.cache.maxBytes = 300
+        paths = [self.cache.put(key, self._builder(100)) for key in keys]
+        self.cache.maxBytes = 250
+        os.utime(paths[0], (1000, 1000))
+        with open(paths[0], 'r') as reader:
+            fcntl.flock(reader, fcntl.LOCK_SH)
+            self.cache.evict()
+        # The next least recently used entry goes instead
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertTrue(len(self.cache.entries()) == 2)
@@ -0,0 +1,131 @@
+"""@package tests.test_rasterstack
+
+@brief Test methods for rhessysweb.rasterstack
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_rasterstack
+@endcode
+
+@note Uses a synthetic mapset directory; does not require GRASS.
+"""
+import os
+import time
+import tempfile
+from shutil import rmtree
+from unittest import TestCase
+
+import numpy as np
+
+from rasterbackend import ArrayRasterBackend
+from rasterbackend import getRasterWindow
+from rasterstack import RasterStack
+
+## Unit tests
+class TestRasterStack(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.mapsetPath = os.path.join(self.tmpDir, 'GRASSData', 'DR5_5m', 'taehee')
+        self.permanentPath = os.path.join(self.tmpDir, 'GRASSData', 'DR5_5m', 'PERMANENT')
+        os.makedirs(os.path.join(self.mapsetPath, 'cellhd'))
+        os.makedirs(os.path.join(self.permanentPath, 'cellhd'))
+        open(os.path.join(self.mapsetPath, 'WIND'), 'w').close()
+        
+        window = getRasterWindow(north=100.0, south=0.0, east=50.0, west=0.0, rows=20, cols=10)
+        self.arrays = { 'elev' : np.linspace(0, 1, 200).reshape((20, 10)).astype(np.float32), \
+                        'lulc' : np.arange(200, dtype=np.int32).reshape((20, 10)) }
+        self.arrays['elev'][0, 0] = np.nan
+        self.arrays['lulc'][19, 9] = np.iinfo(np.int32).min
+        for name in self.arrays:
+            self.touch(name)
+        # PERMANENT has its own elev, which the mapset's hides from unqualified lookups
+        self.permanent = { 'elev' : np.zeros((20, 10), dtype=np.float32), \
+                           'soils' : np.ones((20, 10), dtype=np.int32) }
+        for name in self.permanent:
+            self.touch(name, mapsetPath=self.permanentPath)
+        arrays = dict( ('%s@taehee' % (name,), a) for (name, a) in self.arrays.items() )
+        arrays.update( ('%s@PERMANENT' % (name,), a) for (name, a) in self.permanent.items() )
+        self.source = ArrayRasterBackend(window, arrays)
+        self.stack = RasterStack(os.path.join(self.tmpDir, 'GRASSData'), 'DR5_5m', 'taehee', \
+                                 os.path.join(self.tmpDir, 'cache'), self.source, checkInterval=0)
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def touch(self, name, mtime=None, mapsetPath=None):
+        path = os.path.join(mapsetPath or self.mapsetPath, 'cellhd', name)
+        open(path, 'w').close()
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def testQuery(self):
+        values = self.stack.query(27.5, 72.5)
+        self.assertTrue( values.keys() == ['elev@taehee', 'lulc@taehee', 'elev@PERMANENT', 'soils@PERMANENT'] )
+        self.assertTrue( values['lulc@taehee'] == 55 )
+        self.assertTrue( abs(values['elev@taehee'] - self.arrays['elev'][5, 5]) < 1e-6 )
+        self.assertTrue( values['elev@PERMANENT'] == 0 )
+        self.assertTrue( values['soils@PERMANENT'] == 1 )
+
+    def testQueryNullAndOutside(self):
+        self.assertTrue( self.stack.query(2.5, 97.5)['elev@taehee'] is None )
+        self.assertTrue( self.stack.query(47.5, 2.5)['lulc@taehee'] is None )
+        self.assertTrue( self.stack.query(60.0, 50.0).values() == [None, None, None, None] )
+
+    def testQueryMany(self):
+        values = self.stack.queryMany([2.5, 7.5, 47.5], [92.5, 92.5, 2.5])
+        self.assertTrue( values['lulc@taehee'].tolist() == [10, 11, None] )
+
+    def testReexportOnStampChange(self):
+        self.assertTrue( self.stack.query(2.5, 92.5)['lulc@taehee'] == 10 )
+        self.arrays['lulc'][1, 0] = 999
+        self.touch('lulc', time.time() + 10)
+        self.assertTrue( self.stack.query(2.5, 92.5)['lulc@taehee'] == 999 )
+        self.assertTrue( len([f for f in os.listdir(self.stack.cacheDir) if f.startswith('lulc@taehee@')]) == 1 )
+
+    def testRemovedRaster(self):
+        self.assertTrue( self.stack.names == ['elev@taehee', 'lulc@taehee', 'elev@PERMANENT', 'soils@PERMANENT'] )
+        os.unlink(os.path.join(self.mapsetPath, 'cellhd', 'elev'))
+        self.assertTrue( self.stack.names == ['lulc@taehee', 'elev@PERMANENT', 'soils@PERMANENT'] )
+
+    def testSourceCalledPerExport(self):
+        calls = []
+        def source():
+            calls.append(1)
+            return self.source
+        stack = RasterStack(os.path.join(self.tmpDir, 'GRASSData'), 'DR5_5m', 'taehee', \
+                            os.path.join(self.tmpDir, 'cache2'), source, checkInterval=0)
+        self.assertTrue( stack.query(2.5, 92.5)['lulc@taehee'] == 10 )
+        self.assertTrue( len(calls) > 1 )
+        # Nothing to export, so no backend is asked for
+        del calls[:]
+        stack.refresh(force=True)
+        self.assertTrue( calls == [] )
@@ -0,0 +1,124 @@
+"""@package tests.test_statestore
+
+@brief Test methods for rhessysweb.statestore
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_statestore
+@endcode
+"""
+import os
+import tempfile
+from shutil import rmtree
+from unittest import TestCase
+
+import numpy as np
+
+from statestore import StateColumnWriter, StateColumns, getStateDirectory
+
+## Unit tests
+class TestStateStore(TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.directory = getStateDirectory(self.tmpDir, 1, 'patch')
+
+    def tearDown(self):
+        rmtree(self.tmpDir)
+
+    def _write(self, rows, batchSize=2):
+        writer = StateColumnWriter(self.directory, batchSize)
+        for row in rows:
+            writer.append(*row)
+        writer.close()
+        return StateColumns(self.directory)
+
+    def testReadWrite(self):
+        rows = [ (10 + i, 100 + i, [('sat_deficit', str(0.1 * i)), ('rz_storage', str(i))]) for i in range(5) ]
+        columns = self._write(rows)
+        self.assertTrue(columns.count == 5)
+        self.assertTrue(columns.names() == ['sat_deficit', 'rz_storage'])
+        self.assertTrue(list(columns.ids) == [10, 11, 12, 13, 14])
+
+        values = columns.read(['rhessys_id', 'rz_storage'])
+        self.assertTrue(list(values.keys()) == ['rhessys_id', 'rz_storage'])
+        self.assertTrue(values['rhessys_id'].tolist() == [100, 101, 102, 103, 104])
+        self.assertTrue(values['rz_storage'].dtype == np.float64)
+
+        values = columns.read(['sat_deficit'], ids=[14, 11])
+        self.assertTrue(np.allclose(values['sat_deficit'], [0.4, 0.1]))
+        self.assertRaises(KeyError, columns.read, ['sat_deficit'], [12, 99])
+        self.assertRaises(KeyError, columns.read, ['missing'])
+
+    def testMissingAndRepeated(self):
+        rows = [ (1, 1, [('x', '1.0')]),
+                 (2, 2, [('x', '2.0')]),
+                 (3, 3, [('x', '3.0'), ('base_station_ID', '101'), ('base_station_ID', '102')]),
+                 (4, 4, [('x', 'abc')]) ]
+        columns = self._write(rows)
+        self.assertTrue(columns.names() == ['x', 'base_station_ID', 'base_station_ID#2'])
+        values = columns.read(columns.names())
+        self.assertTrue(np.isnan(values['x'][3]))
+        self.assertTrue(np.isnan(values['base_station_ID'][[0, 1, 3]]).all())
+        self.assertTrue(values['base_station_ID'][2] == 101)
+        self.assertTrue(values['base_station_ID#2'][2] == 102)
+
+    def testOrder(self):
+        writer = StateColumnWriter(self.directory)
+        writer.append(5, 1, [])
+        self.assertRaises(ValueError, writer.append, 5, 2, [])
+        writer.abort()
+        self.assertTrue(os.listdir(os.path.dirname(self.directory)) == [])
+
+    def testReplace(self):
+        self._write([ (1, 1, [('x', '1.0')]) ])
+        columns = self._write([ (2, 1, [('y', '2.0')]) ])
+        self.assertTrue(columns.names() == ['y'])
+        self.assertTrue(len(os.listdir(os.path.dirname(self.directory))) == 1)
+
+    def testEmpty(self):
+        columns = self._write([])
+        self.assertTrue(columns.count == 0)
+        self.assertRaises(KeyError, columns.getIndices, [1])
+
+    def testPublishAfterFinish(self):
+        writer = StateColumnWriter(self.directory)
+        writer.append(1, 1, [('x', '1.0')])
+        writer.finish()
+        # Not visible until published
+        self.assertTrue(not os.path.exists(self.directory))
+        writer.publish()
+        self.assertTrue(StateColumns(self.directory).names() == ['x'])
+        # Aborting after finish leaves nothing behind
+        writer = StateColumnWriter(self.directory)
+        writer.finish()
+        writer.abort()
+        self.assertTrue(os.listdir(os.path.dirname(self.directory)) == ['patch'])
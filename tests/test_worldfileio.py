@@ -0,0 +1,98 @@
+"""@package tests.test_worldfileio
+
+@brief Test methods for rhessysweb.worldfileio
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Usage:
+@code
+python -m unittest test_worldfileio
+@endcode
+"""
+from StringIO import StringIO
+from unittest import TestCase
+
+from worldfileio import iterWorldfile, getBlockVar
+from worldfileio import LEVEL_WORLD, LEVEL_BASIN, LEVEL_HILLSLOPE, LEVEL_ZONE, LEVEL_PATCH, LEVEL_STRATUM
+
+def _patch(patchID, strata):
+    lines = [ '%d\tpatch_ID' % (patchID,), '349140.0\tx', '4350600.0\ty', '250.5\tz',
+              '0.35\tsat_deficit', '0\tn_basestations', '%d\tnum_canopy_strata' % (len(strata),) ]
+    for stratumID in strata:
+        lines += [ '%d\tcanopy_strata_ID' % (stratumID,), '2.5\tcs.pai', '0\tn_basestations' ]
+    return lines
+
+WORLDFILE = '\n'.join( [
+    '1\tworld_id', '1\tnum_basins',
+    '  1\tbasin_ID', '349000.0\tx', '4350000.0\ty', '200.0\tz', '1\tn_basestations', '101\tbase_station_ID',
+    '  1\tnum_hillslopes',
+    '    67\thillslope_ID', '349100.0\tx', '4350500.0\ty', '220.0\tz', '1\tnum_zones',
+    '      67\tzone_ID', '349100.0\tx', '4350500.0\ty', '220.0\tz', '2\tnum_patches' ] +
+    _patch(101, [1011, 1012]) + _patch(102, [1021]) ) + '\n'
+
+## Unit tests
+class TestWorldfileIO(TestCase):
+
+    def testIterWorldfile(self):
+        blocks = list(iterWorldfile(StringIO(WORLDFILE)))
+        self.assertTrue([b.level for b in blocks] == [LEVEL_WORLD, LEVEL_BASIN, LEVEL_HILLSLOPE, LEVEL_ZONE,
+                                                      LEVEL_PATCH, LEVEL_STRATUM, LEVEL_STRATUM,
+                                                      LEVEL_PATCH, LEVEL_STRATUM])
+        self.assertTrue([b.rhessysID for b in blocks] == [1, 1, 67, 67, 101, 1011, 1012, 102, 1021])
+
+        basin = blocks[1]
+        self.assertTrue(basin.parentIDs == (1,))
+        self.assertTrue(getBlockVar(basin, 'x') == '349000.0')
+        self.assertTrue(getBlockVar(basin, 'base_station_ID') == '101')
+        self.assertTrue(getBlockVar(basin, 'missing', 'none') == 'none')
+
+        patch = blocks[7]
+        self.assertTrue(patch.parentIDs == (1, 1, 67, 67))
+        self.assertTrue(patch.lineNumber == 33)
+        self.assertTrue(patch.vars[0] == ('x', '349140.0'))
+        self.assertTrue(getBlockVar(patch, 'num_canopy_strata') == '1')
+
+        stratum = blocks[-1]
+        self.assertTrue(stratum.parentIDs == (1, 1, 67, 67, 102))
+        self.assertTrue(stratum.vars == [('cs.pai', '2.5'), ('n_basestations', '0')])
+
+    def testIterWorldfileStreams(self):
+        # Blocks are produced before the rest of the file is read
+        blocks = iterWorldfile(StringIO(WORLDFILE.replace('1\tnum_zones', '1\tnum_zones\nbad')))
+        self.assertTrue(next(blocks).level == LEVEL_WORLD)
+        self.assertTrue(next(blocks).level == LEVEL_BASIN)
+        self.assertRaises(ValueError, next, blocks)
+
+    def testWrongCount(self):
+        worldfile = WORLDFILE.replace('2\tnum_patches', '3\tnum_patches')
+        self.assertRaises(ValueError, list, iterWorldfile(StringIO(worldfile)))
+
+    def testOrphanBlock(self):
+        worldfile = WORLDFILE.replace('      67\tzone_ID', '      67\tnot_a_zone')
+        self.assertRaises(ValueError, list, iterWorldfile(StringIO(worldfile)))
@@ -2,11 +2,22 @@ import json
 from uuid import uuid4
 from rhessystypes import FQPatchID
 import flowtableio
-import redis
+import flowtablestore
+import os
+import hashlib
 from collections import OrderedDict
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, Http404
 import cPickle
-from mezzanine.pages.models import Page
+from RHESSysWeb.drivercache import get_driver
+from RHESSysWeb import rollups
+from RHESSysWeb import flowgraph
+from RHESSysWeb.models import FlowEntry
+from pointcache import getPointCache
+import metrics
+from jobexecutor import getJobStatus, PENDING, DONE, FAILED, CANCELLED
+from RHESSysWeb import tasks
+from celery.result import AsyncResult
 
 def cache_patches_in_session(request, *args, **kwargs):
     flowtable = request.POST['flowtable']
@@ -27,39 +38,216 @@ def cache_patches_in_session(request, *args, **kwargs):
     if flowtable not in request.session:
         request.session[flowtable] = {}
     request.session[flowtable][fqpatch] = receivers
+    # Cached point queries for the patch no longer reflect the edit
+    getPointCache().invalidate(flowtable, fqpatch)
     return HttpResponse()
 
 
+def _edited_entry(flowtable, fqpatch, receivers):
+    """Flow table items of a patch with the receivers edited in the session.  If the
+    edit does not start with the patch's own entry, the stored one is used."""
+    items = flowtableio.loadReceivers(json.dumps(receivers))
+    if items and isinstance(items[0], flowtableio.FlowTableEntry):
+        return items
+    entry = flowtablestore.getEntry(flowtable, fqpatch)[0]
+    num_adjacent = len([i for i in items if isinstance(i, flowtableio.FlowTableEntryReceiver)])
+    return [entry._replace(numAdjacent=num_adjacent)] + items
+
 def save_flowtable(request, *args, **kwargs):
-    flowtable = redis.Redis(db=15)
+    """Download the flow table with the session's edits applied, or with
+    format=patch only the edited entries, as a patch for
+    flowtableio.applyFlowtablePatch."""
     flowtable_name = request.GET['flowtable']
     flowtable_new = "/tmp/" + uuid4().hex # request.POST['new_table']
-    hashtable = flowtable_name + ".hash"
-    N = flowtable.llen(flowtable_name)
-    outflow = OrderedDict()
-    for entry in flowtable.lrange(flowtable_name, 0, N):
-        fqpatch = cPickle.loads(entry)
+    edits = request.session.get(flowtable_name, {})
 
-        if flowtable_name in request.session and fqpatch in request.session[flowtable_name]:
-            outflow[fqpatch] = flowtableio.loadReceivers(request.session[flowtable_name])
+    if request.GET.get('format') == 'patch':
+        changed = OrderedDict(
+            (fqpatch, _edited_entry(flowtable_name, fqpatch, receivers)) for fqpatch, receivers in sorted(edits.items())
+        )
+        flowtableio.writeFlowtablePatch(changed, flowtable_new,
+            base=flowtable_name, baseVersion=flowtablestore.getFlowtableVersion(flowtable_name))
+        rsp = HttpResponse(open(flowtable_new), mimetype='application/octet-stream')
+        rsp['Content-Disposition'] = 'filename="flowtable.patch"'
+        return rsp
+
+    outflow = OrderedDict()
+    for fqpatch, entry in flowtablestore.listPatches(flowtable_name):
+        if fqpatch in edits:
+            outflow[fqpatch] = _edited_entry(flowtable_name, fqpatch, edits[fqpatch])
         else:
-            outflow[fqpatch] = flowtableio.loadReceivers(flowtable.hget(hashtable, entry))
+            outflow[fqpatch] = flowtableio.loadReceivers(flowtablestore.getEntryJSON(flowtable_name, entry))
 
     flowtableio.writeFlowtable(outflow, flowtable_new)
     rsp = HttpResponse(open(flowtable_new), mimetype='application/octet-stream')
     rsp['Content-Disposition'] = 'filename="flowtable.txt"'
     return rsp
 
+def get_rollups(request, *args, **kwargs):
+    """Patch count, area and mean elevation of the basin, hillslopes (level=hillslope)
+    or zones (level=zone) of a resource's flow table."""
+    env = get_driver(request.GET['slug']).env
+    flowtable = env.flow_table.name
+    rsp = [dict(level=r.level, hillId=r.hill_id, zoneId=r.zone_id, patchCount=r.patch_count, area=r.area,
+                zMean=r.z_mean, zAreaMean=r.z_area_mean)
+           for r in rollups.get_rollups(flowtable, os.path.join(settings.MEDIA_ROOT, flowtable), request.GET.get('level'))]
+    return HttpResponse(json.dumps(rsp), mimetype='application/json')
+
+def get_flow_path(request, *args, **kwargs):
+    """Patches downstream (or with direction=upstream, upstream) of a patch,
+    following at most depth edges if given, from the flow graph of the
+    resource's flow table (see flowgraph.load_flowtable).  The graph is reloaded
+    first if the flow table changed; 409 if it was reloaded again while read."""
+    env = get_driver(request.GET['slug']).env
+    flowtable = env.flow_table.name
+    fqpatch = FQPatchID(int(request.GET['patch']), int(request.GET['zone']), int(request.GET['hill']))
+    depth = int(request.GET['depth']) if request.GET.get('depth') else None
+    version = flowgraph.ensure_flowtable(flowtable, os.path.join(settings.MEDIA_ROOT, flowtable))
+    try:
+        entry_id = flowgraph.get_entry_id(flowtable, fqpatch)
+    except FlowEntry.DoesNotExist:
+        raise Http404
+    if request.GET.get('direction') == 'upstream':
+        entry_ids = flowgraph.upstream([entry_id], depth)
+    else:
+        entry_ids = flowgraph.downstream([entry_id], depth)
+    entries = list(FlowEntry.objects.filter(id__in=entry_ids.tolist()) \
+        .values_list('rhessys_patch_id', 'rhessys_zone_id', 'rhessys_hill_id'))
+    loaded = flowgraph.get_loaded_version(flowtable)
+    if loaded != version:
+        return HttpResponse(json.dumps(dict(version=loaded)), mimetype='application/json', status=409)
+    rsp = [dict(patchId=patch, zoneId=zone, hillId=hill) for patch, zone, hill in entries]
+    return HttpResponse(json.dumps(rsp), mimetype='application/json')
+
+def get_receivers(request, *args, **kwargs):
+    """A patch's flow table entry and receivers, as stored (see
+    flowtableio.dumpReceivers), with the user's unsaved edit of its receivers
+    if any.  The ETag covers the table version and the edit, so clients can
+    revalidate without the entry being read."""
+    driver = get_driver(request.GET['slug'])
+    flowtable = driver.env.flow_table.name
+    fqpatch = FQPatchID(int(request.GET['patch']), int(request.GET['zone']), int(request.GET['hill']))
+    edit = request.session.get(flowtable, {}).get(fqpatch)
+
+    etag = '"%s"' % hashlib.sha1(cPickle.dumps(
+        (flowtable, driver.flowtable_version(), fqpatch, json.dumps(edit, sort_keys=True))
+    )).hexdigest()
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        rsp = HttpResponseNotModified()
+    else:
+        entry = flowtablestore.getEntryJSON(flowtable, fqpatch)
+        if entry is None:
+            raise Http404
+        rsp = HttpResponse('{"entry": %s, "edit": %s}' % (entry, json.dumps(edit)), mimetype='application/json')
+    rsp['ETag'] = etag
+    rsp['Cache-Control'] = 'private, no-cache'
+    return rsp
+
 def revert_flowtable(request, *args, **kwargs):
     flowtable = request.POST['flowtable']
     del request.session[flowtable]
     return HttpResponse()
 
+def _profile(request):
+    """Whether the request asks for its driver calls to be profiled (profile=1,
+    staff only); see drivercache.ProfiledDriver."""
+    return bool(request.GET.get('profile')) and request.user.is_staff
+
 def get_patch(request, *args, **kwargs):
     wherex = float(request.GET['x'])
     wherey = float(request.GET['y'])
     srs = request.GET['srs']
     from_table = request.GET['slug']
-    p = Page.objects.get(slug=from_table)
-    patch, hillslope, zone = p.dataresource.driver_instance.get_fqpatch(srs, wherex, wherey)
-    return HttpResponse(json.dumps(dict(patchId=patch, hillId=hillslope, zoneId=zone)), mimetype='application/json')
\ No newline at end of file
+    patch, hillslope, zone = get_driver(from_table, profile=_profile(request)).get_fqpatch(srs, wherex, wherey)
+    return HttpResponse(json.dumps(dict(patchId=patch, hillId=hillslope, zoneId=zone)), mimetype='application/json')
+
+
+def get_patches(request, *args, **kwargs):
+    """Look up many points at once.  POST a JSON object with "slug", "srs" and
+    "points", a list of [x, y] pairs; the response lists one patch per point,
+    null for points outside the region."""
+    query = json.loads(request.body)
+    points = [(float(x), float(y)) for x, y in query['points']]
+    patches = get_driver(query['slug'], profile=_profile(request)).get_fqpatches(query['srs'], points)
+    rsp = []
+    for fqpatch in patches:
+        if fqpatch is None:
+            rsp.append(None)
+        else:
+            patch, hillslope, zone = fqpatch
+            rsp.append(dict(patchId=patch, hillId=hillslope, zoneId=zone))
+    return HttpResponse(json.dumps(rsp), mimetype='application/json')
+
+def get_raster_catalog(request, *args, **kwargs):
+    """The rasters of a resource's mapset and PERMANENT, or with name=raster only
+    that raster, as grasscatalog.RasterInfo."""
+    from_table = request.GET['slug']
+    catalog = get_driver(from_table).catalog
+    if request.GET.get('name'):
+        try:
+            rsp = catalog.get(request.GET['name'])._asdict()
+        except KeyError:
+            raise Http404
+    else:
+        rsp = [info._asdict() for info in catalog.rasters()]
+    return HttpResponse(json.dumps(rsp), mimetype='application/json')
+
+def _accepted(job):
+    """202 and a handle to poll with get_job."""
+    return HttpResponse(json.dumps(dict(job=job.id, status=PENDING)), mimetype='application/json', status=202)
+
+def _interactive_timeout():
+    return getattr(settings, 'RHESSYSWEB_JOB_TIMEOUT', 60)
+
+def get_patch_async(request, *args, **kwargs):
+    wherex = float(request.GET['x'])
+    wherey = float(request.GET['y'])
+    srs = request.GET['srs']
+    job = tasks.get_patch.apply_async((request.GET['slug'], srs, wherex, wherey), dict(profile=_profile(request)),
+        queue=tasks.job_queue(), expires=_interactive_timeout())
+    return _accepted(job)
+
+def get_data_for_point_async(request, *args, **kwargs):
+    wherex = float(request.GET['x'])
+    wherey = float(request.GET['y'])
+    srs = request.GET['srs']
+    options = dict((k, request.GET[k]) for k in ('geometry', 'zoom') if k in request.GET)
+    job = tasks.get_data_for_point.apply_async((request.GET['slug'], wherex, wherey, srs),
+        dict(options, profile=_profile(request)), queue=tasks.job_queue(), expires=_interactive_timeout())
+    return _accepted(job)
+
+def ready_data_resource_async(request, *args, **kwargs):
+    """Start exporting a raster (RASTER, or the environment's default); exports
+    go to their own queue, so they do not hold up interactive jobs."""
+    options = dict(RASTER=request.GET['RASTER']) if 'RASTER' in request.GET else {}
+    job = tasks.ready_data_resource.apply_async((request.GET['slug'],), dict(options, profile=_profile(request)),
+        queue=tasks.export_queue(), expires=getattr(settings, 'RHESSYSWEB_EXPORT_TIMEOUT', 3600))
+    return _accepted(job)
+
+def get_job(request, *args, **kwargs):
+    """A job's result once done, otherwise 202 (or 500 if it failed or was
+    cancelled) with its status.  Job state is kept in Celery's result backend,
+    so any process can answer; unknown jobs are reported as pending."""
+    job = AsyncResult(request.GET['job'])
+    status = getJobStatus(job.state)
+    if status == DONE:
+        return HttpResponse(json.dumps(job.result), mimetype='application/json')
+    rsp = dict(job=job.id, status=status)
+    if status in (FAILED, CANCELLED):
+        rsp['error'] = '%s: %s' % (type(job.result).__name__, job.result) if status == FAILED else 'Job cancelled'
+        return HttpResponse(json.dumps(rsp), mimetype='application/json', status=500)
+    return HttpResponse(json.dumps(rsp), mimetype='application/json', status=202)
+
+def cancel_job(request, *args, **kwargs):
+    """Cancel a job, stopping it if already running."""
+    job = AsyncResult(request.POST['job'])
+    job.revoke(terminate=True)
+    return HttpResponse(json.dumps(dict(job=job.id, status=CANCELLED)), mimetype='application/json')
+
+def get_metrics(request, *args, **kwargs):
+    """Metrics collected by the process serving the request, in the Prometheus
+    text format; 404 unless settings.RHESSYSWEB_METRICS is set.  Other worker
+    processes are not included (see the metrics module)."""
+    if not getattr(settings, 'RHESSYSWEB_METRICS', False):
+        raise Http404
+    return HttpResponse(metrics.renderPrometheus(), content_type='text/plain; version=0.0.4')
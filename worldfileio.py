@@ -0,0 +1,148 @@
+"""@package worldfileio
+
+@brief Streaming reader for RHESSys worldfiles.  A worldfile nests the state of
+        a world's basins, hillslopes, zones, patches and canopy strata, each
+        block opening with its ID line and listing one "value name" state
+        variable per line, then the number of children and the children
+        themselves.  Blocks are read one at a time, parents before their
+        children, so a worldfile of any size is read in constant memory.
+
+This software is provided free of charge under the New BSD License. Please see
+the following license information:
+
+Copyright (c) 2013, University of North Carolina at Chapel Hill
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+    * Redistributions of source code must retain the above copyright
+      notice, this list of conditions and the following disclaimer.
+    * Redistributions in binary form must reproduce the above copyright
+      notice, this list of conditions and the following disclaimer in the
+      documentation and/or other materials provided with the distribution.
+    * Neither the name of the University of North Carolina at Chapel Hill nor the
+      names of its contributors may be used to endorse or promote products
+      derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE UNIVERSITY OF NORTH CAROLINA AT CHAPEL HILL
+BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE
+GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT
+OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+from collections import namedtuple
+
+## Constants
+LEVEL_WORLD = 0
+LEVEL_BASIN = 1
+LEVEL_HILLSLOPE = 2
+LEVEL_ZONE = 3
+LEVEL_PATCH = 4
+LEVEL_STRATUM = 5
+LEVEL_NAMES = ('world', 'basin', 'hillslope', 'zone', 'patch', 'stratum')
+# Names (lower case) of the line opening a block at each level
+ID_NAMES = ('world_id', 'basin_id', 'hillslope_id', 'zone_id', 'patch_id', 'canopy_strata_id')
+# Names of the line declaring the number of children of a block at each level
+COUNT_NAMES = (('num_basins',), ('num_hillslopes',), ('num_zones',), ('num_patches',),
+               ('num_stratum', 'num_canopy_strata'), ())
+ID_LEVELS = dict( (name, level) for level, name in enumerate(ID_NAMES) )
+
+## Type definitions
+WorldfileBlock = namedtuple('WorldfileBlock', ['level', 'rhessysID', 'parentIDs', 'vars', 'lineNumber'], verbose=False)
+
+def getBlockVar(block, name, default=None):
+    """ @brief Get the value of a state variable of a block
+        @param block WorldfileBlock
+        @param name String representing the name of the variable
+        @param default Value to return if the block has no such variable
+        @return String representing the first value of the variable, as written
+    """
+    for (n, value) in block.vars:
+        if n == name:
+            return value
+    return default
+
+def iterWorldfile(worldfile):
+    """ @brief Read a RHESSys worldfile one block at a time
+
+        @param worldfile String representing the absolute path of the worldfile, or
+        an open file
+
+        @return Generator yielding a WorldfileBlock for each world, basin, hillslope,
+        zone, patch and stratum in file order, so every block follows its parent.
+        parentIDs holds the RHESSys IDs of the block's ancestors, world first; vars
+        the (name, value) string pairs of the block's lines other than its ID line,
+        in file order, including the child count and any base station lines.
+
+        @raise ValueError if a block is outside a parent of the level above, or a
+        block has a different number of children than it declares
+    """
+    if isinstance(worldfile, basestring):
+        world = open(worldfile, 'r')
+    else:
+        world = worldfile
+
+    # Open blocks, outermost first: [level, RHESSys ID, declared children, children read]
+    ancestors = []
+    # Block whose variables are being read (always the innermost open block)
+    curr = None
+
+    try:
+        for lineNumber, line in enumerate(world, 1):
+            values = line.split()
+            if not values:
+                continue
+            if len(values) < 2:
+                raise ValueError("Error in worldfile at line %d, expected a value and a name" % (lineNumber,))
+            (value, name) = values[0], values[1]
+
+            level = ID_LEVELS.get(name.lower())
+            if level is None:
+                if curr is None:
+                    raise ValueError("Error in worldfile at line %d, %s outside a block" % (lineNumber, name))
+                curr.vars.append( (name, value) )
+                continue
+
+            if curr is not None:
+                ancestors[-1][2] = _getDeclaredCount(curr)
+                yield curr
+            while ancestors and ancestors[-1][0] >= level:
+                _checkCount(ancestors.pop(), lineNumber)
+            if level != LEVEL_WORLD and (not ancestors or ancestors[-1][0] != level - 1):
+                raise ValueError("Error in worldfile at line %d, %s %s outside a %s" % \
+                                 (lineNumber, LEVEL_NAMES[level], value, LEVEL_NAMES[level - 1]))
+            if ancestors:
+                ancestors[-1][3] += 1
+
+            rhessysID = int(value)
+            curr = WorldfileBlock(level=level, rhessysID=rhessysID,
+                                  parentIDs=tuple(a[1] for a in ancestors), vars=[], lineNumber=lineNumber)
+            ancestors.append( [level, rhessysID, None, 0] )
+
+        if curr is not None:
+            ancestors[-1][2] = _getDeclaredCount(curr)
+            yield curr
+        while ancestors:
+            _checkCount(ancestors.pop(), None)
+    finally:
+        if world is not worldfile:
+            world.close()
+
+def _getDeclaredCount(block):
+    for name in COUNT_NAMES[block.level]:
+        value = getBlockVar(block, name)
+        if value is not None:
+            return int(value)
+    return None
+
+def _checkCount(ancestor, lineNumber):
+    (level, rhessysID, declared, read) = ancestor
+    if declared is not None and declared != read:
+        where = "at line %d" % (lineNumber,) if lineNumber else "at end of file"
+        raise ValueError("Error in worldfile %s, %s %d declares %d %s blocks but has %d" % \
+                         (where, LEVEL_NAMES[level], rhessysID, declared, LEVEL_NAMES[level + 1], read))
@@ -0,0 +1,144 @@
+from django.db import connection, transaction
+from django.contrib.gis.geos import Point
+
+from RHESSysWeb.models import World, Basin, Hillslope, Zone, Patch, Stratum, get_state_root
+from RHESSysWeb.worldfileio import iterWorldfile, getBlockVar, LEVEL_NAMES
+from RHESSysWeb.worldfileio import LEVEL_WORLD, LEVEL_BASIN, LEVEL_HILLSLOPE, LEVEL_ZONE, LEVEL_PATCH
+from RHESSysWeb.statestore import StateColumnWriter, getStateDirectory
+
+DEFAULT_BATCH_SIZE = 5000
+
+LEVEL_MODELS = (World, Basin, Hillslope, Zone, Patch, Stratum)
+
+class IdAllocator(object):
+    """Primary keys reserved from a model's PostgreSQL sequence, so rows can be
+    bulk inserted with their children already pointing at them.  Reserved keys
+    are never handed out by the sequence again, even to concurrent imports.
+    Keys are reserved in chunks doubling up to max_chunk, so small levels (one
+    world, a few basins) do not use up the sequence."""
+
+    def __init__(self, model, max_chunk=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.max_chunk = max_chunk
+        self.chunk = 1
+        self._ids = []
+
+    def allocate(self):
+        if not self._ids:
+            cursor = connection.cursor()
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [self.model._meta.db_table, self.model._meta.pk.column, self.chunk])
+            self._ids = sorted((row[0] for row in cursor.fetchall()), reverse=True)
+            self.chunk = min(self.chunk * 2, self.max_chunk)
+        return self._ids.pop()
+
+class BulkInserter(object):
+    """Rows of one model, inserted batch_size at a time."""
+
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.model.objects.bulk_create(self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+class WorldfileImporter(object):
+    """Insert the blocks of a worldfile, in file order, into the World, Basin,
+    Hillslope, Zone, Patch and Stratum tables, and write their state variables
+    column-wise per level (see World.read_state).  Only the most recent block of
+    each level is remembered, to resolve the parents of the blocks that
+    follow."""
+
+    def __init__(self, name, srid, environment=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.name = name
+        self.srid = srid
+        self.environment = environment
+        self.ids = [IdAllocator(m, batch_size) for m in LEVEL_MODELS]
+        self.inserters = [BulkInserter(m, batch_size) for m in LEVEL_MODELS]
+        self.batch_size = batch_size
+        self.state = None
+        self.current = [None] * len(LEVEL_MODELS)
+        self.world = None
+
+    def point(self, block):
+        x = getBlockVar(block, 'x')
+        y = getBlockVar(block, 'y')
+        if x is None or y is None:
+            raise ValueError("Error in worldfile at line %d, block has no x and y" % (block.lineNumber,))
+        return Point(float(x), float(y), srid=self.srid)
+
+    def add(self, block):
+        level = block.level
+        pk = self.ids[level].allocate()
+        parents = self.current
+        parents[level] = pk
+        for i in xrange(level + 1, len(parents)):
+            parents[i] = None
+
+        if level == LEVEL_WORLD:
+            if self.world is not None:
+                raise ValueError("Error in worldfile at line %d, more than one world" % (block.lineNumber,))
+            row = self.world = World(id=pk, name=self.name, environment=self.environment, rhessys_id=block.rhessysID)
+            self.state = [StateColumnWriter(getStateDirectory(get_state_root(), pk, name), self.batch_size)
+                          for name in LEVEL_NAMES]
+        elif level == LEVEL_BASIN:
+            row = Basin(id=pk, rhessys_id=block.rhessysID, point=self.point(block), world_id=parents[LEVEL_WORLD])
+        elif level == LEVEL_HILLSLOPE:
+            row = Hillslope(id=pk, rhessys_id=block.rhessysID, point=self.point(block), basin_id=parents[LEVEL_BASIN])
+        elif level == LEVEL_ZONE:
+            row = Zone(id=pk, rhessys_id=block.rhessysID, point=self.point(block), hillslope_id=parents[LEVEL_HILLSLOPE])
+        elif level == LEVEL_PATCH:
+            row = Patch(id=pk, rhessys_id=block.rhessysID, point=self.point(block), zone_id=parents[LEVEL_ZONE],
+                hillslope_id=parents[LEVEL_HILLSLOPE], basin_id=parents[LEVEL_BASIN], world_id=parents[LEVEL_WORLD])
+        else:
+            row = Stratum(id=pk, rhessys_id=block.rhessysID, patch_id=parents[LEVEL_PATCH])
+        self.inserters[level].add(row)
+        self.state[level].append(pk, block.rhessysID, block.vars)
+
+    def flush(self):
+        for inserter in self.inserters:
+            inserter.flush()
+        for writer in self.state or []:
+            writer.finish()
+
+    def publish(self):
+        for writer in self.state:
+            writer.publish()
+
+    def abort(self):
+        for writer in self.state or []:
+            writer.abort()
+
+def import_worldfile(worldfile, name, srid, environment=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Load a worldfile (a path or an open file) in one transaction.  Blocks are
+    streamed from the file and inserted batch_size rows at a time; points are
+    read from each block's x and y in the given SRID.  State variables are
+    written under get_state_root().  Requires PostgreSQL.  Returns the World."""
+    importer = WorldfileImporter(name, srid, environment, batch_size)
+    try:
+        with transaction.commit_on_success():
+            for block in iterWorldfile(worldfile):
+                importer.add(block)
+            if importer.world is None:
+                raise ValueError("Worldfile %s has no world" % (name,))
+            importer.flush()
+    except:
+        importer.abort()
+        raise
+    # Readers only see the state once the rows it describes are committed
+    importer.publish()
+    # Refresh planner statistics so queries on the new world use the indexes
+    cursor = connection.cursor()
+    for model in LEVEL_MODELS:
+        cursor.execute('ANALYZE "%s"' % (model._meta.db_table,))
+    return importer.world